@@ -1,48 +1,333 @@
 
 import sys
 import os
-from typing import Optional
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
+from contextlib import asynccontextmanager
+from functools import partial
+import time
+import asyncio
+import secrets
 import pandas as pd
+import pyarrow as pa
 
-from fastapi.responses import RedirectResponse,Response
+from fastapi.responses import ORJSONResponse,RedirectResponse,Response
 
-from src.logging.custom_logging import logger
+from src.logging.custom_logging import logger,request_logger
 from src.utils.other_utils import load_object
 from src.exceptions.custom_exception import CustomException
-from fastapi import FastAPI, HTTPException,Request
+from fastapi import Body, Depends, FastAPI, Header, HTTPException,Query,Request
 from pydantic import BaseModel,Field,field_validator
-from src.inference.request_validation import PredictionRequest,PredictionResponse
-from src.inference.preprocessing import preprocessing,get_top_3_shap_features
+from src.inference.request_validation import (PredictionRequest,PredictionResponse,BatchPredictionResponse,CompactPredictionResponse,
+                                             CompactBatchPredictionResponse,ExplainMode,ResponseFormat,validate_batch)
+from src.inference.serialization import render_response
+from src.inference.preprocessing import preprocessing,get_top_3_shap_features,inference_config
+from src.inference.scoring import score_requests,score_grouped_requests
+from src.inference.micro_batcher import MicroBatcher
+from src.inference.executor import InferenceExecutor,InferenceSaturatedError,init_worker,score_requests_in_worker
+from src.inference.fast_path import FeaturePlan,FastPathScorer
+from src.inference.explainers import NativeTreeExplainer,load_explainer
+from src.inference.cache import PredictionCache
+from src.inference.model_registry import ActiveModel,ModelRegistry,ModelVersionCorrupt,ModelVersionNotFound,ModelRegistryError,ServingModel,warm_up
+from src.inference.scorecard import scorecard
+from src.inference.shadow import ShadowLog,ShadowScorer,compare_periodically
+from src.inference.tree_compiler import CompiledModel
+from src.inference.worker_memory import process_memory
+from src.inference.streaming import (ARROW_STREAM_MEDIA_TYPE,NDJSON_MEDIA_TYPE,ArrowResultEncoder,BodyStream,
+                                     BodyStreamingResponse,arrow_chunks,compact_results,encode_ndjson,ndjson_chunks,ndjson_header,
+                                     pump_body,score_columns,score_rows)
+from src.inference.metrics import (BATCH_SIZE,ERRORS,FAILED_ROWS,REQUEST_SECONDS,REQUESTS,WARM_UP_SECONDS,metrics_payload,
+                                   stage_timer)
 import uvicorn
 import uuid
 
 
-app = FastAPI(title="Credit Risk API", description="API to predict credit risk", version="0.1")
+# Versioned artifacts, see src/inference/model_registry.py. MODEL_VERSION pins a version
+# instead of following the registry's CURRENT.
+registry_config = inference_config['model_registry']
+model_registry = ModelRegistry(os.getenv("MODEL_REGISTRY_PATH", registry_config['path']))
+PINNED_MODEL_VERSION = os.getenv("MODEL_VERSION")
+# Bearer token of the model changing admin endpoints; they are disabled without one
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", inference_config['admin']['token'])
 
+explainer_config = inference_config['explainer']
+fast_path_config = inference_config['fast_path']
 
-MODEL_PATH ="models/xgboost_model.pkl"
-EXPLAINER_PATH = "models/explainer.pkl"
+# Bounded pool running preprocessing, XGBoost and SHAP off the event loop
+executor_config = inference_config['inference_executor']
+inference_executor = InferenceExecutor(kind=os.getenv("INFERENCE_EXECUTOR_KIND", executor_config['kind']),
+                                       max_workers=int(os.getenv("INFERENCE_EXECUTOR_MAX_WORKERS", executor_config['max_workers'])),
+                                       max_queue=int(os.getenv("INFERENCE_EXECUTOR_MAX_QUEUE", executor_config['max_queue'])),
+                                       saturation_policy=os.getenv("INFERENCE_EXECUTOR_SATURATION_POLICY", executor_config['saturation_policy']),
+                                       queue_timeout_s=float(os.getenv("INFERENCE_EXECUTOR_QUEUE_TIMEOUT_S", executor_config['queue_timeout_s'])))
 
-model = load_object(MODEL_PATH)
-explainer = load_object(EXPLAINER_PATH)
+
+def load_serving_model(version: str) -> ServingModel:
+    """Load a registry version and build its scoring functions, with the explainer and fast path parity checks."""
+    manifest = model_registry.manifest(version)
+    if manifest['features'] != inference_config['selected_features']:
+        raise ModelRegistryError(f"Model version {version!r} expects features {manifest['features']}, "
+                                 f"preprocessing produces {inference_config['selected_features']}")
+    model_path = model_registry.artifact_path(version, "model")
+    explainer_path = model_registry.artifact_path(version, "explainer")
+    model = load_object(model_path)
+    if list(model.get_booster().feature_names) != manifest['features']:
+        raise ModelVersionCorrupt(f"Model version {version!r}: model features do not match the manifest")
+
+    explainer_backend = os.getenv("EXPLAINER_BACKEND", explainer_config['backend'])
+    explainer = load_explainer(explainer_backend, model, explainer_path,
+                               parity_check=explainer_config['parity_check'],
+                               tolerance=explainer_config['parity_tolerance'])
+    if not isinstance(explainer, NativeTreeExplainer):
+        explainer_backend = "shap"
+
+    threshold = manifest['threshold']
+    if inference_executor.kind == "process":
+        # Each worker process loads its own copy of the artifacts once
+        batch_score_fn = partial(score_requests_in_worker, artifacts=(model_path, explainer_path, explainer_backend),
+                                 threshold=threshold)
+    else:
+        batch_score_fn = partial(score_requests, model, explainer, threshold=threshold)
+    score_fn = batch_score_fn
+
+    # Pandas-free path for single rows and micro-batches, used only if it matches the pandas path
+    if fast_path_config['enabled'] and inference_executor.kind == "thread":
+        compiled_model = None
+        if os.getenv("FAST_PATH_MODEL_BACKEND", fast_path_config['model_backend']) == "compiled":
+            compiled_model_path = model_registry.artifact_path(version, "compiled_model")
+            if compiled_model_path is None:
+                logger.warning(f"Model version {version} has no compiled model, the fast path uses XGBoost")
+            else:
+                compiled_model = CompiledModel.load(compiled_model_path, mmap=fast_path_config['compiled_model_mmap'])
+        fast_path_scorer = FastPathScorer(FeaturePlan.from_config(inference_config), model, explainer, compiled_model,
+                                          threshold=threshold)
+        try:
+            if fast_path_config['parity_check']:
+                fast_path_scorer.check_parity(model, tolerance=fast_path_config['parity_tolerance'])
+            score_fn = fast_path_scorer.score_requests
+        except ValueError as e:
+            logger.error(f"Fast path disabled for model version {version}: {e}")
+
+    return ServingModel(version, manifest, model, explainer, explainer_backend, batch_score_fn, score_fn)
+
+
+# Synthetic requests scored at startup and before a model swap, see `warm_up`
+warm_up_config = inference_config['warm_up']
+WARM_UP_ENABLED = os.getenv("WARM_UP_ENABLED", str(warm_up_config['enabled'])).lower() in ("1", "true", "yes")
+warm_up_options = {"n_requests": warm_up_config['n_requests'],
+                   "iterations": warm_up_config['iterations'],
+                   "explain_modes": warm_up_config['explain_modes']}
+
+# Under `gunicorn --preload` this runs once in the master and workers inherit the artifacts.
+# Handlers read `active_model.current` once per request, so a hot swap never changes the
+# version under a request in flight.
+ARTIFACTS_LOADED_PID = os.getpid()
+active_model = ActiveModel(model_registry, load_serving_model, run_fn=inference_executor.run,
+                           warm_up_options=warm_up_options)
+active_model.load(PINNED_MODEL_VERSION)
+if inference_executor.kind == "process":
+    serving = active_model.current
+    inference_executor.set_initializer(init_worker, (model_registry.artifact_path(serving.version, "model"),
+                                                     model_registry.artifact_path(serving.version, "explainer"),
+                                                     serving.explainer_backend))
+
+# Challenger scored off the request path, see src/inference/shadow.py
+shadow_config = inference_config['shadow']
+SHADOW_ENABLED = os.getenv("SHADOW_ENABLED", str(shadow_config['enabled'])).lower() in ("1", "true", "yes")
+SHADOW_LOG_DIR = os.getenv("SHADOW_LOG_DIR", shadow_config['log_dir'])
+shadow_scorer = None
+if SHADOW_ENABLED:
+    challenger_version = os.getenv("SHADOW_CHALLENGER_VERSION", shadow_config['challenger_version'])
+    if not challenger_version:
+        raise ValueError("Shadow scoring is enabled but no challenger_version is configured")
+    model_registry.verify(challenger_version)
+    shadow_scorer = ShadowScorer(load_serving_model(challenger_version),
+                                 ShadowLog(SHADOW_LOG_DIR,
+                                           rotate_rows=shadow_config['rotate_rows'],
+                                           rotate_seconds=shadow_config['rotate_seconds'],
+                                           max_files=shadow_config['max_files']),
+                                 max_workers=shadow_config['max_workers'],
+                                 max_pending=shadow_config['max_pending'],
+                                 sample_rate=shadow_config['sample_rate'])
+    logger.info(f"Shadow scoring with challenger model version {challenger_version}, logged to {SHADOW_LOG_DIR}")
+
+cache_config = inference_config['prediction_cache']
+prediction_cache = None
+if cache_config['enabled']:
+    # Keys are versioned with the checksum of the model version that scored them
+    prediction_cache = PredictionCache(max_entries=cache_config['max_entries'],
+                                       ttl_s=cache_config['ttl_s'],
+                                       disk_path=os.getenv("PREDICTION_CACHE_DISK_PATH", cache_config['disk_path']),
+                                       disk_size_limit_mb=cache_config['disk_size_limit_mb'])
+
+micro_batching_config = inference_config['micro_batching']
+MICRO_BATCHING_ENABLED = os.getenv("MICRO_BATCHING_ENABLED", str(micro_batching_config['enabled'])).lower() in ("1", "true", "yes")
+micro_batcher = None
+model_watcher = None
+shadow_comparer = None
+# /readyz turns ready once the lifespan startup, including the warm-up, has finished
+readiness = {"ready": False, "warm_up_seconds": None, "error": None}
+MODEL_WATCH_INTERVAL_S = float(os.getenv("MODEL_REGISTRY_WATCH_INTERVAL_S", registry_config['watch_interval_s']))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global micro_batcher, model_watcher, shadow_comparer
+    logger.info(f"Worker started, artifacts {'inherited from' if os.getpid() != ARTIFACTS_LOADED_PID else 'loaded in'} "
+                f"process {ARTIFACTS_LOADED_PID}: {process_memory()}")
+    inference_executor.start()
+    if MICRO_BATCHING_ENABLED:
+        micro_batcher = MicroBatcher(score_fn=score_grouped_requests,
+                                     max_batch_size=int(os.getenv("MICRO_BATCHING_MAX_BATCH_SIZE", micro_batching_config['max_batch_size'])),
+                                     max_wait_ms=float(os.getenv("MICRO_BATCHING_MAX_WAIT_MS", micro_batching_config['max_wait_ms'])),
+                                     run_fn=inference_executor.run,
+                                     max_concurrency=inference_executor.max_workers,
+                                     max_queue=int(os.getenv("MICRO_BATCHING_MAX_QUEUE", micro_batching_config['max_queue'])))
+        await micro_batcher.start()
+    if MODEL_WATCH_INTERVAL_S > 0 and PINNED_MODEL_VERSION is None:
+        model_watcher = asyncio.create_task(active_model.watch(MODEL_WATCH_INTERVAL_S))
+    if shadow_scorer is not None:
+        shadow_scorer.start()
+        if shadow_config['compare_interval_s'] > 0:
+            shadow_comparer = asyncio.create_task(compare_periodically(SHADOW_LOG_DIR, shadow_config['compare_interval_s']))
+    readiness.update(ready=False, warm_up_seconds=None, error=None)
+    if WARM_UP_ENABLED:
+        try:
+            seconds = await warm_up(active_model.current, inference_executor.run, **warm_up_options)
+            WARM_UP_SECONDS.labels(trigger="startup").observe(seconds)
+            readiness["warm_up_seconds"] = round(seconds, 3)
+            logger.info(f"Model version {active_model.current.version} warmed up in {seconds:.3f}s")
+        except Exception as e:
+            # The worker stays alive but never reports ready, so it gets no traffic
+            readiness["error"] = f"Warm-up failed: {e}"
+            logger.error(f"Warm-up of model version {active_model.current.version} failed: {e}", exc_info=True)
+    readiness["ready"] = readiness["error"] is None
+    yield
+    readiness["ready"] = False
+    if shadow_comparer is not None:
+        shadow_comparer.cancel()
+        shadow_comparer = None
+    if shadow_scorer is not None:
+        await asyncio.to_thread(shadow_scorer.shutdown)
+    if model_watcher is not None:
+        model_watcher.cancel()
+        model_watcher = None
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+        micro_batcher = None
+    inference_executor.shutdown()
+
+
+app = FastAPI(title="Credit Risk API", description="API to predict credit risk", version="0.1", lifespan=lifespan,
+              default_response_class=ORJSONResponse)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so unknown paths cannot blow up the label cardinality
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - start)
+        REQUESTS.labels(endpoint=endpoint, status=status).inc()
+        if status >= 400:
+            ERRORS.labels(endpoint=endpoint, status=status).inc()
+
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the worker's event loop answers."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the model is loaded and warmed up, 503 before that and during shutdown."""
+    serving = active_model.current
+    ready = readiness["ready"] and serving is not None
+    return ORJSONResponse(status_code=200 if ready else 503,
+                          content={"status": "ready" if ready else "not_ready",
+                                   "model_version": serving.version if serving is not None else None,
+                                   "warm_up_seconds": readiness["warm_up_seconds"],
+                                   "error": readiness["error"]})
 
 
 @app.get("/",tags= ["autentication"])
 async def index():
     return RedirectResponse(url="/docs")
 
-@app.post("/predict",response_model=PredictionResponse)
-async def predict(request: PredictionRequest):
+EXPLAIN_QUERY = Query(ExplainMode.full, description="none: probability only (SHAP skipped), top3: probability and reason codes, full: everything")
+
+
+FORMAT_QUERY = Query(ResponseFormat.keyed, alias="format", description="keyed: feature dicts, compact: arrays aligned to raw_feature_names / model_feature_names")
+
+RAW_FEATURE_NAMES = list(PredictionRequest.model_fields)
+
+
+def render(response: BaseModel, serving: ServingModel, response_format: ResponseFormat = ResponseFormat.keyed) -> ORJSONResponse:
+    """Serialize the response with orjson, timed as the serialization stage."""
+    with stage_timer("serialization"):
+        return render_response(response, response_format, RAW_FEATURE_NAMES, serving.feature_names)
+
+
+def fill_response(response: PredictionResponse, request: PredictionRequest, scored: tuple, explain: ExplainMode) -> None:
+    """Copy one scored row into the response, keeping only what the explain mode asks for."""
+    model_features, prediction_prob, all_shap_dict, top_shap_dict = scored
+    response.prediction_prob = prediction_prob
+    if explain != ExplainMode.none:
+        response.top_3_reason_codes = top_shap_dict
+    if explain == ExplainMode.full:
+        response.raw_feature_values = request.model_dump()
+        response.model_features = model_features
+        response.shap_values = all_shap_dict
+    response.status = "Success"
+
+
+def apply_scorecard(responses: List[PredictionResponse]) -> None:
+    """Three-digit score, risk band and reason code texts of the scored responses, with one vectorized scorecard call."""
+    scored = [response for response in responses if response.prediction_prob is not None]
+    if not scored:
+        return
+    scores, risk_bands = scorecard.apply([response.prediction_prob for response in scored])
+    for response, score, risk_band in zip(scored, scores, risk_bands):
+        response.three_digit_score = score
+        response.risk_band = risk_band
+        response.reason_texts = scorecard.reason_texts(response.top_3_reason_codes)
+
+
+def mirror_to_shadow(serving: ServingModel, requests: List[PredictionRequest], request_ids: List[str], scored: List[tuple]) -> None:
+    """Hand requests the champion has scored to the challenger; returns at once, work is dropped when it falls behind."""
+    if shadow_scorer is not None and shadow_scorer.challenger.version != serving.version:
+        shadow_scorer.submit(serving, requests, request_ids, [scored_row[1] for scored_row in scored],
+                             [scored_row[0] for scored_row in scored])
+
+
+@app.post("/predict",response_model=Union[PredictionResponse,CompactPredictionResponse])
+async def predict(request: PredictionRequest, explain: ExplainMode = EXPLAIN_QUERY, response_format: ResponseFormat = FORMAT_QUERY):
     request_id = str(uuid.uuid4())
-    logger.info(f"Received prediction request {request_id}")
+    request_logger.info(f"Received prediction request {request_id}", extra={"request_id": request_id})
     timestamp =datetime.now().isoformat()
 
-    if model is None or explainer is None:
+    # The version this request is scored with, even if another one is swapped in meanwhile
+    serving = active_model.current
+    if serving is None:
         raise HTTPException(status_code=500,detail="Model or explainer not loaded")
     
     response = PredictionResponse(request_id=request_id,
-                                raw_feature_values=request.model_dump(),
+                                model_version=serving.version,
+                                raw_feature_values={},
                                 model_features={},
                                 prediction_prob=None,
                                 failure_reason={},
@@ -52,40 +337,225 @@ async def predict(request: PredictionRequest):
                                 timestamp=timestamp)
     
     try:
-        input_data = pd.DataFrame([request.model_dump()])
-        input_data = preprocessing(input_data)
-        print(input_data)
-        print(input_data.dtypes)
-
-        response.model_features = input_data.to_dict(orient="records")[0]
-        logger.info(f"Preprocessed input data for request {request_id}")
-
-        prediction_prob = model.predict_proba(input_data)[:,1][0]
-        response.prediction_prob = float(prediction_prob)
-        logger.info(f"Prediction successful for request {request_id}")
-        
-        shap_values = explainer.shap_values(input_data)[0,:]
-
-        # Create the full SHAP values dictionary
-        all_shap_dict = {name: float(value) for name, value in zip(input_data.columns, shap_values)}
-        response.shap_values = all_shap_dict
+        scored = None
+        if prediction_cache is not None:
+            cache_key = prediction_cache.key(request.model_dump(), serving.model_checksum, explain.value)
+            scored = prediction_cache.get(cache_key)
 
-        # Get the top 3 reasons for the prediction
-        top_shap_dict = get_top_3_shap_features(shap_values= all_shap_dict,prob= prediction_prob)
-        
-        response.top_3_reason_codes = top_shap_dict
+        if scored is not None:
+            request_logger.info(f"Cache hit for request {request_id}", extra={"request_id": request_id})
+        else:
+            if micro_batcher is not None:
+                # Coalesced with other in-flight requests into one model + SHAP call
+                scored = await micro_batcher.submit((serving.score_fn, request, explain))
+            else:
+                scored = (await inference_executor.run(serving.score_fn, [request], explain))[0]
+            if prediction_cache is not None:
+                prediction_cache.set(cache_key, scored)
 
-        response.status = "Success"
+        fill_response(response, request, scored, explain)
+        apply_scorecard([response])
+        mirror_to_shadow(serving, [request], [request_id], [scored])
+        request_logger.info(f"Prediction successful for request {request_id}", extra={"request_id": request_id})
 
-        return response
+        return render(response, serving, response_format)
 
+    except InferenceSaturatedError as e:
+        logger.warning(f"Rejected prediction request {request_id}: {e}", extra={"request_id": request_id})
+        raise HTTPException(status_code=503,detail="Server is busy, retry later")
 
     except Exception as e:
-        logger.error(f"Prediction failed for request {request_id}")
-        logger.error(e,exc_info=True)
+        logger.error(f"Prediction failed for request {request_id}: {e}", exc_info=True, extra={"request_id": request_id})
         raise HTTPException(status_code=500,detail="Prediction failed")
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_cache.stats(), "model_version": active_model.current.version}
+
+
+@app.get("/admin/model")
+async def model_status():
+    """Model version serving this worker, the registry's CURRENT and the state of the last reload."""
+    return active_model.status()
+
+
+def require_admin_token(authorization: Optional[str] = Header(None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403,detail="Admin endpoints are disabled, set ADMIN_TOKEN to enable them")
+    if authorization is None or not secrets.compare_digest(authorization.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        raise HTTPException(status_code=401,detail="Invalid admin token")
+
+
+@app.post("/admin/model/reload", dependencies=[Depends(require_admin_token)])
+async def reload_model(version: Optional[str] = Query(None, description="Version to activate; default: the registry's CURRENT")):
+    """
+    Load, warm up and switch to a model version without dropping requests. With `version`,
+    the registry's CURRENT is pointed at it once it has loaded and warmed up in this worker,
+    so the other workers follow within watch_interval_s; a version that fails here is never
+    made CURRENT. Needs `Authorization: Bearer <ADMIN_TOKEN>`.
+    """
+    try:
+        serving = await active_model.reload(version)
+        if version is not None:
+            model_registry.set_current(version)
+    except ModelVersionNotFound as e:
+        raise HTTPException(status_code=404,detail=str(e))
+    except ModelRegistryError as e:
+        raise HTTPException(status_code=409,detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Could not load model version {version}: {e}")
+    return serving.info()
+
+
+@app.get("/worker/memory")
+async def worker_memory():
+    """Memory of the worker serving this request; see `src.inference.worker_memory` for all workers."""
+    return {"preloaded": os.getpid() != ARTIFACTS_LOADED_PID, **process_memory()}
+
+
+@app.post("/predict/batch",response_model=Union[BatchPredictionResponse,CompactBatchPredictionResponse])
+async def predict_batch(batch: List[Dict[str, Any]] = Body(...), explain: ExplainMode = EXPLAIN_QUERY,
+                        response_format: ResponseFormat = FORMAT_QUERY):
+    batch_id = str(uuid.uuid4())
+    request_logger.info(f"Received batch prediction request {batch_id} with {len(batch)} rows", extra={"request_id": batch_id})
+    timestamp =datetime.now().isoformat()
+
+    serving = active_model.current
+    if serving is None:
+        raise HTTPException(status_code=500,detail="Model or explainer not loaded")
+
+    if len(batch) > inference_config['max_batch_size']:
+        raise HTTPException(status_code=413,detail=f"Batch size must not exceed {inference_config['max_batch_size']} rows")
+
+    BATCH_SIZE.labels(source="batch_endpoint").observe(len(batch))
+    # Invalid rows are reported individually instead of failing the whole batch
+    valid_requests, failure_reasons = validate_batch(batch)
+    FAILED_ROWS.inc(len(failure_reasons))
+    responses = [PredictionResponse(request_id=f"{batch_id}-{position}",
+                                    model_version=serving.version,
+                                    raw_feature_values=row,
+                                    model_features={},
+                                    prediction_prob=None,
+                                    failure_reason=failure_reasons.get(position,{}),
+                                    top_3_reason_codes={},
+                                    shap_values={},
+                                    status="Failed" if position in failure_reasons else "processing",
+                                    timestamp=timestamp)
+                 for position, row in enumerate(batch)]
+
+    if valid_requests:
+        try:
+            positions = list(valid_requests.keys())
+            # One model call and one SHAP call for all valid rows
+            scored = await inference_executor.run(serving.batch_score_fn, [valid_requests[position] for position in positions], explain)
+
+            for position, scored_row in zip(positions, scored):
+                responses[position].raw_feature_values = {}
+                fill_response(responses[position], valid_requests[position], scored_row, explain)
+            apply_scorecard(responses)
+            mirror_to_shadow(serving, [valid_requests[position] for position in positions],
+                             [responses[position].request_id for position in positions], scored)
+
+        except InferenceSaturatedError as e:
+            logger.warning(f"Rejected batch prediction request {batch_id}: {e}", extra={"request_id": batch_id})
+            raise HTTPException(status_code=503,detail="Server is busy, retry later")
+
+        except Exception as e:
+            logger.error(f"Batch prediction failed for request {batch_id}: {e}", exc_info=True, extra={"request_id": batch_id})
+            raise HTTPException(status_code=500,detail="Batch prediction failed")
+
+    request_logger.info(f"Batch {batch_id} scored: {len(valid_requests)} succeeded, {len(failure_reasons)} failed", extra={"request_id": batch_id})
+    return render(BatchPredictionResponse(batch_id=batch_id,
+                                          model_version=serving.version,
+                                          n_requests=len(batch),
+                                          n_success=len(valid_requests),
+                                          n_failed=len(failure_reasons),
+                                          predictions=responses,
+                                          timestamp=timestamp), serving, response_format)
+
+
+@app.post("/predict/stream")
+async def predict_stream(request: Request, explain: ExplainMode = Query(ExplainMode.top3, description="none, top3 or full (adds all SHAP values)"),
+                         response_format: ResponseFormat = FORMAT_QUERY):
+    """
+    Score an NDJSON (application/x-ndjson) or Arrow IPC stream (application/vnd.apache.arrow.stream)
+    body of any size chunk by chunk. Results are streamed back in the same format, one row per
+    input row with its position, as soon as each chunk is scored.
+
+    With format=compact shap_values are arrays in model_feature_names order: an NDJSON stream
+    starts with a {"model_feature_names": [...]} line, an Arrow stream keeps the names in its
+    schema metadata.
+    """
+    stream_id = str(uuid.uuid4())
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in (NDJSON_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE):
+        raise HTTPException(status_code=415,detail=f"Content type must be {NDJSON_MEDIA_TYPE} or {ARROW_STREAM_MEDIA_TYPE}")
+    request_logger.info(f"Received {content_type} prediction stream {stream_id}", extra={"request_id": stream_id})
+
+    serving = active_model.current
+    if serving is None:
+        raise HTTPException(status_code=500,detail="Model or explainer not loaded")
+    streaming_config = inference_config['streaming']
+    chunk_size = streaming_config['chunk_size']
+    body = BodyStream(max_chunks=streaming_config['max_buffered_chunks'])
+    pump = asyncio.create_task(pump_body(request.stream(), body))
+
+    encoder = None
+    compact = response_format == ResponseFormat.compact
+    if content_type == ARROW_STREAM_MEDIA_TYPE:
+        try:
+            reader = await asyncio.to_thread(pa.ipc.open_stream, body)
+        except (pa.ArrowInvalid, OSError) as e:
+            body.abort()
+            pump.cancel()
+            raise HTTPException(status_code=400,detail=f"Invalid Arrow IPC stream: {e}")
+        chunks = arrow_chunks(reader, chunk_size)
+        score_chunk = score_columns
+        encoder = ArrowResultEncoder(explain.value, serving.feature_names if compact else None)
+    else:
+        chunks = ndjson_chunks(body, chunk_size)
+        score_chunk = score_rows
+
+    async def generate():
+        n_rows = 0
+        try:
+            if compact and encoder is None:
+                yield ndjson_header(serving.feature_names)
+            while True:
+                rows = await asyncio.to_thread(next, chunks, None)
+                if rows is None:
+                    break
+                while True:
+                    try:
+                        results = await inference_executor.run(score_chunk, serving.batch_score_fn, rows, explain.value, n_rows)
+                        break
+                    except InferenceSaturatedError:
+                        # A long stream waits for capacity instead of failing halfway through
+                        await asyncio.sleep(0.05)
+                n_rows += len(rows)
+                if compact:
+                    results = compact_results(results, serving.feature_names)
+                yield encoder.encode(results) if encoder is not None else encode_ndjson(results)
+            # The body ended; raises if the upload failed after all
+            await pump
+            if encoder is not None:
+                yield encoder.close()
+            request_logger.info(f"Prediction stream {stream_id} scored {n_rows} rows", extra={"request_id": stream_id})
+        except Exception as e:
+            logger.error(f"Prediction stream {stream_id} failed after {n_rows} rows: {e}", exc_info=True, extra={"request_id": stream_id})
+            raise
+        finally:
+            body.abort()
+            pump.cancel()
+            # Collects the upload error, if any, which the reader already reported
+            await asyncio.gather(pump, return_exceptions=True)
+
+    # The whole stream is scored with one version
+    return BodyStreamingResponse(generate(), media_type=content_type, headers={"X-Model-Version": serving.version})
+
 
 if __name__ == "__main__":
     uvicorn.run(app,host="0.0.0.0",port=8000)
\ No newline at end of file
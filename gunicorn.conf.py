@@ -0,0 +1,42 @@
+# gunicorn -c gunicorn.conf.py app:app
+#
+# With preload_app the master imports app.py once, so the model, the explainer and the
+# compiled node arrays are deserialized a single time and shared copy-on-write by every
+# forked worker. Set GUNICORN_PRELOAD=false to have each worker load its own copy.
+import gc
+import os
+import shutil
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:80")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# The master writes and rotates the log file; the forked workers send it their records
+import src.logging.custom_logging  # noqa: F401
+
+# Workers write Prometheus samples here and /metrics aggregates them. This has to happen
+# before the app (and prometheus_client) is imported, which preload does right after this
+# file is read, so the directory is reset here rather than in a server hook.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def when_ready(server):
+    if preload_app:
+        # Move the loaded objects out of the garbage collector's reach so that collections
+        # in the workers do not write to, and thereby copy, the shared pages
+        gc.collect()
+        gc.freeze()
+    from src.inference.worker_memory import process_memory
+    server.log.info(f"Master ready (preload_app={preload_app}): {process_memory()}")
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} forked")
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
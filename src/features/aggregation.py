@@ -0,0 +1,422 @@
+"""
+Out-of-core group-by aggregation of large tables.
+
+A table is streamed from CSV or Parquet as pyarrow record batches; every batch is reduced to
+partial aggregates per key (row count, non-null count, sum, min, max and the sum of squared
+deviations), and partials are merged across batches. When the merged partials outgrow their
+share of the memory budget they are spilled to Parquet files bucketed on the key, and each
+bucket is merged on its own at the end, so neither the table nor its per-key state has to fit
+in memory. The final statistics (count, sum, mean, min, max, var, std) are computed from the
+merged partials and written as one wide row per key.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from src.logging.custom_logging import logger
+from src.utils.other_utils import file_checksum
+from src.features.feature_engine import (PIPELINE_KEY_METADATA, FeatureNode, FeaturePipelineError, code_version,
+                                         stored_key, write_parquet)
+
+# Partial aggregates needed by each statistic
+STATES = {"count": ["count"], "sum": ["sum"], "mean": ["sum", "count"], "min": ["min"], "max": ["max"],
+          "var": ["sum", "count", "m2"], "std": ["sum", "count", "m2"]}
+# Separates the column from the state in the names of partial aggregate columns
+STATE_SEPARATOR = "\x1f"
+SIZE_STATE = f"{STATE_SEPARATOR}size"
+# Buckets of the spilled partials; each is merged in memory on its own
+SPILL_BUCKETS = 64
+# Smallest CSV block read at once, whatever the budget
+MIN_BLOCK_SIZE = 1 << 16
+# Approximate size of a value in CSV text
+CSV_VALUE_BYTES = 8
+# Blocks pyarrow's streaming CSV reader holds ahead of the batch being consumed
+CSV_READAHEAD_BLOCKS = 32
+
+
+class AggregationSpec:
+    """
+    Statistics of one table per value of `group_by`, written with `prefix`.
+
+    `aggregations` maps columns to statistics among `STATES`. `categories` maps string columns
+    to the values counted as 0/1 indicators, aggregated with `category_aggregations` (the share
+    of rows by default). `derived` nodes compute extra columns from each batch, as a pyarrow
+    Table; `joins` maps the names of other specs to the key their output is joined on, so their
+    columns can be aggregated one level up (e.g. loan level statistics per client).
+
+    Output columns are named <prefix>_SIZE (rows per key), <prefix>_<column>_<STAT> and
+    <prefix>_<column>_<value>_<STAT> for the indicators.
+    """
+
+    def __init__(self, name: str, input_file: str, group_by: str, prefix: str, aggregations: Mapping[str, Sequence[str]],
+                 categories: Optional[Mapping[str, Sequence[str]]] = None, category_aggregations: Sequence[str] = ("mean",),
+                 derived: Sequence[FeatureNode] = (), joins: Optional[Mapping[str, str]] = None):
+        self.name = name
+        self.input_file = input_file
+        self.group_by = group_by
+        self.prefix = prefix
+        self.aggregations = {column: list(stats) for column, stats in aggregations.items()}
+        self.categories = {column: list(values) for column, values in (categories or {}).items()}
+        self.category_aggregations = list(category_aggregations)
+        self.derived = list(derived)
+        self.joins = dict(joins or {})
+        unknown = sorted({stat for stats in self.all_aggregations().values() for stat in stats} - set(STATES))
+        if unknown:
+            raise FeaturePipelineError(f"{name}: statistics {unknown} cannot be merged across batches; use {sorted(STATES)}")
+
+    def indicator_columns(self) -> Dict[str, tuple]:
+        """{indicator column: (category column, value)}."""
+        return {f"{column}_{re.sub(r'[^0-9A-Za-z]+', '_', str(value))}": (column, value)
+                for column, values in self.categories.items() for value in values}
+
+    def all_aggregations(self) -> Dict[str, List[str]]:
+        """Statistics of every aggregated column, the indicators included."""
+        return {**self.aggregations, **{name: self.category_aggregations for name in self.indicator_columns()}}
+
+    def states(self) -> Dict[str, List[str]]:
+        """Partial aggregates kept for every aggregated column, in a fixed order."""
+        return {column: [state for state in ("count", "sum", "min", "max", "m2")
+                         if any(state in STATES[stat] for stat in stats)]
+                for column, stats in self.all_aggregations().items()}
+
+    def input_columns(self, joined: Sequence[str] = ()) -> Dict[str, pa.DataType]:
+        """Columns read from the input file and their types; `joined` are the columns the joins add."""
+        computed = {node.name for node in self.derived} | set(self.indicator_columns()) | set(joined)
+        names = [self.group_by, *self.joins.values(), *self.categories,
+                 *(name for node in self.derived for name in node.inputs), *self.aggregations]
+        types = {}
+        for name in dict.fromkeys(names):
+            if name in computed:
+                continue
+            if name == self.group_by or name in self.joins.values():
+                types[name] = pa.int64()
+            elif name in self.categories:
+                types[name] = pa.string()
+            else:
+                types[name] = pa.float64()
+        return types
+
+    @property
+    def fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps([self.name, self.group_by, self.prefix, self.aggregations, self.categories,
+                                          self.category_aggregations, self.joins,
+                                          [node.fingerprint for node in self.derived],
+                                          [code_version(fn) for fn in (prepare_batch, partial_aggregates, merge_partials,
+                                                                       finalize)]]).encode()).hexdigest()
+
+    def __repr__(self) -> str:
+        return f"AggregationSpec({self.name!r}, group_by={self.group_by!r})"
+
+
+def _state_column(column: str, state: str) -> str:
+    return f"{column}{STATE_SEPARATOR}{state}"
+
+
+def iter_batches(input_path: str, columns: Mapping[str, pa.DataType], batch_rows: int) -> Iterator[pa.Table]:
+    """`columns` of a CSV or Parquet file, cast to their types, in batches of about `batch_rows` rows."""
+    if input_path.endswith(".parquet"):
+        parquet_file = pq.ParquetFile(input_path)
+        schema = pa.schema(list(columns.items()))
+        for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=list(columns)):
+            yield pa.Table.from_batches([batch]).select(list(columns)).cast(schema)
+        return
+    block_size = max(MIN_BLOCK_SIZE, batch_rows * CSV_VALUE_BYTES * len(columns))
+    reader = pa_csv.open_csv(input_path,
+                             read_options=pa_csv.ReadOptions(block_size=block_size),
+                             convert_options=pa_csv.ConvertOptions(include_columns=list(columns), column_types=dict(columns),
+                                                                   strings_can_be_null=True))
+    for batch in reader:
+        yield pa.Table.from_batches([batch])
+
+
+def prepare_batch(spec: AggregationSpec, table: pa.Table, lookups: Mapping[str, pa.Table]) -> pa.Table:
+    """Rows of `table` with a key, joined with `lookups` and with the derived and indicator columns added."""
+    table = table.filter(pc.is_valid(table[spec.group_by]))
+    for name, key in spec.joins.items():
+        table = table.join(lookups[name], keys=key, join_type="left outer", use_threads=False)
+    for node in spec.derived:
+        values = pc.cast(node.compute(table), pa.float64())
+        # inf and NaN from divisions count as missing, as nulls are skipped by every statistic
+        table = table.append_column(node.name, pc.if_else(pc.is_finite(values), values, None))
+    for name, (column, value) in spec.indicator_columns().items():
+        table = table.append_column(name, pc.cast(pc.fill_null(pc.equal(table[column], value), False), pa.int8()))
+    return table
+
+
+def partial_aggregates(table: pa.Table, key: str, states: Mapping[str, Sequence[str]]) -> pa.Table:
+    """Partial aggregates of the rows of `table` per `key`; m2 is the sum of squared deviations from the mean."""
+    aggregations: List[Any] = [([], "count_all")]
+    for column, column_states in states.items():
+        for state in column_states:
+            if state == "sum":
+                aggregations.append((column, "sum", pc.ScalarAggregateOptions(min_count=0)))
+            elif state == "m2":
+                aggregations.append((column, "variance", pc.VarianceOptions(ddof=0)))
+            else:
+                aggregations.append((column, state))
+    grouped = table.group_by(key, use_threads=False).aggregate(aggregations)
+    columns = {key: grouped[key], SIZE_STATE: grouped["count_all"]}
+    for column, column_states in states.items():
+        for state in column_states:
+            if state == "m2":
+                values = pc.multiply(grouped[f"{column}_variance"], pc.cast(grouped[f"{column}_count"], pa.float64()))
+                columns[_state_column(column, state)] = pc.fill_null(values, 0.0)
+            else:
+                columns[_state_column(column, state)] = grouped[f"{column}_{state}"]
+    return pa.table(columns)
+
+
+def _sum(name: str) -> tuple:
+    return (name, "sum", pc.ScalarAggregateOptions(min_count=0))
+
+
+def merge_partials(partials: pa.Table, key: str, states: Mapping[str, Sequence[str]]) -> pa.Table:
+    """
+    Partial aggregates per `key` merged into one row per key. The merged m2 is the m2 of the
+    partials plus count * (mean - merged mean)^2 of each, Chan et al.'s pairwise update applied
+    to all the partials of a key at once, so it keeps its precision far from 0.
+    """
+    variance_columns = [column for column, column_states in states.items() if "m2" in column_states]
+    if variance_columns:
+        partials = _with_mean_deviations(partials, key, variance_columns)
+    aggregations: List[Any] = [_sum(SIZE_STATE)]
+    for column, column_states in states.items():
+        for state in column_states:
+            name = _state_column(column, state)
+            aggregations.append((name, state) if state in ("min", "max") else _sum(name))
+            if state == "m2":
+                aggregations.append(_sum(_state_column(column, "deviations")))
+    grouped = partials.group_by(key, use_threads=False).aggregate(aggregations)
+    columns = {key: grouped[key], SIZE_STATE: grouped[f"{SIZE_STATE}_sum"]}
+    for column, column_states in states.items():
+        for state in column_states:
+            name = _state_column(column, state)
+            columns[name] = grouped[f"{name}_{state if state in ('min', 'max') else 'sum'}"]
+            if state == "m2":
+                columns[name] = pc.add(columns[name], grouped[f"{_state_column(column, 'deviations')}_sum"])
+    return pa.table(columns)
+
+
+def _mean(total: Any, count: Any) -> Any:
+    """total / count, 0 without values."""
+    count = pc.cast(count, pa.float64())
+    return pc.if_else(pc.greater(count, 0), pc.divide(total, count), 0.0)
+
+
+def _with_mean_deviations(partials: pa.Table, key: str, columns: Sequence[str]) -> pa.Table:
+    """`partials` with count * (mean - mean of its key)^2 of each of `columns`, in their deviations state."""
+    totals = partials.group_by(key, use_threads=False).aggregate(
+        [_sum(_state_column(column, state)) for column in columns for state in ("sum", "count")])
+    means = pa.table({key: totals[key], **{
+        _state_column(column, "merged_mean"): _mean(totals[f"{_state_column(column, 'sum')}_sum"],
+                                                    totals[f"{_state_column(column, 'count')}_sum"])
+        for column in columns}})
+    partials = partials.join(means, key, use_threads=False)
+    for column in columns:
+        count = partials[_state_column(column, "count")]
+        deviation = pc.subtract(_mean(partials[_state_column(column, "sum")], count),
+                                partials[_state_column(column, "merged_mean")])
+        partials = partials.append_column(_state_column(column, "deviations"), pc.multiply(
+            pc.cast(count, pa.float64()), pc.multiply(deviation, deviation)))
+    return partials
+
+
+def finalize(merged: pa.Table, spec: AggregationSpec) -> pa.Table:
+    """Output columns of `spec` from merged partial aggregates, sorted by key."""
+    merged = merged.sort_by(spec.group_by)
+    columns = {spec.group_by: merged[spec.group_by], f"{spec.prefix}_SIZE": merged[SIZE_STATE]}
+
+    def state(column: str, name: str) -> np.ndarray:
+        return merged[_state_column(column, name)].to_numpy(zero_copy_only=False).astype(float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for column, stats in spec.all_aggregations().items():
+            for stat in stats:
+                name = f"{spec.prefix}_{column}_{stat.upper()}"
+                if stat == "count":
+                    columns[name] = merged[_state_column(column, "count")]
+                    continue
+                if stat in ("sum", "min", "max"):
+                    values = state(column, stat)
+                elif stat == "mean":
+                    count = state(column, "count")
+                    values = np.where(count > 0, state(column, "sum") / count, np.nan)
+                else:
+                    # Sample variance (ddof=1), as pandas
+                    count = state(column, "count")
+                    values = np.where(count > 1, state(column, "m2") / (count - 1), np.nan)
+                    if stat == "std":
+                        values = np.sqrt(values)
+                columns[name] = pa.array(values, type=pa.float64(), from_pandas=True)
+    return pa.table(columns)
+
+
+class PartialAggregates:
+    """
+    Partial aggregates accumulated across batches, compacted once they exceed `threshold`
+    bytes and spilled to `spill_dir` in `SPILL_BUCKETS` key buckets if compacting does not
+    bring them under half of it.
+    """
+
+    def __init__(self, key: str, states: Mapping[str, Sequence[str]], threshold: int, spill_dir: str):
+        self.key = key
+        self.states = states
+        self.threshold = threshold
+        self.spill_dir = spill_dir
+        self.partials: List[pa.Table] = []
+        self.nbytes = 0
+        self.writers: Dict[int, pq.ParquetWriter] = {}
+
+    @property
+    def spilled(self) -> bool:
+        return bool(self.writers)
+
+    def add(self, partial: pa.Table) -> None:
+        self.partials.append(partial)
+        self.nbytes += partial.nbytes
+        if self.nbytes > self.threshold:
+            merged = merge_partials(pa.concat_tables(self.partials), self.key, self.states)
+            self.partials, self.nbytes = [merged], merged.nbytes
+            if merged.nbytes > self.threshold // 2:
+                self.spill()
+
+    def spill(self) -> None:
+        for partial in self.partials:
+            buckets = partial[self.key].to_numpy() % SPILL_BUCKETS
+            order = np.argsort(buckets, kind="stable")
+            partial, buckets = partial.take(order), buckets[order]
+            bounds = np.searchsorted(buckets, np.arange(SPILL_BUCKETS + 1))
+            for bucket in range(SPILL_BUCKETS):
+                if bounds[bucket] == bounds[bucket + 1]:
+                    continue
+                if bucket not in self.writers:
+                    self.writers[bucket] = pq.ParquetWriter(os.path.join(self.spill_dir, f"{bucket}.parquet"), partial.schema)
+                self.writers[bucket].write_table(partial.slice(bounds[bucket], bounds[bucket + 1] - bounds[bucket]))
+        self.partials, self.nbytes = [], 0
+
+    def merged(self) -> Iterator[pa.Table]:
+        """The merged partials: one table, or one per bucket after a spill."""
+        if not self.spilled:
+            if self.partials:
+                yield merge_partials(pa.concat_tables(self.partials), self.key, self.states)
+            return
+        self.spill()
+        for writer in self.writers.values():
+            writer.close()
+        for bucket in sorted(self.writers):
+            yield merge_partials(pq.read_table(os.path.join(self.spill_dir, f"{bucket}.parquet")), self.key, self.states)
+
+
+def aggregate(spec: AggregationSpec, input_path: str, output_path: str, memory_budget_bytes: int,
+              lookup_paths: Optional[Mapping[str, str]] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    Aggregate the table at `input_path` per `spec.group_by` into the Parquet file `output_path`.
+
+    `lookup_paths` maps the names in `spec.joins` to their aggregated outputs. The joined
+    outputs are held in memory and count against `memory_budget_bytes`; of the rest, a quarter
+    sizes the input batches and a sixteenth the partial aggregates kept between batches, which are
+    spilled when merging does not bring them under half of that. The remainder leaves room for
+    reading and merging. The budget is an estimate from the column counts, not a hard limit.
+    The output is keyed like `materialize`, on the input checksum, the spec and the keys of the
+    joined outputs, and an unchanged output is not rebuilt.
+
+    Returns:
+    dict: output_path, key, rows, cached, input_rows, batches and spilled.
+    """
+    lookup_paths = dict(lookup_paths or {})
+    missing = [name for name in spec.joins if name not in lookup_paths]
+    if missing:
+        raise FeaturePipelineError(f"{spec.name} joins {missing}, which have no output path")
+    key = hashlib.sha256(json.dumps({"input": file_checksum(input_path), "spec": spec.fingerprint,
+                                     "joins": {name: stored_key(lookup_paths[name]) for name in spec.joins}}
+                                    ).encode()).hexdigest()
+    if not force and stored_key(output_path) == key:
+        logger.info(f"Aggregates in {output_path} are up to date")
+        return {"output_path": output_path, "key": key, "rows": pq.read_metadata(output_path).num_rows, "cached": True,
+                "input_rows": None, "batches": 0, "spilled": False}
+
+    lookups = {name: pq.read_table(lookup_paths[name]) for name in spec.joins}
+    budget = memory_budget_bytes - sum(table.nbytes for table in lookups.values())
+    if budget <= 0:
+        raise FeaturePipelineError(f"{spec.name}: the joined outputs alone exceed the memory budget of "
+                                   f"{memory_budget_bytes} bytes")
+    joined = [name for join, table in lookups.items() for name in table.column_names if name != spec.joins[join]]
+    columns = spec.input_columns(joined)
+    states = spec.states()
+    # Bytes per input row of a batch: the columns read, joined and derived, the int8 indicators
+    # and, when the keys of a batch are all distinct, its partial aggregates and the hash table
+    # building them, plus the CSV text read ahead
+    state_columns = 1 + sum(len(column_states) for column_states in states.values())
+    row_bytes = 8 * (len(columns) + len(joined) + len(spec.derived) + 3 * state_columns) + len(spec.indicator_columns())
+    if not input_path.endswith(".parquet"):
+        row_bytes += CSV_READAHEAD_BLOCKS * CSV_VALUE_BYTES * len(columns)
+    batch_rows = max(1024, (budget // 4) // row_bytes)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix=f".{spec.name}-spill-", dir=os.path.dirname(output_path) or ".")
+    temp_path = f"{output_path}.tmp-{os.getpid()}"
+    input_rows, batches, rows = 0, 0, 0
+    try:
+        partials = PartialAggregates(spec.group_by, states, budget // 16, spill_dir)
+        for table in iter_batches(input_path, columns, batch_rows):
+            input_rows += table.num_rows
+            batches += 1
+            partials.add(partial_aggregates(prepare_batch(spec, table, lookups), spec.group_by, states))
+
+        if not partials.spilled:
+            merged = list(partials.merged())
+            if not merged:
+                raise FeaturePipelineError(f"{input_path} has no rows with a {spec.group_by}")
+            output = finalize(merged[0], spec)
+            rows = output.num_rows
+            write_parquet(output.replace_schema_metadata({PIPELINE_KEY_METADATA: key.encode()}), output_path)
+        else:
+            writer = None
+            for merged in partials.merged():
+                output = finalize(merged, spec)
+                if writer is None:
+                    writer = pq.ParquetWriter(temp_path, output.schema.with_metadata({PIPELINE_KEY_METADATA: key.encode()}))
+                writer.write_table(output)
+                rows += output.num_rows
+            writer.close()
+            os.replace(temp_path, output_path)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    logger.info(f"Aggregated {input_rows} rows of {input_path} in {batches} batches into {rows} rows per "
+                f"{spec.group_by} in {output_path}{' (spilled)' if partials.spilled else ''}")
+    return {"output_path": output_path, "key": key, "rows": rows, "cached": False,
+            "input_rows": input_rows, "batches": batches, "spilled": partials.spilled}
+
+
+def dependency_order(specs: Sequence[AggregationSpec]) -> List[AggregationSpec]:
+    """`specs` ordered so every spec comes after the specs it joins."""
+    by_name = {spec.name: spec for spec in specs}
+    ordered: List[AggregationSpec] = []
+    visiting: List[str] = []
+
+    def visit(spec: AggregationSpec) -> None:
+        if spec in ordered:
+            return
+        if spec.name in visiting:
+            raise FeaturePipelineError(f"Aggregation dependency cycle: {' -> '.join(visiting + [spec.name])}")
+        visiting.append(spec.name)
+        for name in spec.joins:
+            if name not in by_name:
+                raise FeaturePipelineError(f"{spec.name} joins the unknown aggregation {name!r}")
+            visit(by_name[name])
+        visiting.pop()
+        ordered.append(spec)
+
+    for spec in specs:
+        visit(spec)
+    return ordered
@@ -1,19 +1,78 @@
+"""
+Application table features (app_data_processing of notebooks/3.application_feature_model.ipynb)
+declared as a `FeaturePipeline`. The same definitions build the feature store and derive the
+model inputs in `src.inference.preprocessing`.
+
+    python -m src.features.app_features_pipeline [--split train test] [--force]
+
+reads <RAW_DATA_PATH>/app_<split>.csv and writes <FEATURE_STORE_PATH>/app_<split>.parquet.
+"""
+import argparse
+import os
+from typing import Any, Dict, List, Optional
 # numpy and pandas for data manipulation
 import numpy as np
-import pandas as pd 
-import os,sys
+import pandas as pd
 from src.logging.custom_logging import logger
-from src.exceptions.custom_exception import CustomException
-#from src.utils.feature_engineering import compute_ratio_columnwise
 from src.utils.other_utils import read_yaml_file
+from src.features.feature_engine import FeatureNode, FeaturePipeline, RatioFeature, RowFilter, materialize
 
+config = read_yaml_file("src/config/config.yaml")
 
 
-def main():
-    
+def client_age(df: pd.DataFrame) -> pd.Series:
+    return (df["DAYS_BIRTH"] / (-365)).round(2)
 
 
-config = read_yaml_file("src/config/config.yaml")
+def employment_years(df: pd.DataFrame) -> np.ndarray:
+    # DAYS_EMPLOYED is positive (365243) for applicants without employment
+    return np.where(df["DAYS_EMPLOYED"] < 0, (df["DAYS_EMPLOYED"] / -365).round(2), np.nan)
+
+
+def employment_age(df: pd.DataFrame) -> np.ndarray:
+    """Age when employment started: -1 without employment, -2 if it is not below the age."""
+    return np.where(df["employment_years"].isna(), -1,
+                    np.where(df["Client_Age"] > df["employment_years"], df["Client_Age"] - df["employment_years"], -2))
+
+
+def known_gender(df: pd.DataFrame) -> pd.Series:
+    return df["CODE_GENDER"] != "XNA"
+
+
+APP_FEATURES = FeaturePipeline(
+    nodes=[FeatureNode("Client_Age", ["DAYS_BIRTH"], client_age),
+           FeatureNode("employment_years", ["DAYS_EMPLOYED"], employment_years),
+           FeatureNode("employment_age", ["Client_Age", "employment_years"], employment_age),
+           RatioFeature("AMT_ANNUITY_AMT_INCOME_TOTAL_ratio", "AMT_ANNUITY", "AMT_INCOME_TOTAL"),
+           RatioFeature("AMT_CREDIT_AMT_INCOME_TOTAL_ratio", "AMT_CREDIT", "AMT_INCOME_TOTAL"),
+           RatioFeature("AMT_CREDIT_AMT_GOODS_PRICE_ratio", "AMT_CREDIT", "AMT_GOODS_PRICE"),
+           RatioFeature("AMT_CREDIT_AMT_ANNUITY_ratio", "AMT_CREDIT", "AMT_ANNUITY")],
+    filters=[RowFilter("known_gender", ["CODE_GENDER"], known_gender)])
+
+
+def app_feature_columns(config: Dict[str, Any] = config) -> List[str]:
+    """Columns of the application feature store files, as selected in the notebook."""
+    return config['APP_CATEGORICAL_FEATURES'] + config['APP_NUMERICAL_FEATURES'] + [config['TARGET_COL'], config['PRIMARY_KEY']]
+
+
+def build_app_features(split: str, config: Dict[str, Any] = config, force: bool = False) -> Dict[str, Any]:
+    """Materialize the application features of the 'train' or 'test' split into the feature store."""
+    input_path = os.path.join(config['RAW_DATA_PATH'], config[f'APP_{split.upper()}_FILE_NAME'])
+    output_path = os.path.join(config['FEATURE_STORE_PATH'], config[f'APP_{split.upper()}_FEATURES_FILE_NAME'])
+    return materialize(APP_FEATURES, input_path, output_path, app_feature_columns(config),
+                       categorical=config['APP_CATEGORICAL_FEATURES'], force=force)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the application features of the feature store")
+    parser.add_argument("--split", nargs="+", choices=["train", "test"], default=["train", "test"])
+    parser.add_argument("--force", action="store_true", help="Recompute every column, even those whose fingerprint is unchanged")
+    args = parser.parse_args(argv)
+    for split in args.split:
+        result = build_app_features(split, force=args.force)
+        status = "cached" if result['cached'] else f"{len(result['recomputed'])} columns recomputed"
+        logger.info(f"app_{split}: {result['rows']} rows ({status}) in {result['output_path']}")
 
-print(config['TARGET_COL'])
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Per-client features of the auxiliary tables of the competition: bureau (with bureau_balance
+per bureau loan), previous_application (with installments_payments per previous loan) and
+credit_card_balance, aggregated out of core with `src.features.aggregation`.
+
+    python -m src.features.aux_tables_pipeline [--table bureau_features ...] [--memory-budget-mb 1024] [--force]
+
+reads <RAW_DATA_PATH>/<table>.csv and writes <FEATURE_STORE_PATH>/<name>.parquet; the
+*_features files have one row per SK_ID_CURR.
+"""
+import argparse
+import os
+from typing import Any, Dict, List, Optional, Sequence
+import pyarrow as pa
+import pyarrow.compute as pc
+from src.logging.custom_logging import logger
+from src.utils.other_utils import read_yaml_file
+from src.features.aggregation import AggregationSpec, aggregate, dependency_order
+from src.features.feature_engine import FeatureNode
+
+config = read_yaml_file("src/config/config.yaml")
+
+
+def ratio(numerator: str, denominator: str):
+    """Batch function of numerator / denominator; divisions by zero become missing values."""
+    def fn(table: pa.Table) -> pa.ChunkedArray:
+        return pc.divide(table[numerator], table[denominator])
+    return fn
+
+
+def days_past_due(table: pa.Table) -> pa.ChunkedArray:
+    return pc.max_element_wise(pc.subtract(table["DAYS_ENTRY_PAYMENT"], table["DAYS_INSTALMENT"]), 0.0)
+
+
+def days_before_due(table: pa.Table) -> pa.ChunkedArray:
+    return pc.max_element_wise(pc.subtract(table["DAYS_INSTALMENT"], table["DAYS_ENTRY_PAYMENT"]), 0.0)
+
+
+def payment_difference(table: pa.Table) -> pa.ChunkedArray:
+    return pc.subtract(table["AMT_INSTALMENT"], table["AMT_PAYMENT"])
+
+
+def aux_table_specs(config: Dict[str, Any] = config) -> List[AggregationSpec]:
+    """Aggregations of the auxiliary tables, loan level ones before the client level ones joining them."""
+    bureau_balance = AggregationSpec(
+        "bureau_balance_by_bureau", config['BUREAU_BALANCE_FILE_NAME'], group_by="SK_ID_BUREAU", prefix="BB",
+        aggregations={"MONTHS_BALANCE": ["min", "max"]},
+        categories={"STATUS": ["0", "1", "2", "3", "4", "5", "C", "X"]})
+    bureau = AggregationSpec(
+        "bureau_features", config['BUREAU_FILE_NAME'], group_by="SK_ID_CURR", prefix="BURO",
+        aggregations={"DAYS_CREDIT": ["min", "max", "mean", "var"],
+                      "DAYS_CREDIT_ENDDATE": ["min", "max", "mean"],
+                      "DAYS_CREDIT_UPDATE": ["mean"],
+                      "CREDIT_DAY_OVERDUE": ["max", "mean"],
+                      "AMT_CREDIT_MAX_OVERDUE": ["max", "mean"],
+                      "CNT_CREDIT_PROLONG": ["sum"],
+                      "AMT_CREDIT_SUM": ["max", "mean", "sum"],
+                      "AMT_CREDIT_SUM_DEBT": ["max", "mean", "sum"],
+                      "AMT_CREDIT_SUM_OVERDUE": ["mean"],
+                      "AMT_CREDIT_SUM_LIMIT": ["mean", "sum"],
+                      "AMT_ANNUITY": ["max", "mean"],
+                      "DEBT_CREDIT_RATIO": ["max", "mean"],
+                      "BB_SIZE": ["mean", "sum"],
+                      "BB_MONTHS_BALANCE_MIN": ["min"],
+                      "BB_MONTHS_BALANCE_MAX": ["max"],
+                      **{f"BB_STATUS_{status}_MEAN": ["mean"] for status in ["0", "1", "2", "5", "C", "X"]}},
+        categories={"CREDIT_ACTIVE": ["Active", "Closed", "Sold", "Bad debt"],
+                    "CREDIT_TYPE": ["Consumer credit", "Credit card", "Car loan", "Mortgage", "Microloan"]},
+        derived=[FeatureNode("DEBT_CREDIT_RATIO", ["AMT_CREDIT_SUM_DEBT", "AMT_CREDIT_SUM"],
+                             ratio("AMT_CREDIT_SUM_DEBT", "AMT_CREDIT_SUM"))],
+        joins={bureau_balance.name: "SK_ID_BUREAU"})
+    installments = AggregationSpec(
+        "installments_by_prev", config['INSTALLMENTS_PAYMENTS_FILE_NAME'], group_by="SK_ID_PREV", prefix="INSTAL",
+        aggregations={"DPD": ["max", "mean", "sum"],
+                      "DBD": ["max", "mean", "sum"],
+                      "PAYMENT_PERC": ["mean", "var"],
+                      "PAYMENT_DIFF": ["max", "mean", "sum"],
+                      "AMT_INSTALMENT": ["max", "mean", "sum"],
+                      "AMT_PAYMENT": ["min", "max", "mean", "sum"],
+                      "DAYS_ENTRY_PAYMENT": ["max", "mean"]},
+        derived=[FeatureNode("DPD", ["DAYS_ENTRY_PAYMENT", "DAYS_INSTALMENT"], days_past_due),
+                 FeatureNode("DBD", ["DAYS_ENTRY_PAYMENT", "DAYS_INSTALMENT"], days_before_due),
+                 FeatureNode("PAYMENT_PERC", ["AMT_PAYMENT", "AMT_INSTALMENT"], ratio("AMT_PAYMENT", "AMT_INSTALMENT")),
+                 FeatureNode("PAYMENT_DIFF", ["AMT_INSTALMENT", "AMT_PAYMENT"], payment_difference)])
+    previous = AggregationSpec(
+        "previous_application_features", config['PREVIOUS_APPLICATION_FILE_NAME'], group_by="SK_ID_CURR", prefix="PREV",
+        aggregations={"AMT_ANNUITY": ["min", "max", "mean"],
+                      "AMT_APPLICATION": ["min", "max", "mean"],
+                      "AMT_CREDIT": ["min", "max", "mean"],
+                      "APP_CREDIT_PERC": ["min", "max", "mean", "var"],
+                      "AMT_DOWN_PAYMENT": ["min", "max", "mean"],
+                      "AMT_GOODS_PRICE": ["min", "max", "mean"],
+                      "RATE_DOWN_PAYMENT": ["min", "max", "mean"],
+                      "DAYS_DECISION": ["min", "max", "mean"],
+                      "CNT_PAYMENT": ["mean", "sum"],
+                      "INSTAL_SIZE": ["mean", "sum"],
+                      "INSTAL_DPD_MAX": ["max"],
+                      "INSTAL_DPD_MEAN": ["mean"],
+                      "INSTAL_DBD_MEAN": ["mean"],
+                      "INSTAL_PAYMENT_PERC_MEAN": ["mean"],
+                      "INSTAL_PAYMENT_DIFF_SUM": ["mean", "sum"],
+                      "INSTAL_AMT_PAYMENT_SUM": ["sum"]},
+        categories={"NAME_CONTRACT_STATUS": ["Approved", "Refused", "Canceled", "Unused offer"],
+                    "NAME_CONTRACT_TYPE": ["Cash loans", "Consumer loans", "Revolving loans"]},
+        derived=[FeatureNode("APP_CREDIT_PERC", ["AMT_APPLICATION", "AMT_CREDIT"], ratio("AMT_APPLICATION", "AMT_CREDIT"))],
+        joins={installments.name: "SK_ID_PREV"})
+    credit_card = AggregationSpec(
+        "credit_card_features", config['CREDIT_CARD_BALANCE_FILE_NAME'], group_by="SK_ID_CURR", prefix="CC",
+        aggregations={"MONTHS_BALANCE": ["min", "max"],
+                      "AMT_BALANCE": ["max", "mean", "sum"],
+                      "AMT_CREDIT_LIMIT_ACTUAL": ["max", "mean"],
+                      "AMT_DRAWINGS_CURRENT": ["max", "mean", "sum"],
+                      "AMT_PAYMENT_CURRENT": ["mean", "sum"],
+                      "AMT_TOTAL_RECEIVABLE": ["mean"],
+                      "CNT_DRAWINGS_CURRENT": ["max", "mean", "sum"],
+                      "SK_DPD": ["max", "mean"],
+                      "SK_DPD_DEF": ["max", "mean"],
+                      "LIMIT_USE": ["max", "mean"]},
+        derived=[FeatureNode("LIMIT_USE", ["AMT_BALANCE", "AMT_CREDIT_LIMIT_ACTUAL"],
+                             ratio("AMT_BALANCE", "AMT_CREDIT_LIMIT_ACTUAL"))])
+    return [bureau_balance, bureau, installments, previous, credit_card]
+
+
+def aux_output_path(spec: AggregationSpec, config: Dict[str, Any] = config) -> str:
+    return os.path.join(config['FEATURE_STORE_PATH'], f"{spec.name}.parquet")
+
+
+def build_aux_table(name: str, config: Dict[str, Any] = config, memory_budget_mb: Optional[float] = None,
+                    force: bool = False) -> Dict[str, Any]:
+    """Aggregate one auxiliary table; the aggregations it joins must be built already."""
+    specs = {spec.name: spec for spec in aux_table_specs(config)}
+    spec = specs[name]
+    budget = int((memory_budget_mb or config['AGGREGATION_MEMORY_BUDGET_MB']) * 2 ** 20)
+    return aggregate(spec, os.path.join(config['RAW_DATA_PATH'], spec.input_file), aux_output_path(spec, config), budget,
+                     {joined: aux_output_path(specs[joined], config) for joined in spec.joins}, force=force)
+
+
+def build_aux_features(names: Optional[Sequence[str]] = None, config: Dict[str, Any] = config,
+                       memory_budget_mb: Optional[float] = None, force: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Aggregate the auxiliary tables named in `names` (all by default) and the aggregations
+    they join, one after another in dependency order. Returns the result of `aggregate` per name.
+    """
+    specs = {spec.name: spec for spec in aux_table_specs(config)}
+    needed = set()
+
+    def require(name: str) -> None:
+        needed.add(name)
+        for joined in specs[name].joins:
+            require(joined)
+
+    for name in names or specs:
+        require(name)
+    return {spec.name: build_aux_table(spec.name, config, memory_budget_mb, force)
+            for spec in dependency_order(list(specs.values())) if spec.name in needed}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Aggregate the auxiliary tables into per-client features")
+    parser.add_argument("--table", nargs="+", choices=[spec.name for spec in aux_table_specs()],
+                        help="Aggregations to build, with those they join (default: all)")
+    parser.add_argument("--memory-budget-mb", type=float, help="Default: AGGREGATION_MEMORY_BUDGET_MB of config.yaml")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the inputs and aggregations are unchanged")
+    args = parser.parse_args(argv)
+    for name, result in build_aux_features(args.table, memory_budget_mb=args.memory_budget_mb, force=args.force).items():
+        status = "cached" if result['cached'] else f"{result['input_rows']} input rows"
+        logger.info(f"{name}: {result['rows']} rows ({status}) in {result['output_path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Feature store build: every table and aggregation is a node with declared dependencies, run in
+a process pool as soon as the nodes it depends on are done.
+
+    python -m src.features.build_features [--workers 8] [--only client_train ...] [--force] [--report build.json]
+
+Nodes exchange data only through the Parquet files they write; a worker returns the small
+summary dict of its node, never a DataFrame. Each node runs in a fresh process, so its peak
+RSS is its own. Ready nodes are started longest remaining chain first, and pyarrow's thread
+pools are split between the workers.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.logging.custom_logging import log_to_parent, logger, parent_log_queue
+from src.utils.other_utils import read_yaml_file
+from src.features.app_features_pipeline import build_app_features
+from src.features.aux_tables_pipeline import aux_output_path, aux_table_specs, build_aux_table
+from src.features.feature_engine import PIPELINE_KEY_METADATA, FeaturePipelineError, code_version, stored_key
+
+config = read_yaml_file("src/config/config.yaml")
+
+# Rows of the application features joined at once in `join_client_features`
+CLIENT_JOIN_BATCH_ROWS = 65536
+ROW_NUMBER = "__row_number"
+
+
+class BuildNode:
+    """One build step: `fn(**kwargs)` writes its outputs and returns a small summary dict."""
+
+    def __init__(self, name: str, fn: Callable[..., Dict[str, Any]], kwargs: Optional[Mapping[str, Any]] = None,
+                 depends_on: Sequence[str] = ()):
+        self.name = name
+        self.fn = fn
+        self.kwargs = dict(kwargs or {})
+        self.depends_on = list(depends_on)
+
+    def __repr__(self) -> str:
+        return f"BuildNode({self.name!r}, depends_on={self.depends_on})"
+
+
+def chain_lengths(nodes: Sequence[BuildNode]) -> Dict[str, int]:
+    """Nodes on the longest chain from each node to the end of the build; fails on cycles and unknown dependencies."""
+    dependents: Dict[str, List[str]] = {node.name: [] for node in nodes}
+    for node in nodes:
+        for dependency in node.depends_on:
+            if dependency not in dependents:
+                raise FeaturePipelineError(f"{node.name} depends on the unknown node {dependency!r}")
+            dependents[dependency].append(node.name)
+    lengths: Dict[str, int] = {}
+    visiting: List[str] = []
+
+    def visit(name: str) -> int:
+        if name in lengths:
+            return lengths[name]
+        if name in visiting:
+            raise FeaturePipelineError(f"Build dependency cycle: {' -> '.join(visiting + [name])}")
+        visiting.append(name)
+        lengths[name] = 1 + max((visit(dependent) for dependent in dependents[name]), default=0)
+        visiting.pop()
+        return lengths[name]
+
+    for name in dependents:
+        visit(name)
+    return lengths
+
+
+def run_node(fn: Callable[..., Dict[str, Any]], kwargs: Mapping[str, Any], threads: int) -> Dict[str, Any]:
+    """Worker side of a node: its result, wall time and the peak RSS of the process."""
+    pa.set_cpu_count(threads)
+    pa.set_io_thread_count(threads)
+    started = time.perf_counter()
+    result = fn(**kwargs)
+    wall_s = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"result": result, "wall_s": wall_s, "peak_rss_mb": peak_rss / 2 ** 20}
+
+
+def run_build(nodes: Sequence[BuildNode], max_workers: Optional[int] = None,
+              threads_per_worker: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Run `nodes` in a pool of `max_workers` processes (one per CPU by default), each node once
+    the nodes it depends on succeeded. A failed node does not stop the others, but the nodes
+    depending on it are skipped.
+
+    Returns:
+    dict: per node name, in completion order: status ('done', 'failed' or 'skipped'), result,
+    error, wall_s and peak_rss_mb measured in the worker, and start_s and end_s since the
+    build started, the worker start-up included.
+    """
+    lengths = chain_lengths(nodes)
+    max_workers = max_workers or os.cpu_count() or 1
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // max_workers)
+    pending = sorted(nodes, key=lambda node: -lengths[node.name])
+    reports: Dict[str, Dict[str, Any]] = {}
+    running: Dict[Any, str] = {}
+    start_times: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    def report(name: str, status: str, **fields: Any) -> None:
+        reports[name] = {"status": status, "result": None, "error": None, "wall_s": None, "peak_rss_mb": None,
+                         "start_s": start_times.get(name), "end_s": time.perf_counter() - started, **fields}
+
+    # Spawned workers do not inherit the parent's threads; one task per process gives every
+    # node its own peak RSS. The workers' records are written to the parent's log file.
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                             max_tasks_per_child=1, initializer=log_to_parent,
+                             initargs=(parent_log_queue(),)) as pool:
+        while pending or running:
+            for node in list(pending):
+                failed = [name for name in node.depends_on if name in reports and reports[name]["status"] != "done"]
+                if failed:
+                    logger.warning(f"Skipping {node.name}: {', '.join(failed)} did not succeed")
+                    report(node.name, "skipped", error=f"{', '.join(failed)} did not succeed")
+                    pending.remove(node)
+                elif len(running) < max_workers and all(name in reports for name in node.depends_on):
+                    running[pool.submit(run_node, node.fn, node.kwargs, threads)] = node.name
+                    start_times[node.name] = time.perf_counter() - started
+                    pending.remove(node)
+                    logger.info(f"Started {node.name}")
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as error:
+                    logger.error(f"Building {name} failed: {error!r}")
+                    report(name, "failed", error=repr(error))
+                else:
+                    logger.info(f"Built {name} in {outcome['wall_s']:.1f}s, peak RSS {outcome['peak_rss_mb']:.0f} MB")
+                    report(name, "done", **outcome)
+    return reports
+
+
+def join_client_features(app_path: str, feature_paths: Sequence[str], output_path: str, key: str,
+                         force: bool = False) -> Dict[str, Any]:
+    """
+    Left join the per-client tables at `feature_paths` to the application features on `key`,
+    keeping the rows and their order, in batches of `CLIENT_JOIN_BATCH_ROWS` application rows.
+    Keyed on the keys of its inputs like `materialize`.
+    """
+    build_key = hashlib.sha256(json.dumps([stored_key(app_path), [stored_key(path) for path in feature_paths],
+                                           code_version(join_client_features)]).encode()).hexdigest()
+    if not force and stored_key(output_path) == build_key:
+        logger.info(f"Client features in {output_path} are up to date")
+        return {"output_path": output_path, "key": build_key, "rows": pq.read_metadata(output_path).num_rows, "cached": True}
+
+    tables = [pq.read_table(path) for path in feature_paths]
+    temp_path = f"{output_path}.tmp-{os.getpid()}"
+    writer, rows = None, 0
+    try:
+        for batch in pq.ParquetFile(app_path).iter_batches(batch_size=CLIENT_JOIN_BATCH_ROWS):
+            joined = pa.Table.from_batches([batch])
+            joined = joined.append_column(ROW_NUMBER, pa.array(range(rows, rows + joined.num_rows), pa.int64()))
+            for table in tables:
+                joined = joined.join(table, keys=key, join_type="left outer", use_threads=False)
+            joined = joined.sort_by(ROW_NUMBER).drop_columns([ROW_NUMBER])
+            if writer is None:
+                writer = pq.ParquetWriter(temp_path, joined.schema.with_metadata({PIPELINE_KEY_METADATA: build_key.encode()}))
+            writer.write_table(joined)
+            rows += joined.num_rows
+        if writer is None:
+            raise FeaturePipelineError(f"{app_path} has no rows")
+        writer.close()
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    logger.info(f"Joined {len(feature_paths)} per-client tables to {rows} application rows in {output_path}")
+    return {"output_path": output_path, "key": build_key, "rows": rows, "cached": False}
+
+
+def client_feature_tables(config: Dict[str, Any] = config) -> List[str]:
+    """Auxiliary aggregations with one row per client."""
+    return [spec.name for spec in aux_table_specs(config) if spec.group_by == config['PRIMARY_KEY']]
+
+
+def build_client_features(split: str, config: Dict[str, Any] = config, force: bool = False) -> Dict[str, Any]:
+    """Join the per-client aggregations to the application features of the 'train' or 'test' split."""
+    specs = {spec.name: spec for spec in aux_table_specs(config)}
+    return join_client_features(os.path.join(config['FEATURE_STORE_PATH'], config[f'APP_{split.upper()}_FEATURES_FILE_NAME']),
+                                [aux_output_path(specs[name], config) for name in client_feature_tables(config)],
+                                os.path.join(config['FEATURE_STORE_PATH'], config[f'CLIENT_{split.upper()}_FEATURES_FILE_NAME']),
+                                config['PRIMARY_KEY'], force=force)
+
+
+def feature_build_nodes(config: Dict[str, Any] = config, memory_budget_mb: Optional[float] = None,
+                        force: bool = False) -> List[BuildNode]:
+    """
+    The feature store build: application features per split, auxiliary aggregations after
+    the aggregations they join, and per split the client features joining all of them.
+    """
+    nodes = [BuildNode(f"app_{split}", build_app_features, {"split": split, "config": config, "force": force})
+             for split in ("train", "test")]
+    nodes += [BuildNode(spec.name, build_aux_table,
+                        {"name": spec.name, "config": config, "memory_budget_mb": memory_budget_mb, "force": force},
+                        depends_on=list(spec.joins))
+              for spec in aux_table_specs(config)]
+    nodes += [BuildNode(f"client_{split}", build_client_features, {"split": split, "config": config, "force": force},
+                        depends_on=[f"app_{split}", *client_feature_tables(config)])
+              for split in ("train", "test")]
+    return nodes
+
+
+def select_nodes(nodes: Sequence[BuildNode], names: Sequence[str]) -> List[BuildNode]:
+    """The nodes named in `names` and the nodes they depend on."""
+    by_name = {node.name: node for node in nodes}
+    needed = set()
+
+    def require(name: str) -> None:
+        if name not in needed:
+            needed.add(name)
+            for dependency in by_name[name].depends_on:
+                require(dependency)
+
+    for name in names:
+        require(name)
+    return [node for node in nodes if node.name in needed]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    nodes = feature_build_nodes()
+    parser = argparse.ArgumentParser(description="Build the feature store in parallel")
+    parser.add_argument("--workers", type=int, help="Processes building nodes at once (default: one per CPU)")
+    parser.add_argument("--only", nargs="+", choices=[node.name for node in nodes],
+                        help="Nodes to build, with the nodes they depend on (default: all)")
+    parser.add_argument("--memory-budget-mb", type=float,
+                        help="Per aggregation (default: AGGREGATION_MEMORY_BUDGET_MB of config.yaml)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the inputs and feature code are unchanged")
+    parser.add_argument("--report", help="Write the per-node report to this JSON file")
+    args = parser.parse_args(argv)
+
+    nodes = feature_build_nodes(memory_budget_mb=args.memory_budget_mb, force=args.force)
+    if args.only:
+        nodes = select_nodes(nodes, args.only)
+    started = time.perf_counter()
+    reports = run_build(nodes, max_workers=args.workers)
+    elapsed = time.perf_counter() - started
+    for name, report in reports.items():
+        timing = f"{report['wall_s']:.1f}s, peak RSS {report['peak_rss_mb']:.0f} MB" if report['wall_s'] is not None else report['error']
+        logger.info(f"{name}: {report['status']} ({timing})")
+    node_seconds = sum(report['wall_s'] or 0 for report in reports.values())
+    logger.info(f"Feature build took {elapsed:.1f}s for {node_seconds:.1f}s of node time")
+    if args.report:
+        with open(args.report, "w") as file_obj:
+            json.dump({"elapsed_s": elapsed, "node_seconds": node_seconds, "nodes": reports}, file_obj, indent=2, default=str)
+    if any(report['status'] != "done" for report in reports.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
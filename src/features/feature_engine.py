@@ -0,0 +1,328 @@
+"""
+Declarative feature pipelines.
+
+Every derived feature is a node naming the columns it reads; a pipeline resolves the nodes
+needed for a set of output columns, reads only the source columns they depend on and computes
+the nodes in dependency order. Ratio nodes of the same dependency level are computed together
+in one `compute_ratios` pass. Materialized outputs carry a key hashing the input file and the
+code of the nodes used, so an unchanged build is skipped, and a fingerprint per column hashing
+the source columns it reads and its definition, so a rebuild recomputes only the columns whose
+fingerprint changed and copies the others from the existing file.
+"""
+import hashlib
+import inspect
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.logging.custom_logging import logger
+from src.utils.other_utils import file_checksum
+from src.utils.feature_engineering import _ratio_kernel, compute_ratios
+
+# Parquet schema metadata key of a materialized output
+PIPELINE_KEY_METADATA = b"feature_pipeline_key"
+# Parquet schema metadata key of the input checksum, source column hashes and column fingerprints
+COLUMN_FINGERPRINTS_METADATA = b"feature_column_fingerprints"
+
+
+class FeaturePipelineError(Exception):
+    """A pipeline definition is inconsistent or its input lacks a source column."""
+
+
+def code_version(obj: Any) -> str:
+    """Short hash of the source code of a function (its repr when the source is unavailable)."""
+    obj = getattr(obj, "py_func", obj)  # Numba dispatchers
+    try:
+        source = inspect.getsource(obj)
+    except (OSError, TypeError):
+        source = repr(obj)
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+class FeatureNode:
+    """
+    One derived column: `fn(frame)` returns it from the `inputs` columns of `frame`.
+
+    Bump `version` when the feature changes in a way its code does not show, e.g. a changed
+    constant imported from elsewhere.
+    """
+
+    def __init__(self, name: str, inputs: Sequence[str], fn: Optional[Callable[[pd.DataFrame], Any]], version: str = "1"):
+        self.name = name
+        self.inputs = list(inputs)
+        self.fn = fn
+        self.version = version
+
+    def code(self) -> str:
+        return code_version(self.fn)
+
+    @property
+    def fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps([type(self).__name__, self.name, self.inputs, self.version,
+                                          self.code()]).encode()).hexdigest()
+
+    def compute(self, frame: pd.DataFrame) -> Any:
+        return self.fn(frame)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name!r}, inputs={self.inputs})"
+
+
+class RatioFeature(FeatureNode):
+    """numerator / denominator with the -1/-2/-3/-4 sentinels of `compute_ratios`."""
+
+    def __init__(self, name: str, numerator: str, denominator: str, version: str = "1"):
+        super().__init__(name, [numerator, denominator], None, version)
+
+    def code(self) -> str:
+        return code_version(compute_ratios) + code_version(_ratio_kernel)
+
+    def compute(self, frame: pd.DataFrame) -> Any:
+        return compute_ratios(frame, [self.inputs], names=[self.name])[self.name]
+
+
+class RowFilter:
+    """Rows kept by a pipeline: `fn(frame)` returns a boolean mask from the `inputs` columns."""
+
+    def __init__(self, name: str, inputs: Sequence[str], fn: Callable[[pd.DataFrame], Any], version: str = "1"):
+        self.name = name
+        self.inputs = list(inputs)
+        self.fn = fn
+        self.version = version
+
+    @property
+    def fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps(["RowFilter", self.name, self.inputs, self.version,
+                                          code_version(self.fn)]).encode()).hexdigest()
+
+
+class FeaturePipeline:
+    """
+    Feature nodes and row filters computed on demand.
+
+    Columns already present in the input frame are used as they are, so the same pipeline
+    serves raw tables (every node computed) and inference requests that carry some derived
+    features directly.
+    """
+
+    def __init__(self, nodes: Iterable[FeatureNode], filters: Iterable[RowFilter] = ()):
+        self.nodes: Dict[str, FeatureNode] = {}
+        for node in nodes:
+            if node.name in self.nodes:
+                raise FeaturePipelineError(f"Feature {node.name!r} is defined twice")
+            self.nodes[node.name] = node
+        self.filters = list(filters)
+        # Fails early on cycles
+        self.plan(list(self.nodes))
+
+    def plan(self, outputs: Sequence[str], available: Iterable[str] = ()) -> List[FeatureNode]:
+        """Nodes needed for `outputs`, dependencies first; names in `available` are not computed."""
+        available = set(available)
+        ordered: List[FeatureNode] = []
+        done, visiting = set(), []
+
+        def visit(name: str) -> None:
+            if name in done or name in available or name not in self.nodes:
+                return
+            if name in visiting:
+                raise FeaturePipelineError(f"Feature dependency cycle: {' -> '.join(visiting + [name])}")
+            visiting.append(name)
+            for input_name in self.nodes[name].inputs:
+                visit(input_name)
+            visiting.pop()
+            done.add(name)
+            ordered.append(self.nodes[name])
+
+        for name in outputs:
+            visit(name)
+        return ordered
+
+    def _targets(self, outputs: Sequence[str], apply_filters: bool) -> List[str]:
+        targets = list(outputs)
+        if apply_filters:
+            targets += [name for row_filter in self.filters for name in row_filter.inputs]
+        return list(dict.fromkeys(targets))
+
+    def source_columns(self, outputs: Sequence[str], available: Iterable[str] = (), apply_filters: bool = False) -> List[str]:
+        """Input columns needed to compute `outputs` (and the filter inputs), in first-use order."""
+        available = set(available)
+        targets = self._targets(outputs, apply_filters)
+        needed = [name for node in self.plan(targets, available) for name in node.inputs] + targets
+        return [name for name in dict.fromkeys(needed) if name not in self.nodes or name in available]
+
+    def ratio_specs(self, names: Sequence[str]) -> Dict[str, List[str]]:
+        """{name: [numerator, denominator]} of the ratio nodes among `names`."""
+        return {name: list(self.nodes[name].inputs) for name in names
+                if isinstance(self.nodes.get(name), RatioFeature)}
+
+    def fingerprint(self, outputs: Sequence[str], apply_filters: bool = False) -> str:
+        """Hash of the code and version of every node (and filter) used for `outputs`."""
+        parts = [node.fingerprint for node in self.plan(self._targets(outputs, apply_filters))]
+        if apply_filters:
+            parts += [row_filter.fingerprint for row_filter in self.filters]
+        return hashlib.sha256(json.dumps([list(outputs), parts]).encode()).hexdigest()
+
+    def column_fingerprints(self, outputs: Sequence[str], source_hashes: Dict[str, str], categorical: Sequence[str] = (),
+                            apply_filters: bool = False) -> Dict[str, str]:
+        """
+        {output: fingerprint}, hashing the definition of the nodes an output depends on and the
+        `source_hashes` of the source columns they read. With `apply_filters` every fingerprint
+        also covers the filters and their inputs, which decide the rows of all the columns.
+        """
+        rows = []
+        if apply_filters:
+            rows = [row_filter.fingerprint for row_filter in self.filters]
+            rows += [source_hashes[name] for name in self.source_columns([], apply_filters=True)]
+        return {name: hashlib.sha256(json.dumps([name, self.fingerprint([name]), rows, name in categorical,
+                                                 [source_hashes[source] for source in self.source_columns([name])]]
+                                                ).encode()).hexdigest()
+                for name in outputs}
+
+    def compute(self, df: pd.DataFrame, outputs: Sequence[str], apply_filters: bool = False) -> pd.DataFrame:
+        """
+        Frame of `outputs` computed from `df`, index preserved; only the nodes they depend on run.
+        With `apply_filters` rows failing a `RowFilter` are dropped.
+        """
+        targets = self._targets(outputs, apply_filters)
+        nodes = self.plan(targets, df.columns)
+        sources = self.source_columns(outputs, df.columns, apply_filters)
+        missing = [name for name in sources if name not in df.columns]
+        if missing:
+            raise FeaturePipelineError(f"Input lacks source columns {missing}")
+        frame = pd.DataFrame({name: df[name] for name in sources}, index=df.index)
+
+        # Level of a node: 1 + the highest level of the nodes it reads
+        levels: Dict[str, int] = {}
+        for node in nodes:
+            levels[node.name] = 1 + max((levels.get(name, 0) for name in node.inputs), default=0)
+        for level in sorted(set(levels.values())):
+            level_nodes = [node for node in nodes if levels[node.name] == level]
+            ratios = [node for node in level_nodes if isinstance(node, RatioFeature)]
+            if ratios:
+                computed = compute_ratios(frame, [node.inputs for node in ratios], names=[node.name for node in ratios])
+                for name in computed.columns:
+                    frame[name] = computed[name]
+            for node in level_nodes:
+                if not isinstance(node, RatioFeature):
+                    frame[node.name] = node.compute(frame)
+
+        if apply_filters and self.filters:
+            keep = pd.Series(True, index=frame.index)
+            for row_filter in self.filters:
+                keep &= pd.Series(row_filter.fn(frame), index=frame.index).astype(bool)
+            frame = frame.loc[keep]
+        return frame[list(outputs)]
+
+
+def read_columns(input_path: str, columns: Sequence[str]) -> pd.DataFrame:
+    """Only `columns` of a CSV or Parquet file."""
+    if input_path.endswith(".parquet"):
+        return pd.read_parquet(input_path, columns=list(columns))
+    return pd.read_csv(input_path, usecols=list(columns))
+
+
+def column_hash(values: pd.Series) -> str:
+    """Hash of the values of a column, independent of its name and index."""
+    return hashlib.sha256(pd.util.hash_pandas_object(values, index=False).values.tobytes()).hexdigest()
+
+
+def stored_fingerprints(output_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Fingerprints recorded in a materialized output: {"input": input checksum, "sources":
+    {source column: hash}, "columns": {output column: fingerprint}}; None if it has none.
+    """
+    if not os.path.exists(output_path):
+        return None
+    metadata = pq.read_schema(output_path).metadata or {}
+    fingerprints = metadata.get(COLUMN_FINGERPRINTS_METADATA)
+    return json.loads(fingerprints) if fingerprints is not None else None
+
+
+def stored_key(output_path: str) -> Optional[str]:
+    """Pipeline key of a materialized output, None if it has none or does not exist."""
+    if not os.path.exists(output_path):
+        return None
+    metadata = pq.read_schema(output_path).metadata or {}
+    key = metadata.get(PIPELINE_KEY_METADATA)
+    return key.decode() if key is not None else None
+
+
+def write_parquet(table: pa.Table, output_path: str) -> None:
+    """Write under a temporary name and rename, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    temp_path = f"{output_path}.tmp-{os.getpid()}"
+    pq.write_table(table, temp_path)
+    os.replace(temp_path, output_path)
+
+
+def materialize(pipeline: FeaturePipeline, input_path: str, output_path: str, outputs: Sequence[str],
+                categorical: Sequence[str] = (), apply_filters: bool = True, force: bool = False) -> Dict[str, Any]:
+    """
+    Compute `outputs` from the file at `input_path` into the Parquet file `output_path`.
+
+    The output is keyed on the checksum of the input file and `pipeline.fingerprint`; when the
+    existing output has the same key nothing is recomputed. Otherwise only the columns whose
+    `FeaturePipeline.column_fingerprints` changed are recomputed, reading just their source
+    columns; the others are copied as Arrow columns from the existing output, without a
+    round trip through pandas. Source columns are hashed only when the input file changed.
+    `categorical` columns are stored as categories, as in the notebooks.
+
+    Returns:
+    dict: output_path, key, rows, cached (True when the existing output was reused), recomputed
+    and carried_over (the output columns computed and copied).
+    """
+    input_checksum = file_checksum(input_path)
+    key = hashlib.sha256(json.dumps({"input": input_checksum,
+                                     "pipeline": pipeline.fingerprint(outputs, apply_filters),
+                                     "categorical": list(categorical)}).encode()).hexdigest()
+    if not force and stored_key(output_path) == key:
+        logger.info(f"Features in {output_path} are up to date")
+        return {"output_path": output_path, "key": key, "rows": pq.read_metadata(output_path).num_rows, "cached": True,
+                "recomputed": [], "carried_over": list(outputs)}
+
+    stored = None if force else stored_fingerprints(output_path)
+    source_hashes = dict(stored["sources"]) if stored and stored["input"] == input_checksum else {}
+    sources = pipeline.source_columns(outputs, apply_filters=apply_filters)
+    unhashed = [name for name in sources if name not in source_hashes]
+    df = read_columns(input_path, unhashed) if unhashed else pd.DataFrame()
+    source_hashes.update({name: column_hash(df[name]) for name in df.columns})
+    fingerprints = pipeline.column_fingerprints(outputs, source_hashes, categorical, apply_filters)
+
+    previous = stored["columns"] if stored else {}
+    carried_over = [name for name in outputs if previous.get(name) == fingerprints[name]]
+    recomputed = [name for name in outputs if name not in carried_over]
+    if recomputed:
+        needed = pipeline.source_columns(recomputed, apply_filters=apply_filters)
+        missing = [name for name in needed if name not in df.columns]
+        if missing:
+            extra = read_columns(input_path, missing)
+            df = pd.concat([df, extra], axis=1) if len(df.columns) else extra
+        features = pipeline.compute(df, recomputed, apply_filters=apply_filters).reset_index(drop=True)
+        for name in recomputed:
+            if name in categorical:
+                features[name] = features[name].astype("category")
+        computed = pa.Table.from_pandas(features, preserve_index=False)
+    else:
+        computed = None
+
+    columns = {}
+    if carried_over:
+        existing = pq.read_table(output_path, columns=carried_over, memory_map=True)
+        if computed is not None and existing.num_rows != computed.num_rows:
+            raise FeaturePipelineError(f"{output_path} has {existing.num_rows} rows, the recomputed columns "
+                                       f"{computed.num_rows}; rebuild it with force=True")
+        columns.update({name: existing.column(name) for name in carried_over})
+    if computed is not None:
+        columns.update({name: computed.column(name) for name in recomputed})
+    rows = len(next(iter(columns.values()))) if columns else 0
+    metadata = {PIPELINE_KEY_METADATA: key.encode(),
+                COLUMN_FINGERPRINTS_METADATA: json.dumps({"input": input_checksum, "sources": source_hashes,
+                                                          "columns": fingerprints}).encode()}
+    table = pa.Table.from_arrays([columns[name] for name in outputs], names=list(outputs)).replace_schema_metadata(metadata)
+    write_parquet(table, output_path)
+    logger.info(f"Materialized {rows} rows x {len(outputs)} features from {input_path} to {output_path}: "
+                f"{len(recomputed)} columns recomputed, {len(carried_over)} carried over")
+    return {"output_path": output_path, "key": key, "rows": rows, "cached": False,
+            "recomputed": recomputed, "carried_over": carried_over}
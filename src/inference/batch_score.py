@@ -0,0 +1,178 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.logging.custom_logging import logger
+from src.utils.other_utils import load_object, read_yaml_file
+from src.inference.preprocessing import inference_config, model_input_frame, selected_features
+from src.features.app_features_pipeline import APP_FEATURES
+from src.inference.explainers import load_explainer
+from src.inference.model_registry import ModelRegistry
+from src.inference.scoring import score_batch, top_3_reason_indices
+from src.inference.scorecard import scorecard
+
+ID_COLUMN = "SK_ID_CURR"
+
+# Model and explainer owned by each worker process
+_model = None
+_explainer = None
+
+
+def init_scoring_worker(model_path: str, explainer_path: str, explainer_backend: str, threads_per_worker: int) -> None:
+    """Process pool initializer: load the artifacts once and limit XGBoost to `threads_per_worker` threads."""
+    global _model, _explainer
+    _model = load_object(model_path)
+    _model.set_params(n_jobs=threads_per_worker)
+    _model.get_booster().set_param({"nthread": threads_per_worker})
+    _explainer = load_explainer(explainer_backend, _model, explainer_path, parity_check=False)
+
+
+def feature_store_files(config_path: str = "src/config/config.yaml") -> List[str]:
+    """
+    Application feature files (APP_TRAIN/TEST_FEATURES_FILE_NAME) of the project config that exist;
+    the auxiliary aggregates and client features next to them are not model inputs.
+    """
+    config = read_yaml_file(config_path)
+    paths = [os.path.join(config['FEATURE_STORE_PATH'], config[f'APP_{split}_FEATURES_FILE_NAME']) for split in ("TRAIN", "TEST")]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def list_chunks(input_paths: List[str], rows_per_chunk: int) -> List[Tuple[str, int, int, int]]:
+    """
+    (path, row group, first row, end row) chunks: every Parquet row group, split into slices of
+    at most `rows_per_chunk` rows so a file written as one big row group still fans out.
+    """
+    chunks = []
+    for path in input_paths:
+        metadata = pq.ParquetFile(path).metadata
+        for row_group in range(metadata.num_row_groups):
+            n_rows = metadata.row_group(row_group).num_rows
+            chunks += [(path, row_group, start, min(start + rows_per_chunk, n_rows))
+                       for start in range(0, n_rows, rows_per_chunk)]
+    return chunks
+
+
+def chunk_output_path(output_dir: str, input_path: str, row_group: int, start: int) -> str:
+    """Output partitioned by source file: <output_dir>/source=<file stem>/part-<row group>-<first row>.parquet."""
+    source = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"source={source}", f"part-{row_group:05d}-{start:010d}.parquet")
+
+
+def score_frame(model, explainer, df: pd.DataFrame, explain: bool = True) -> pd.DataFrame:
+    """
+    Score a feature store frame.
+
+    Returns:
+    pd.DataFrame: SK_ID_CURR (if present), prediction_prob, three_digit_score, risk_band and, with
+    `explain`, reason_1..3 with their SHAP values reason_1_shap..reason_3_shap, most influential first.
+    """
+    input_data = model_input_frame(df)
+    prediction_probs, shap_values = score_batch(model, explainer, input_data, explain=explain)
+    scores = pd.DataFrame(index=df.index)
+    if ID_COLUMN in df.columns:
+        scores[ID_COLUMN] = df[ID_COLUMN]
+    scores["prediction_prob"] = prediction_probs
+    # The API's scorecard, so offline and online scores agree
+    three_digit_scores = scorecard.scores(prediction_probs)
+    scores["three_digit_score"] = three_digit_scores
+    scores["risk_band"] = scorecard.risk_bands(three_digit_scores)
+    if explain:
+        reason_indices = top_3_reason_indices(shap_values, prediction_probs)
+        feature_names = np.asarray(input_data.columns)
+        reason_shap = np.take_along_axis(shap_values, reason_indices, axis=1)
+        for rank in range(reason_indices.shape[1]):
+            scores[f"reason_{rank + 1}"] = feature_names[reason_indices[:, rank]]
+            scores[f"reason_{rank + 1}_shap"] = reason_shap[:, rank]
+    return scores.reset_index(drop=True)
+
+
+def score_chunk(input_path: str, row_group: int, start: int, end: int, output_path: str,
+                explain: bool) -> Tuple[str, int, float]:
+    """
+    Score rows [start, end) of a row group with the worker's artifacts and write them to `output_path`.
+
+    The file is written under a temporary name and renamed, so an existing output file is
+    always complete and a rerun can skip it.
+
+    Returns:
+    tuple: (output path, number of rows, seconds spent).
+    """
+    started = time.perf_counter()
+    parquet_file = pq.ParquetFile(input_path)
+    needed = set(selected_features) | {ID_COLUMN} | set(APP_FEATURES.source_columns(selected_features))
+    columns = [name for name in parquet_file.schema_arrow.names if name in needed]
+    df = parquet_file.read_row_group(row_group, columns=columns).slice(start, end - start).to_pandas()
+
+    scores = score_frame(_model, _explainer, df, explain=explain)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_path = f"{output_path}.tmp-{os.getpid()}"
+    pq.write_table(pa.Table.from_pandas(scores, preserve_index=False), temp_path)
+    os.replace(temp_path, output_path)
+    return output_path, len(scores), time.perf_counter() - started
+
+
+def run(input_paths: List[str], output_dir: str, model_path: str, explainer_path: str, explainer_backend: str,
+        workers: int, threads_per_worker: int = 1, rows_per_chunk: int = 100000, explain: bool = True,
+        overwrite: bool = False) -> Dict[str, int]:
+    """
+    Score every chunk of `input_paths` on a process pool, skipping chunks already written.
+
+    Returns:
+    dict: Number of chunks scored and skipped and rows scored.
+    """
+    chunks = list_chunks(input_paths, rows_per_chunk)
+    pending = [(*chunk, chunk_output_path(output_dir, chunk[0], chunk[1], chunk[2])) for chunk in chunks]
+    if not overwrite:
+        pending = [chunk for chunk in pending if not os.path.exists(chunk[-1])]
+    logger.info(f"Batch scoring {len(pending)} of {len(chunks)} chunks from {len(input_paths)} files with {workers} workers")
+
+    start = time.perf_counter()
+    n_rows = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_scoring_worker,
+                             initargs=(model_path, explainer_path, explainer_backend, threads_per_worker)) as pool:
+        futures = [pool.submit(score_chunk, *chunk, explain) for chunk in pending]
+        for future in as_completed(futures):
+            output_path, chunk_rows, seconds = future.result()
+            n_rows += chunk_rows
+            logger.info(f"Wrote {chunk_rows} rows to {output_path} in {seconds:.2f}s")
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Batch scoring done: {n_rows} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):.0f} rows/s)")
+    return {"chunks_scored": len(pending), "chunks_skipped": len(chunks) - len(pending), "rows_scored": n_rows}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Score feature store Parquet files into partitioned Parquet output")
+    parser.add_argument("--input", nargs="*", default=None,
+                        help="Parquet files to score (default: the application feature files of src/config/config.yaml)")
+    parser.add_argument("--output", default="data/Scores")
+    parser.add_argument("--registry", default=inference_config['model_registry']['path'])
+    parser.add_argument("--model-version", default=None, help="Registry version to score with (default: its CURRENT)")
+    parser.add_argument("--explainer-backend", default=inference_config['explainer']['backend'], choices=["shap", "native"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--rows-per-chunk", type=int, default=100000,
+                        help="Chunk size; keep it fixed between a run and its resumption")
+    parser.add_argument("--no-explain", action="store_true", help="Skip SHAP reason codes")
+    parser.add_argument("--overwrite", action="store_true", help="Rescore chunks that already have output")
+    args = parser.parse_args(argv)
+
+    input_paths = args.input or feature_store_files()
+    if not input_paths:
+        raise SystemExit("No Parquet files to score")
+    registry = ModelRegistry(args.registry)
+    version = args.model_version or registry.current_version()
+    registry.verify(version)
+    model_path, explainer_path = registry.artifact_path(version, "model"), registry.artifact_path(version, "explainer")
+    logger.info(f"Scoring with model version {version}")
+    run(input_paths, args.output, model_path, explainer_path, args.explainer_backend, args.workers,
+        threads_per_worker=args.threads_per_worker, rows_per_chunk=args.rows_per_chunk, explain=not args.no_explain, overwrite=args.overwrite)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Load test of the prediction API with a machine-readable latency / throughput report.
+
+    python -m src.inference.benchmark --url http://localhost:8000 --requests 5000 --concurrency 32 \
+        --rate 500 --mix valid=0.8,invalid=0.1,missing=0.1 --output bench.json --max-p99-ms 50
+
+`--in-process` drives the ASGI app directly through httpx.ASGITransport instead of a server,
+running its startup (model load, warm-up) first. Payload kinds:
+
+- valid: synthetic requests built from the PredictionRequest examples (expected 200)
+- missing: valid requests with every optional field missing (expected 200)
+- invalid: requests breaking a validation rule or lacking a required field (expected 422 from
+  /predict; /predict/batch reports them per row with 200)
+
+A response with a status other than the one expected for its payload, or a transport error,
+counts as an error. With `--rate` requests are started on a fixed schedule (open loop) and
+latency is measured from the scheduled start, so a server falling behind shows up as latency
+instead of silently lowering the offered load. The `--max-*` / `--min-*` gates make the exit
+code 1 when the report breaks them.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+from src.inference.request_validation import PredictionRequest, synthetic_payloads
+
+PAYLOAD_KINDS = ("valid", "missing", "invalid")
+ENDPOINTS = {"predict": "/predict", "batch": "/predict/batch"}
+
+# One broken rule or absent required field per invalid payload, cycled
+_INVALID_OVERRIDES = [{"Client_Age": 10}, {"AMT_CREDIT": -1.0}, {"EXT_SOURCE_3": 1.5},
+                      {"ORGANIZATION_TYPE": "Unknown"}, {"AMT_ANNUITY": None}]
+_REQUIRED_FIELDS = [name for name, field in PredictionRequest.model_fields.items()
+                    if type(None) not in getattr(field.annotation, "__args__", ())]
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'valid=0.8,invalid=0.2' -> {'valid': 0.8, 'invalid': 0.2}, normalized to sum to 1."""
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in PAYLOAD_KINDS:
+            raise ValueError(f"Unknown payload kind {kind!r}, expected one of {', '.join(PAYLOAD_KINDS)}")
+        weights[kind] = float(weight) if weight else 1.0
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Payload mix weights must sum to more than 0")
+    return {kind: weight / total for kind, weight in weights.items()}
+
+
+def build_payloads(mix: Dict[str, float], n_payloads: int, seed: int = 0) -> List[Tuple[str, Dict[str, Any]]]:
+    """`n_payloads` (kind, payload) pairs drawn with the weights of `mix`."""
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=n_payloads)
+    valid = synthetic_payloads(max(n_payloads, 1))
+    payloads = []
+    for position, kind in enumerate(kinds):
+        payload = dict(valid[position])
+        if kind == "missing":
+            payload.update({name: None for name in PredictionRequest.model_fields if name not in _REQUIRED_FIELDS})
+        elif kind == "invalid":
+            override = _INVALID_OVERRIDES[position % len(_INVALID_OVERRIDES)]
+            payload.update(override)
+            if position % (len(_INVALID_OVERRIDES) + 1) == 0:
+                del payload[_REQUIRED_FIELDS[position % len(_REQUIRED_FIELDS)]]
+        payloads.append((kind, payload))
+    return payloads
+
+
+def expected_status(endpoint: str, kinds: List[str]) -> int:
+    if endpoint == "predict" and kinds[0] == "invalid":
+        return 422
+    return 200
+
+
+def latency_summary(latencies_s: List[float]) -> Dict[str, Optional[float]]:
+    """Mean, p50, p95, p99 and max in milliseconds (None without samples)."""
+    if not latencies_s:
+        return dict.fromkeys(["mean", "p50", "p95", "p99", "max"])
+    latencies_ms = np.asarray(latencies_s) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"mean": round(float(latencies_ms.mean()), 3), "p50": round(float(p50), 3), "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3), "max": round(float(latencies_ms.max()), 3)}
+
+
+async def run_load_test(client: httpx.AsyncClient, payloads: List[Tuple[str, Dict[str, Any]]], endpoint: str = "predict",
+                        concurrency: int = 16, rate: Optional[float] = None, batch_size: int = 1,
+                        explain: str = "top3", timeout_s: float = 10.0) -> Dict[str, Any]:
+    """
+    Send `payloads` with `concurrency` requests in flight, optionally started at `rate` per second.
+
+    Parameters:
+    - client: httpx.AsyncClient with base_url set (a server or an ASGITransport)
+    - endpoint: 'predict' (one payload per request) or 'batch' (`batch_size` payloads per request)
+
+    Returns:
+    dict: the report, see `build_report`
+    """
+    size = 1 if endpoint == "predict" else batch_size
+    calls = [payloads[start:start + size] for start in range(0, len(payloads), size)]
+    path = ENDPOINTS[endpoint]
+    results: List[Tuple[str, Optional[int], float, bool]] = []
+    next_call = 0
+    start = time.perf_counter()
+
+    async def worker():
+        nonlocal next_call
+        while next_call < len(calls):
+            position = next_call
+            next_call += 1
+            kinds = [kind for kind, _ in calls[position]]
+            body = calls[position][0][1] if endpoint == "predict" else [payload for _, payload in calls[position]]
+            scheduled = start + position / rate if rate else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            status = None
+            try:
+                response = await client.post(path, params={"explain": explain}, json=body, timeout=timeout_s)
+                status = response.status_code
+            except httpx.HTTPError:
+                pass
+            latency = time.perf_counter() - scheduled
+            results.append((kinds[0] if endpoint == "predict" else "batch", status, latency,
+                            status != expected_status(endpoint, kinds)))
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(calls)))))
+    return build_report(results, time.perf_counter() - start,
+                        endpoint=endpoint, n_payloads=len(payloads), concurrency=concurrency, target_rate=rate,
+                        batch_size=size, explain=explain)
+
+
+def build_report(results: List[Tuple[str, Optional[int], float, bool]], duration_s: float, **settings) -> Dict[str, Any]:
+    """
+    Report of (kind, status or None on a transport error, latency in seconds, is error) results:
+    settings, duration, throughput (requests per second), error rate, status counts and latency
+    percentiles overall and per payload kind.
+    """
+    n_requests = len(results)
+    n_errors = sum(result[3] for result in results)
+    status_counts: Dict[str, int] = {}
+    for _, status, _, _ in results:
+        key = str(status) if status is not None else "transport_error"
+        status_counts[key] = status_counts.get(key, 0) + 1
+    by_kind = {}
+    for kind in sorted({result[0] for result in results}):
+        kind_results = [result for result in results if result[0] == kind]
+        by_kind[kind] = {"requests": len(kind_results),
+                         "error_rate": round(sum(result[3] for result in kind_results) / len(kind_results), 6),
+                         "latency_ms": latency_summary([result[2] for result in kind_results])}
+    return {"settings": settings,
+            "requests": n_requests,
+            "duration_s": round(duration_s, 3),
+            "throughput_rps": round(n_requests / duration_s, 3) if duration_s > 0 else None,
+            "error_rate": round(n_errors / n_requests, 6) if n_requests else 0.0,
+            "status_counts": status_counts,
+            "latency_ms": latency_summary([result[2] for result in results]),
+            "by_kind": by_kind}
+
+
+def check_gates(report: Dict[str, Any], max_p99_ms: Optional[float] = None, max_p95_ms: Optional[float] = None,
+                max_error_rate: Optional[float] = None, min_throughput: Optional[float] = None) -> List[str]:
+    """Violated release gates, empty when the report passes all the given ones."""
+    failures = []
+    latency = report["latency_ms"]
+    if max_p99_ms is not None and (latency["p99"] is None or latency["p99"] > max_p99_ms):
+        failures.append(f"p99 latency {latency['p99']} ms > {max_p99_ms} ms")
+    if max_p95_ms is not None and (latency["p95"] is None or latency["p95"] > max_p95_ms):
+        failures.append(f"p95 latency {latency['p95']} ms > {max_p95_ms} ms")
+    if max_error_rate is not None and report["error_rate"] > max_error_rate:
+        failures.append(f"error rate {report['error_rate']} > {max_error_rate}")
+    if min_throughput is not None and (report["throughput_rps"] or 0) < min_throughput:
+        failures.append(f"throughput {report['throughput_rps']} req/s < {min_throughput} req/s")
+    return failures
+
+
+async def benchmark(url: Optional[str], payloads: List[Tuple[str, Dict[str, Any]]], **options) -> Dict[str, Any]:
+    """`run_load_test` against the server at `url`, or in-process against `app.app` when `url` is None."""
+    limits = httpx.Limits(max_connections=options.get("concurrency", 16))
+    if url is not None:
+        async with httpx.AsyncClient(base_url=url, limits=limits) as client:
+            return await run_load_test(client, payloads, **options)
+
+    from app import app
+    # ASGITransport does not send lifespan events, so run the startup and shutdown here
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver",
+                                     limits=limits) as client:
+            return await run_load_test(client, payloads, **options)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the Credit Risk API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:8000")
+    target.add_argument("--in-process", action="store_true", help="Call the ASGI app directly instead of a server")
+    parser.add_argument("--endpoint", choices=list(ENDPOINTS), default="predict")
+    parser.add_argument("--requests", type=int, default=1000, help="Payloads to send")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=None, help="Requests started per second; default: as fast as possible")
+    parser.add_argument("--batch-size", type=int, default=100, help="Payloads per /predict/batch request")
+    parser.add_argument("--mix", default="valid=1", help="Payload kinds and weights, e.g. valid=0.8,invalid=0.1,missing=0.1")
+    parser.add_argument("--explain", choices=["none", "top3", "full"], default="top3")
+    parser.add_argument("--timeout-s", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--max-error-rate", type=float, default=None)
+    parser.add_argument("--min-throughput", type=float, default=None, help="Requests per second")
+    args = parser.parse_args(argv)
+
+    payloads = build_payloads(parse_mix(args.mix), args.requests, seed=args.seed)
+    report = asyncio.run(benchmark(None if args.in_process else args.url, payloads,
+                                   endpoint=args.endpoint, concurrency=args.concurrency, rate=args.rate,
+                                   batch_size=args.batch_size, explain=args.explain, timeout_s=args.timeout_s))
+    report["gate_failures"] = check_gates(report, args.max_p99_ms, args.max_p95_ms, args.max_error_rate, args.min_throughput)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            file_obj.write(output)
+    print(output)
+    return 1 if report["gate_failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
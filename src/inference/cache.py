@@ -0,0 +1,90 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import diskcache
+
+
+class PredictionCache:
+    """
+    LRU cache with a TTL for scored requests, optionally backed by a shared on-disk cache.
+
+    Keys are a hash of the canonicalized validated features, the explain mode and the
+    model version passed to `key`, e.g. the checksum of the model version that scores
+    them: a new version makes every old key unreachable, including on disk.
+
+    Parameters:
+    - max_entries: int, size of the in-process LRU
+    - ttl_s: float, lifetime of an entry in seconds
+    - disk_path: str or None, directory of a `diskcache.Cache` shared by gunicorn workers
+    - disk_size_limit_mb: int, size limit of the on-disk cache
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_s: float = 600, disk_path: Optional[str] = None,
+                 disk_size_limit_mb: int = 256):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._disk = diskcache.Cache(disk_path, size_limit=disk_size_limit_mb * 1024 * 1024)
+
+    def key(self, features: Dict[str, Any], model_version: str, explain: str = "full") -> str:
+        """Cache key for validated request features (e.g. `PredictionRequest.model_dump()`) scored by `model_version`."""
+        canonical = json.dumps(features, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(f"{model_version}|{explain}|{canonical}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        if self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                self._set_local(key, value, now)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _set_local(self, key: str, value: Any, now: float) -> None:
+        with self._lock:
+            self._entries[key] = (now + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Any) -> None:
+        self._set_local(key, value, time.monotonic())
+        if self._disk is not None:
+            self._disk.set(key, value, expire=self.ttl_s)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "disk_entries": len(self._disk) if self._disk is not None else None,
+        }
@@ -0,0 +1,135 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+from src.logging.custom_logging import logger
+from src.utils.other_utils import load_object
+from src.inference.explainers import load_explainer
+from src.inference.scoring import score_requests
+from src.inference.preprocessing import threshold
+
+
+class InferenceSaturatedError(Exception):
+    """Raised when the inference pool and its queue are full."""
+
+
+class InferenceExecutor:
+    """
+    Bounded pool that runs CPU-bound inference outside the asyncio event loop.
+
+    At most `max_workers` calls run at once and at most `max_queue` more may wait for a
+    free worker. Beyond that, `saturation_policy` decides what happens:
+    - 'reject': raise InferenceSaturatedError straight away
+    - 'wait': wait up to `queue_timeout_s` for a slot, then raise InferenceSaturatedError
+
+    Parameters:
+    - kind: str, 'thread' (XGBoost and SHAP release the GIL in native code) or 'process'
+    - max_workers: int, number of threads or processes
+    - max_queue: int, number of calls allowed to wait for a worker
+    - saturation_policy: str, 'reject' or 'wait'
+    - queue_timeout_s: float, how long to wait for a slot with the 'wait' policy
+    - initializer, initargs: passed to the underlying pool, e.g. to load the model in each process
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 4, max_queue: int = 64,
+                 saturation_policy: str = "reject", queue_timeout_s: float = 1.0,
+                 initializer: Optional[Callable] = None, initargs: tuple = ()):
+        if kind not in ("thread", "process"):
+            raise ValueError("kind must be one of thread, process")
+        if saturation_policy not in ("reject", "wait"):
+            raise ValueError("saturation_policy must be one of reject, wait")
+        if max_workers < 1 or max_queue < 0:
+            raise ValueError("max_workers must be at least 1 and max_queue greater than or equal to 0")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.saturation_policy = saturation_policy
+        self.queue_timeout_s = queue_timeout_s
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+
+    def set_initializer(self, initializer: Callable, initargs: tuple = ()) -> None:
+        """Set the per-worker initializer; takes effect on the next `start`."""
+        self._initializer = initializer
+        self._initargs = initargs
+
+    def start(self) -> None:
+        if self._pool is not None:
+            return
+        if self.kind == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference",
+                                            initializer=self._initializer, initargs=self._initargs)
+        else:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             initializer=self._initializer, initargs=self._initargs)
+        self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        logger.info(f"Inference {self.kind} pool started (max_workers={self.max_workers}, max_queue={self.max_queue}, policy={self.saturation_policy})")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        logger.info("Inference pool stopped")
+
+    async def _acquire(self) -> None:
+        if self.saturation_policy == "reject":
+            if self._slots.locked():
+                raise InferenceSaturatedError(f"{self.in_flight} inference calls in flight")
+            await self._slots.acquire()
+            return
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            raise InferenceSaturatedError(f"No inference slot free after {self.queue_timeout_s}s")
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """Run `fn(*args)` on the pool and await its result."""
+        if self._pool is None:
+            self.start()
+        await self._acquire()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, partial(fn, *args))
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+
+# Model and explainer of each model version, owned by each worker process when kind='process'.
+# Keyed on (model path, explainer path, explainer backend); the newest versions are kept so
+# requests still running on the previous version after a swap do not reload it.
+_worker_artifacts = OrderedDict()
+_worker_default = None
+MAX_WORKER_VERSIONS = 2
+
+
+def _load_worker_artifacts(artifacts: Tuple[str, str, str]) -> tuple:
+    if artifacts not in _worker_artifacts:
+        model_path, explainer_path, explainer_backend = artifacts
+        model = load_object(model_path)
+        # Parity was already checked by the parent process
+        _worker_artifacts[artifacts] = (model, load_explainer(explainer_backend, model, explainer_path, parity_check=False))
+        while len(_worker_artifacts) > MAX_WORKER_VERSIONS:
+            _worker_artifacts.popitem(last=False)
+    return _worker_artifacts[artifacts]
+
+
+def init_worker(model_path: str, explainer_path: str, explainer_backend: str = "shap") -> None:
+    """Process pool initializer: load the artifacts once per worker process."""
+    global _worker_default
+    _worker_default = (model_path, explainer_path, explainer_backend)
+    _load_worker_artifacts(_worker_default)
+
+
+def score_requests_in_worker(requests: list, explain: str = "full", artifacts: Optional[Tuple[str, str, str]] = None,
+                             threshold: float = threshold) -> list:
+    """
+    `score_requests` against the artifacts loaded by `init_worker`, or against `artifacts`
+    (model path, explainer path, explainer backend), loaded on first use.
+    """
+    model, explainer = _load_worker_artifacts(artifacts or _worker_default)
+    return score_requests(model, explainer, requests, explain, threshold=threshold)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from typing import Optional, Union
+from src.logging.custom_logging import logger
+from src.utils.other_utils import load_object
+from src.inference.preprocessing import inference_config
+from src.inference.fast_path import FeaturePlan, parity_requests
+
+
+class NativeTreeExplainer:
+    """
+    Drop-in replacement for the pickled `shap.TreeExplainer` using XGBoost's own TreeSHAP.
+
+    `shap_values` calls `Booster.predict(..., pred_contribs=True)`, which computes exact
+    TreeSHAP in native multithreaded code, so the `shap` package is not needed at serving
+    time. Only the trees used by `predict_proba` (up to the best iteration) are explained.
+    """
+
+    def __init__(self, model):
+        self.booster = model.get_booster()
+        best_iteration = getattr(model, "best_iteration", None)
+        self.iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+        # The bias column of pred_contribs is the same for every row
+        empty_row = np.full((1, len(self.booster.feature_names)), np.nan)
+        self.expected_value = float(self._contributions(empty_row)[0, -1])
+
+    def _dmatrix(self, X: Union[pd.DataFrame, np.ndarray]) -> xgb.DMatrix:
+        if isinstance(X, pd.DataFrame):
+            return xgb.DMatrix(X, enable_categorical=True)
+        return xgb.DMatrix(X, feature_names=self.booster.feature_names,
+                           feature_types=self.booster.feature_types, enable_categorical=True)
+
+    def _contributions(self, X: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        return self.booster.predict(self._dmatrix(X), pred_contribs=True, iteration_range=self.iteration_range)
+
+    def shap_values(self, X: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        """SHAP values of shape (n_rows, n_features), in log-odds like `shap.TreeExplainer`."""
+        return self._contributions(X)[:, :-1]
+
+    def check_parity(self, reference_explainer, X: np.ndarray, tolerance: float = 1e-5) -> float:
+        """
+        Compare attributions with a reference explainer (e.g. the pickled `shap.TreeExplainer`).
+
+        Returns:
+        float: The largest absolute difference in SHAP values or expected value.
+
+        Raises:
+        ValueError: If any difference exceeds `tolerance`.
+        """
+        max_diff = max(float(np.max(np.abs(self.shap_values(X) - np.asarray(reference_explainer.shap_values(X))))),
+                       abs(self.expected_value - float(np.ravel(reference_explainer.expected_value)[0])))
+        if max_diff > tolerance:
+            raise ValueError(f"Native TreeSHAP differs from the reference explainer by {max_diff} (tolerance {tolerance})")
+        logger.info(f"Native TreeSHAP parity check passed on {len(X)} rows (max difference {max_diff})")
+        return max_diff
+
+
+def load_explainer(backend: str, model, explainer_path: str, parity_check: bool = True,
+                   tolerance: float = 1e-5, parity_rows: Optional[np.ndarray] = None):
+    """
+    Build the explainer for the configured backend.
+
+    - 'shap': unpickle the `shap.TreeExplainer` stored at `explainer_path`
+    - 'native': `NativeTreeExplainer` on the model. With `parity_check` its attributions are
+      compared with the pickled explainer on `parity_rows` (synthetic requests by default);
+      on a mismatch the pickled explainer is used instead.
+    """
+    if backend == "shap":
+        return load_object(explainer_path)
+    if backend != "native":
+        raise ValueError("Explainer backend must be one of shap, native")
+
+    explainer = NativeTreeExplainer(model)
+    if parity_check:
+        reference_explainer = load_object(explainer_path)
+        if parity_rows is None:
+            parity_rows = FeaturePlan.from_config(inference_config).encode(parity_requests())
+        try:
+            explainer.check_parity(reference_explainer, parity_rows, tolerance=tolerance)
+        except ValueError as e:
+            logger.error(f"Native explainer disabled: {e}")
+            return reference_explainer
+    logger.info("Using native XGBoost TreeSHAP explainer")
+    return explainer
@@ -0,0 +1,200 @@
+import threading
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, get_args
+from src.logging.custom_logging import logger
+from src.features.app_features_pipeline import APP_FEATURES
+from src.inference.preprocessing import preprocessing, get_top_3_shap_features, category_levels, threshold
+from src.inference.request_validation import PredictionRequest, example_payload
+from src.inference.metrics import stage_timer
+
+
+def ratio_value(numerator: Optional[float], denominator: Optional[float]) -> float:
+    """
+    Scalar version of `compute_ratio_columnwise` with the same handling rules:
+    -3 if both are missing, -1 if only the numerator is missing, -2 if only the
+    denominator is missing, -4 if the denominator is 0, otherwise the ratio rounded to 2 decimals.
+    """
+    numerator_missing = numerator is None or np.isnan(numerator)
+    denominator_missing = denominator is None or np.isnan(denominator)
+    if numerator_missing and denominator_missing:
+        return -3.0
+    if numerator_missing:
+        return -1.0
+    if denominator_missing:
+        return -2.0
+    if denominator == 0:
+        return -4.0
+    return float(np.round(np.float64(numerator) / np.float64(denominator), 2))
+
+
+class FeaturePlan:
+    """
+    Precompiled mapping from a validated `PredictionRequest` to the model's feature row.
+
+    Built once from `inference_config.yaml`, it replaces the per-request DataFrame work in
+    `preprocessing` (ratio computation, category casting, column selection) with a fixed
+    list of steps writing straight into a NumPy row. Categories are encoded to the codes
+    the model was trained on; unknown categories and missing values become NaN.
+    """
+
+    def __init__(self, selected_features: List[str], categorical_features: List[str],
+                 category_levels: Dict[str, List[str]], ratio_features: Dict[str, List[str]]):
+        self.feature_names = list(selected_features)
+        self._steps = []
+        for position, name in enumerate(self.feature_names):
+            if name in ratio_features:
+                numerator, denominator = ratio_features[name]
+                self._steps.append((position, name, "ratio", (numerator, denominator)))
+            elif name in categorical_features:
+                codes = {level: float(code) for code, level in enumerate(category_levels[name])}
+                self._steps.append((position, name, "category", codes))
+            else:
+                self._steps.append((position, name, "raw", None))
+        # One preallocated row per thread, reused by single-row requests
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, inference_config: dict) -> "FeaturePlan":
+        return cls(selected_features=inference_config['selected_features'],
+                   categorical_features=inference_config['categorical_features'],
+                   category_levels=inference_config['category_levels'],
+                   ratio_features=APP_FEATURES.ratio_specs(inference_config['selected_features']))
+
+    def _single_row(self) -> np.ndarray:
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = np.empty((1, len(self.feature_names)), dtype=np.float64)
+            self._local.row = row
+        return row
+
+    def _value(self, values: Dict[str, Any], name: str, kind: str, spec: Any) -> float:
+        if kind == "ratio":
+            return ratio_value(values[spec[0]], values[spec[1]])
+        if kind == "category":
+            return spec.get(values[name], np.nan)
+        value = values[name]
+        return np.nan if value is None else value
+
+    def encode(self, requests: List[PredictionRequest]) -> np.ndarray:
+        """
+        Encode requests into a (n_requests, n_features) float64 matrix in model column order.
+
+        For a single request the returned row is a per-thread buffer that is overwritten by
+        the next call on the same thread.
+        """
+        rows = self._single_row() if len(requests) == 1 else np.empty((len(requests), len(self.feature_names)), dtype=np.float64)
+        for i, request in enumerate(requests):
+            values = request.__dict__
+            for position, name, kind, spec in self._steps:
+                rows[i, position] = self._value(values, name, kind, spec)
+        return rows
+
+    def model_features(self, request: PredictionRequest) -> Dict[str, Any]:
+        """Model inputs in the same shape as `preprocessing(...).to_dict(orient="records")`."""
+        values = request.__dict__
+        features = {}
+        for _, name, kind, spec in self._steps:
+            if kind == "ratio":
+                features[name] = ratio_value(values[spec[0]], values[spec[1]])
+            elif kind == "category":
+                features[name] = values[name] if values[name] in spec else np.nan
+            else:
+                features[name] = np.nan if values[name] is None else values[name]
+        return features
+
+
+class FastPathScorer:
+    """
+    Score requests through a `FeaturePlan` and XGBoost's in-place prediction, skipping pandas.
+
+    Uses the same number of trees as `model.predict_proba`, i.e. up to the best iteration
+    when the model was trained with early stopping. With a `compiled_model` (see
+    `src.inference.tree_compiler`) probabilities come from the Numba evaluator instead.
+    """
+
+    def __init__(self, plan: FeaturePlan, model, explainer, compiled_model=None, threshold: float = threshold):
+        self.plan = plan
+        self.booster = model.get_booster()
+        self.explainer = explainer
+        self.compiled_model = compiled_model
+        self.threshold = threshold
+        best_iteration = getattr(model, "best_iteration", None)
+        self.iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+
+    def predict_proba(self, rows: np.ndarray) -> np.ndarray:
+        if self.compiled_model is not None:
+            return self.compiled_model.predict_proba(rows)
+        return self.booster.inplace_predict(rows, iteration_range=self.iteration_range)
+
+    def score_requests(self, requests: List[PredictionRequest], explain: str = "full") -> list:
+        """Same output as `score_requests` in `src.inference.scoring`."""
+        with stage_timer("preprocessing"):
+            rows = self.plan.encode(requests)
+            model_features = [self.plan.model_features(request) for request in requests]
+        with stage_timer("predict_proba"):
+            prediction_probs = self.predict_proba(rows).tolist()
+        if explain == "none":
+            return [(features, prob, {}, {}) for features, prob in zip(model_features, prediction_probs)]
+        with stage_timer("shap"):
+            shap_values = np.asarray(self.explainer.shap_values(rows))
+        all_shap_dicts = [dict(zip(self.plan.feature_names, shap_row)) for shap_row in shap_values.tolist()]
+        with stage_timer("top_3_shap_features"):
+            top_shap_dicts = [get_top_3_shap_features(shap_values=all_shap_dict, prob=prob, threshold=self.threshold)
+                              for all_shap_dict, prob in zip(all_shap_dicts, prediction_probs)]
+        return list(zip(model_features, prediction_probs, all_shap_dicts, top_shap_dicts))
+
+    def check_parity(self, model, requests: Optional[List[PredictionRequest]] = None, tolerance: float = 1e-6) -> float:
+        """
+        Compare fast path probabilities and SHAP values with the pandas `preprocessing` path.
+
+        Returns:
+        float: The largest absolute difference found.
+
+        Raises:
+        ValueError: If any difference exceeds `tolerance`.
+        """
+        requests = requests if requests is not None else parity_requests()
+        input_data = preprocessing(pd.DataFrame([request.model_dump() for request in requests]))
+        expected_probs = model.predict_proba(input_data)[:, 1]
+        expected_shap = np.asarray(self.explainer.shap_values(input_data))
+
+        rows = self.plan.encode(requests)
+        max_diff = max(float(np.max(np.abs(self.predict_proba(rows) - expected_probs))),
+                       float(np.max(np.abs(np.asarray(self.explainer.shap_values(rows)) - expected_shap))))
+        if max_diff > tolerance:
+            raise ValueError(f"Fast path differs from the pandas path by {max_diff} (tolerance {tolerance})")
+        logger.info(f"Fast path parity check passed on {len(requests)} requests (max difference {max_diff})")
+        return max_diff
+
+
+def parity_requests(n_random: int = 200, random_state: int = 42) -> List[PredictionRequest]:
+    """
+    Synthetic requests covering every category level, every missing optional field,
+    the ratio sentinels and random values within the validated ranges.
+    """
+    base = example_payload()
+    payloads = [base]
+    for field, levels in category_levels.items():
+        payloads += [{**base, field: level} for level in levels]
+    for name, field in PredictionRequest.model_fields.items():
+        if type(None) in get_args(field.annotation):
+            payloads.append({**base, name: None})
+
+    rng = np.random.default_rng(random_state)
+    organization_types = category_levels["ORGANIZATION_TYPE"]
+    education_types = category_levels["NAME_EDUCATION_TYPE"]
+    for _ in range(n_random):
+        payloads.append({
+            "EXT_SOURCE_3": None if rng.random() < 0.2 else float(rng.random()),
+            "EXT_SOURCE_2": None if rng.random() < 0.05 else float(rng.random()),
+            "EXT_SOURCE_1": None if rng.random() < 0.5 else float(rng.random()),
+            "AMT_CREDIT": float(rng.uniform(40000, 2000000)),
+            "AMT_ANNUITY": float(rng.uniform(2000, 100000)),
+            "AMT_GOODS_PRICE": None if rng.random() < 0.05 else float(rng.uniform(40000, 2000000)),
+            "Client_Age": int(rng.integers(20, 70)),
+            "employment_years": None if rng.random() < 0.2 else int(rng.integers(0, 40)),
+            "NAME_EDUCATION_TYPE": str(rng.choice(education_types)),
+            "ORGANIZATION_TYPE": str(rng.choice(organization_types)),
+        })
+    return [PredictionRequest.model_validate(payload, context={"metrics": False}) for payload in payloads]
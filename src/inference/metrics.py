@@ -0,0 +1,47 @@
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+# Under gunicorn, PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py) makes every process write
+# its samples to files in that directory; /metrics then aggregates all workers.
+
+STAGES = ["validation", "preprocessing", "predict_proba", "shap", "top_3_shap_features", "serialization"]
+
+REQUESTS = Counter("prediction_http_requests_total", "HTTP requests by endpoint and status code",
+                   ["endpoint", "status"])
+ERRORS = Counter("prediction_http_errors_total", "HTTP responses with status >= 400 by endpoint and status code",
+                 ["endpoint", "status"])
+REQUEST_SECONDS = Histogram("prediction_http_request_seconds", "End-to-end request latency by endpoint",
+                            ["endpoint"],
+                            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+STAGE_SECONDS = Histogram("prediction_stage_seconds", "Time spent in each stage of the prediction path",
+                          ["stage"],
+                          buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0))
+BATCH_SIZE = Histogram("prediction_batch_size", "Rows per /predict/batch request and requests per micro-batch",
+                       ["source"],
+                       buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 5000, 10000))
+FAILED_ROWS = Counter("prediction_batch_failed_rows_total", "Batch rows rejected by validation")
+WARM_UP_SECONDS = Histogram("prediction_warm_up_seconds", "Duration of the model warm-up at worker startup and before a model swap",
+                            ["trigger"],
+                            buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+SHADOW_ROWS = Counter("prediction_shadow_rows_total", "Rows mirrored to the challenger model by outcome (scored, dropped, failed)",
+                      ["outcome"])
+
+
+def stage_timer(stage: str):
+    """Context manager observing the duration of one prediction stage, e.g. `with stage_timer("shap"):`."""
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+
+def metrics_payload() -> tuple:
+    """
+    Latest metrics in the Prometheus text format.
+
+    Returns:
+    tuple: (body bytes, content type). In multiprocess mode the samples of all processes are aggregated.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
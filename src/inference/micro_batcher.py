@@ -0,0 +1,135 @@
+import asyncio
+import time
+from functools import partial
+from typing import Any, Awaitable, Callable, List, Optional, Set
+from src.logging.custom_logging import logger
+from src.inference.executor import InferenceSaturatedError
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-row requests into one model call.
+
+    Requests submitted within `max_wait_ms` of the first queued request (or until
+    `max_batch_size` rows are waiting) are passed together to `score_fn`, which runs
+    in an executor so the event loop keeps serving other requests. Each caller gets
+    back its own element of the list returned by `score_fn`.
+
+    Up to `max_concurrency` batches run at once; while they all run, new rows keep queueing
+    and go out in the next batch. Once `max_queue` rows are waiting, `submit` raises
+    InferenceSaturatedError.
+
+    Parameters:
+    - score_fn: Callable taking a list of items and returning a list of results of the same length
+    - max_batch_size: int, maximum number of rows scored in one call
+    - max_wait_ms: float, how long to wait for more rows once the first one arrived
+    - run_fn: optional coroutine function `run_fn(score_fn, items)` used to execute a batch,
+      e.g. `InferenceExecutor.run`. Defaults to the event loop's default executor.
+    - max_concurrency: int, number of batches running at once, e.g. the executor's max_workers
+    - max_queue: int, number of rows allowed to wait for a batch
+    """
+
+    def __init__(self, score_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 64, max_wait_ms: float = 2.0,
+                 run_fn: Optional[Callable[..., Awaitable[Any]]] = None, max_concurrency: int = 1,
+                 max_queue: int = 1024):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be greater than or equal to 0")
+        if max_concurrency < 1 or max_queue < 1:
+            raise ValueError("max_concurrency and max_queue must be at least 1")
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.run_fn = run_fn
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Micro-batcher started (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000}, "
+                    f"max_concurrency={self.max_concurrency}, max_queue={self.max_queue})")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for batch in list(self._batches):
+            batch.cancel()
+        await asyncio.gather(*self._batches, return_exceptions=True)
+        # Nothing will serve requests still waiting in the queue
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+        logger.info("Micro-batcher stopped")
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result."""
+        if self._task is None:
+            raise RuntimeError("Micro-batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            raise InferenceSaturatedError(f"{self._queue.qsize()} rows waiting for a micro-batch")
+        return await future
+
+    async def _collect(self) -> list:
+        # Block for the first item, then keep collecting until the window closes or the batch is full
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _execute(self, items: List[Any]) -> List[Any]:
+        if self.run_fn is not None:
+            return await self.run_fn(self.score_fn, items)
+        return await asyncio.get_running_loop().run_in_executor(None, self.score_fn, items)
+
+    async def _run_batch(self, batch: list) -> None:
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            results = await self._execute(items)
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            logger.error(f"Micro-batch of {len(items)} rows failed")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    async def _run(self) -> None:
+        while True:
+            # Rows keep queueing while every slot is busy, so the next batch is fuller
+            await self._slots.acquire()
+            batch = await self._collect()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(partial(self._batch_done, batch))
+
+    def _batch_done(self, batch: list, task: asyncio.Task) -> None:
+        self._batches.discard(task)
+        # Callers still waiting, e.g. when the batch was cancelled by `stop`, are cancelled too
+        for _, future in batch:
+            future.cancel()
@@ -0,0 +1,378 @@
+"""
+Versioned model artifacts and the version currently serving requests.
+
+Registry layout:
+
+    models/registry/
+        CURRENT                   name of the version to serve
+        LAST_GOOD                 last version a service loaded, the fallback when CURRENT does not load
+        v1/
+            manifest.json         version, artifact files, features, threshold, SHA-256 checksums
+            xgboost_model.pkl
+            explainer.pkl
+            xgboost_model_compiled/   optional, see `src.inference.tree_compiler`
+
+Publish a retrained model with
+`python -m src.inference.model_registry publish --version v2 --model ... --explainer ... --activate`;
+running services pick up the new CURRENT, see `ActiveModel.watch`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+from src.logging.custom_logging import logger
+from src.utils.other_utils import file_checksum, load_object
+from src.inference.metrics import WARM_UP_SECONDS
+from src.inference.request_validation import PredictionRequest, synthetic_payloads
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+LAST_GOOD_FILE = "LAST_GOOD"
+
+
+class ModelRegistryError(Exception):
+    """A version is unknown, incomplete or does not match its manifest."""
+
+
+class ModelVersionNotFound(ModelRegistryError):
+    """No version of that name (or no CURRENT version) in the registry."""
+
+
+class ModelVersionExists(ModelRegistryError):
+    """A version of that name is already published; versions are immutable."""
+
+
+class ModelVersionCorrupt(ModelRegistryError):
+    """The artifacts of a version do not match its manifest."""
+
+
+def directory_checksums(root: str, relative_to: str) -> Dict[str, str]:
+    """SHA-256 of every file under `root`, keyed by path relative to `relative_to`."""
+    checksums = {}
+    for directory, _, file_names in sorted(os.walk(root)):
+        for file_name in sorted(file_names):
+            path = os.path.join(directory, file_name)
+            checksums[os.path.relpath(path, relative_to)] = file_checksum(path)
+    return checksums
+
+
+class ModelRegistry:
+    """
+    Directory of immutable model versions plus a CURRENT pointer.
+
+    A version directory is never modified after `publish`; switching versions only rewrites
+    CURRENT, atomically, so every process watching it sees either the old or the new name.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def version_dir(self, version: str) -> str:
+        if not version or version != os.path.basename(version) or version.startswith("."):
+            raise ModelVersionNotFound(f"Invalid model version name {version!r}")
+        return os.path.join(self.path, version)
+
+    def versions(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path)
+                      if os.path.isfile(os.path.join(self.path, name, MANIFEST_FILE)))
+
+    def manifest(self, version: str) -> Dict[str, Any]:
+        manifest_path = os.path.join(self.version_dir(version), MANIFEST_FILE)
+        if not os.path.isfile(manifest_path):
+            raise ModelVersionNotFound(f"Model version {version!r} not found in {self.path}")
+        with open(manifest_path) as file_obj:
+            return json.load(file_obj)
+
+    def artifact_path(self, version: str, artifact: str) -> Optional[str]:
+        """Path of an artifact ('model', 'explainer' or 'compiled_model'), None if the version has none."""
+        file_name = self.manifest(version)["artifacts"].get(artifact)
+        return os.path.join(self.version_dir(version), file_name) if file_name else None
+
+    def current_version(self) -> str:
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE)) as file_obj:
+                return file_obj.read().strip()
+        except FileNotFoundError:
+            raise ModelVersionNotFound(f"No {CURRENT_FILE} version in {self.path}")
+
+    def current_version_or_none(self) -> Optional[str]:
+        try:
+            return self.current_version()
+        except ModelRegistryError:
+            return None
+
+    def current_stamp(self) -> Optional[tuple]:
+        """(mtime, size) of CURRENT, a cheap change check for watchers; None if it does not exist."""
+        try:
+            stat = os.stat(os.path.join(self.path, CURRENT_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def last_good_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, LAST_GOOD_FILE)) as file_obj:
+                return file_obj.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_pointer(self, file_name: str, version: str) -> None:
+        temp_path = os.path.join(self.path, f".{file_name}.tmp-{os.getpid()}")
+        with open(temp_path, "w") as file_obj:
+            file_obj.write(f"{version}\n")
+        os.replace(temp_path, os.path.join(self.path, file_name))
+
+    def set_current(self, version: str) -> None:
+        self.manifest(version)
+        self._write_pointer(CURRENT_FILE, version)
+        logger.info(f"Model registry {self.path}: CURRENT is now {version}")
+
+    def set_last_good(self, version: str) -> None:
+        self.manifest(version)
+        self._write_pointer(LAST_GOOD_FILE, version)
+
+    def verify(self, version: str) -> Dict[str, Any]:
+        """Check every artifact of `version` against the manifest checksums; returns the manifest."""
+        manifest = self.manifest(version)
+        version_dir = self.version_dir(version)
+        for relative_path, expected in manifest["checksums"].items():
+            path = os.path.join(version_dir, relative_path)
+            if not os.path.isfile(path) or file_checksum(path) != expected:
+                raise ModelVersionCorrupt(f"Model version {version!r}: {relative_path} is missing or does not match its checksum")
+        return manifest
+
+    def publish(self, version: str, model_path: str, explainer_path: str, threshold: float,
+                compiled_model_path: Optional[str] = None, activate: bool = False) -> Dict[str, Any]:
+        """
+        Copy the artifacts into a new version directory and write its manifest.
+
+        The directory is assembled under a temporary name and renamed, so a watcher never
+        sees a half-written version. The feature list is read from the model itself.
+        """
+        version_dir = self.version_dir(version)
+        if os.path.exists(version_dir):
+            raise ModelVersionExists(f"Model version {version!r} already exists")
+        temp_dir = os.path.join(self.path, f".{version}.tmp-{os.getpid()}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        artifacts = {"model": os.path.basename(model_path), "explainer": os.path.basename(explainer_path)}
+        shutil.copy2(model_path, os.path.join(temp_dir, artifacts["model"]))
+        shutil.copy2(explainer_path, os.path.join(temp_dir, artifacts["explainer"]))
+        if compiled_model_path is not None:
+            artifacts["compiled_model"] = os.path.basename(os.path.normpath(compiled_model_path))
+            shutil.copytree(compiled_model_path, os.path.join(temp_dir, artifacts["compiled_model"]))
+
+        manifest = {"version": version,
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                    "artifacts": artifacts,
+                    "features": list(load_object(model_path).get_booster().feature_names),
+                    "threshold": threshold,
+                    "checksums": directory_checksums(temp_dir, temp_dir)}
+        with open(os.path.join(temp_dir, MANIFEST_FILE), "w") as file_obj:
+            json.dump(manifest, file_obj, indent=2)
+        os.replace(temp_dir, version_dir)
+        logger.info(f"Published model version {version} to {version_dir}")
+        if activate:
+            self.set_current(version)
+        return manifest
+
+
+class ServingModel:
+    """
+    One loaded registry version with the scoring functions built on it.
+
+    - batch_score_fn: scores a list of requests on the pandas path (or the process pool)
+    - score_fn: scores single requests and micro-batches, the fast path when it passed its parity check
+    """
+
+    def __init__(self, version: str, manifest: Dict[str, Any], model, explainer, explainer_backend: str,
+                 batch_score_fn: Callable, score_fn: Callable):
+        self.version = version
+        self.manifest = manifest
+        self.model = model
+        self.explainer = explainer
+        self.explainer_backend = explainer_backend
+        self.batch_score_fn = batch_score_fn
+        self.score_fn = score_fn
+        self.feature_names: List[str] = manifest["features"]
+        self.threshold: float = manifest["threshold"]
+        # Versions the prediction cache keys
+        self.model_checksum: str = manifest["checksums"][manifest["artifacts"]["model"]]
+        self.loaded_at = datetime.now().isoformat(timespec="seconds")
+
+    def info(self) -> Dict[str, Any]:
+        return {"version": self.version, "created_at": self.manifest.get("created_at"), "loaded_at": self.loaded_at,
+                "threshold": self.threshold, "features": self.feature_names, "explainer_backend": self.explainer_backend}
+
+
+async def warm_up(serving: ServingModel, run_fn: Callable[..., Awaitable], n_requests: int = 1, iterations: int = 1,
+                  explain_modes: Sequence[str] = ("full",)) -> float:
+    """
+    Score synthetic requests (`synthetic_payloads`) through both scoring functions of `serving`
+    with `run_fn` (e.g. `InferenceExecutor.run`), so lazy initialization in XGBoost, SHAP and
+    the category casts happens before real traffic. score_fn gets one request at a time, as
+    from /predict, and batch_score_fn all of them.
+
+    Returns:
+    float: Seconds spent.
+    """
+    start = time.perf_counter()
+    requests = [PredictionRequest.model_validate(payload, context={"metrics": False})
+                for payload in synthetic_payloads(max(n_requests, 1))]
+    for _ in range(iterations):
+        for explain in explain_modes:
+            for request in requests:
+                await run_fn(serving.score_fn, [request], explain)
+            await run_fn(serving.batch_score_fn, requests, explain)
+    return time.perf_counter() - start
+
+
+class ActiveModel:
+    """
+    The `ServingModel` requests are scored with, swapped without downtime.
+
+    Handlers read `current` once and use that object until they respond, so a swap never
+    changes the version under an in-flight request; the old version is freed once the last
+    request holding it finishes. A new version is verified, loaded and warmed up in the
+    background before the reference is switched, and a failed load keeps the old version.
+
+    Parameters:
+    - registry: ModelRegistry
+    - loader: callable building a `ServingModel` from a version name (blocking)
+    - run_fn: async callable used to warm up a new version, e.g. `InferenceExecutor.run`
+    - warm_up_options: keyword arguments of `warm_up`
+    """
+
+    def __init__(self, registry: ModelRegistry, loader: Callable[[str], ServingModel],
+                 run_fn: Optional[Callable[..., Awaitable]] = None, warm_up_options: Optional[Dict[str, Any]] = None):
+        self.registry = registry
+        self.loader = loader
+        self.run_fn = run_fn
+        self.warm_up_options = warm_up_options or {}
+        self.current: Optional[ServingModel] = None
+        self.reloading: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._stamp = None
+
+    def _load(self, version: str) -> ServingModel:
+        self.registry.verify(version)
+        return self.loader(version)
+
+    def _mark_good(self, version: str) -> None:
+        """Record `version` as the registry's LAST_GOOD; a read-only registry only loses the fallback."""
+        try:
+            if self.registry.last_good_version() != version:
+                self.registry.set_last_good(version)
+        except OSError as e:
+            logger.warning(f"Could not record model version {version} as LAST_GOOD: {e}")
+
+    def load(self, version: Optional[str] = None) -> ServingModel:
+        """
+        Load `version` (default: CURRENT) and make it current, blocking; used at startup. When
+        CURRENT does not load, the registry's LAST_GOOD version is served instead, so a bad
+        CURRENT does not keep the service from starting; a pinned `version` has no fallback.
+        """
+        self._stamp = self.registry.current_stamp()
+        try:
+            target = version or self.registry.current_version()
+            self.current = self._load(target)
+        except Exception as e:
+            fallback = None if version is not None else self.registry.last_good_version()
+            if fallback is None:
+                raise
+            self.last_error = f"{self.registry.current_version_or_none()}: {e}"
+            logger.error(f"Could not load the CURRENT model version, falling back to LAST_GOOD {fallback}: {e}", exc_info=True)
+            self.current = self._load(fallback)
+        self._mark_good(self.current.version)
+        logger.info(f"Serving model version {self.current.version}")
+        return self.current
+
+    async def reload(self, version: Optional[str] = None) -> ServingModel:
+        """Load, warm up and switch to `version` (default: CURRENT); a no-op if it is already serving."""
+        async with self._lock:
+            version = version or self.registry.current_version()
+            if self.current is not None and self.current.version == version:
+                return self.current
+            self.reloading = version
+            try:
+                serving = await asyncio.to_thread(self._load, version)
+                if self.run_fn is not None:
+                    seconds = await warm_up(serving, self.run_fn, **self.warm_up_options)
+                    WARM_UP_SECONDS.labels(trigger="reload").observe(seconds)
+                    logger.info(f"Model version {version} warmed up in {seconds:.3f}s")
+            except Exception as e:
+                self.last_error = f"{version}: {e}"
+                logger.error(f"Could not load model version {version}, keeping {self.current.version if self.current else None}: {e}",
+                             exc_info=True)
+                raise
+            finally:
+                self.reloading = None
+            previous, self.current = self.current, serving
+            self.last_error = None
+            await asyncio.to_thread(self._mark_good, version)
+            logger.info(f"Switched model version {previous.version if previous else None} -> {version}")
+            return serving
+
+    async def watch(self, interval_s: float) -> None:
+        """Reload whenever the registry's CURRENT file changes; runs until cancelled."""
+        while True:
+            await asyncio.sleep(interval_s)
+            stamp = self.registry.current_stamp()
+            if stamp is None or stamp == self._stamp:
+                continue
+            self._stamp = stamp
+            try:
+                await self.reload()
+            except Exception:
+                # Logged by reload; the old version keeps serving
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {"active": self.current.info() if self.current else None,
+                "current_in_registry": self.registry.current_version_or_none(),
+                "versions": self.registry.versions(),
+                "reloading": self.reloading,
+                "last_error": self.last_error}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry")
+    parser.add_argument("--registry", default="models/registry")
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="Add a new version from trained artifacts")
+    publish.add_argument("--version", required=True)
+    publish.add_argument("--model", required=True, help="Trained model pickle")
+    publish.add_argument("--explainer", required=True, help="Pickled shap.TreeExplainer of the model")
+    publish.add_argument("--compiled-model", default=None, help="Directory written by src.inference.tree_compiler")
+    publish.add_argument("--threshold", type=float, default=None, help="Default: threshold of inference_config.yaml")
+    publish.add_argument("--activate", action="store_true", help="Make it the CURRENT version")
+    activate = commands.add_parser("activate", help="Point CURRENT at an existing version")
+    activate.add_argument("version")
+    commands.add_parser("list", help="List versions")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.registry)
+    if args.command == "publish":
+        threshold = args.threshold
+        if threshold is None:
+            from src.inference.preprocessing import threshold
+        registry.publish(args.version, args.model, args.explainer, threshold,
+                         compiled_model_path=args.compiled_model, activate=args.activate)
+    elif args.command == "activate":
+        registry.verify(args.version)
+        registry.set_current(args.version)
+    else:
+        current = registry.current_version_or_none()
+        for version in registry.versions():
+            print(f"{'*' if version == current else ' '} {version}")
+
+
+if __name__ == "__main__":
+    main()
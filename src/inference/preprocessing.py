@@ -3,7 +3,7 @@ import numpy as np
 import pandas as pd
 from src.logging.custom_logging import logger
 from src.exceptions.custom_exception import CustomException
-from src.utils.feature_engineering import compute_ratio_columnwise
+from src.features.app_features_pipeline import APP_FEATURES
 from src.utils.other_utils import read_yaml_file
 import os,sys
 
@@ -13,6 +13,9 @@ inference_config = read_yaml_file("src/config/inference_config.yaml")
 selected_features=inference_config['selected_features']
 categorical_features=inference_config['categorical_features']
 threshold = inference_config['threshold']
+category_levels = inference_config['category_levels']
+# Derived model inputs come from the feature store definitions, e.g. the ratio features
+ratio_features = APP_FEATURES.ratio_specs(selected_features)
 
 
 def preprocessing(df:pd.DataFrame)->pd.DataFrame:
@@ -20,13 +23,29 @@ def preprocessing(df:pd.DataFrame)->pd.DataFrame:
     Preprocess the input data
     """
     # Drop rows with missing values
-    df['AMT_CREDIT_AMT_GOODS_PRICE_ratio'] = compute_ratio_columnwise(df, 'AMT_CREDIT', 'AMT_GOODS_PRICE')
-    df[categorical_features] = df[categorical_features].astype('category')
-    df = df[selected_features]
+    # Only the features missing from the request (the ratios) are computed
+    df = APP_FEATURES.compute(df, selected_features)
+    # Use the training category levels so codes don't depend on the rows in the frame
+    for col in categorical_features:
+        df[col] = pd.Categorical(df[col], categories=category_levels[col])
     df.replace({None:np.nan},inplace=True)
     return df
 
 
+def model_input_frame(df:pd.DataFrame)->pd.DataFrame:
+    """
+    Model input from a feature store frame. Frames that already hold the engineered features
+    (the output of app_data_processing) are only subset and cast to the training category
+    levels; raw application columns go through `preprocessing`.
+    """
+    if all(name in df.columns for name in selected_features):
+        df = df[selected_features].copy()
+        for col in categorical_features:
+            df[col] = pd.Categorical(df[col].astype("object"), categories=category_levels[col])
+        return df
+    return preprocessing(df)
+
+
 
 def get_top_3_shap_features(shap_values: dict, prob: float, threshold: float=threshold,top_n=3) -> dict:
     """
@@ -41,14 +60,14 @@ def get_top_3_shap_features(shap_values: dict, prob: float, threshold: float=thr
     threshold (float): Threshold to compare probability.
 
     Returns:
-    list: Top 3 selected feature names.
+    dict: Top 3 selected features and their SHAP values, largest absolute value first.
     """
     # Sort features by SHAP value in ascending order
     sorted_features = sorted(shap_values.items(), key=lambda x: x[1])  # Sort by value
 
     if prob > threshold:
-        # Select top 3 features with highest SHAP values (most positive)
-        top_3_features = dict(sorted_features[-top_n:])
+        # Select top 3 features with highest SHAP values (most positive), highest first
+        top_3_features = dict(sorted_features[::-1][:top_n])
     else:
         # Select bottom 3 features with lowest SHAP values (most negative)
         top_3_features = dict(sorted_features[:top_n])
@@ -1,9 +1,71 @@
 import sys
 import os
-from typing import Any, Dict, Optional
+from enum import Enum
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, get_args
+import numpy as np
+import pandas as pd
 from src.logging.custom_logging import logger
 from src.exceptions.custom_exception import CustomException
-from pydantic import BaseModel,Field,field_validator
+from pydantic import BaseModel,Field,ValidationError,field_validator,model_validator
+from src.inference.metrics import stage_timer
+
+
+EDUCATION_TYPES = frozenset([
+    'Secondary / secondary special', 'Higher education', 'Incomplete higher',
+    'Lower secondary', 'Academic degree'
+])
+
+ORGANIZATION_TYPES = frozenset([
+    'Self-employed', 'Agriculture', 'Business Entity Type 3', 'Construction',
+    'Industry: type 7', 'Medicine', 'XNA', 'School', 'Industry: type 4',
+    'Transport: type 2', 'Other', 'Kindergarten', 'Electricity', 'Government',
+    'Hotel', 'Industry: type 9', 'Business Entity Type 2', 'Industry: type 11',
+    'Business Entity Type 1', 'Realtor', 'Military', 'Housing', 'Industry: type 1',
+    'Services', 'Trade: type 7', 'Transport: type 4', 'Security Ministries',
+    'Trade: type 2', 'Trade: type 3', 'Security', 'Industry: type 3', 'Bank',
+    'Industry: type 2', 'Industry: type 12', 'Telecom', 'Police', 'Restaurant',
+    'Insurance', 'Postal', 'Trade: type 1', 'Emergency', 'Legal Services',
+    'Transport: type 1', 'Transport: type 3', 'University', 'Industry: type 5',
+    'Trade: type 6', 'Industry: type 10', 'Advertising', 'Trade: type 5', 'Mobile',
+    'Culture', 'Industry: type 13', 'Cleaning', 'Religion', 'Industry: type 6',
+    'Trade: type 4', 'Industry: type 8'
+])
+
+
+class Rule(NamedTuple):
+    """
+    Check applied to a present (non-None) value. `check` accepts a scalar or a NumPy array
+    and then returns a boolean mask, so the pydantic validators and `validate_columns`
+    share one definition.
+    """
+    check: Callable[[Any], Any]
+    message: str
+
+
+def _between(low: float, high: float) -> Callable[[Any], Any]:
+    return lambda v: (low <= v) & (v <= high)
+
+
+def _one_of(allowed: frozenset) -> Callable[[Any], Any]:
+    def check(v):
+        if isinstance(v, np.ndarray):
+            return pd.Series(v, dtype=object).isin(allowed).to_numpy()
+        return v in allowed
+    return check
+
+
+FIELD_RULES: Dict[str, Rule] = {
+    'EXT_SOURCE_3': Rule(_between(0, 1), 'Value must be between 0 and 1 or None'),
+    'EXT_SOURCE_2': Rule(_between(0, 1), 'Value must be between 0 and 1 or None'),
+    'EXT_SOURCE_1': Rule(_between(0, 1), 'Value must be between 0 and 1 or None'),
+    'AMT_CREDIT': Rule(lambda v: v > 0, 'Value must be greater than 0 and Non-missing'),
+    'AMT_GOODS_PRICE': Rule(lambda v: v > 0, 'Value must be greater than 0 and can be missing'),
+    'Client_Age': Rule(_between(20, 100), 'Value must be between 20 and 100 and can not be missing'),
+    'employment_years': Rule(lambda v: v >= 0, 'Value must be greater than or equal to 0 and can be missing'),
+    'NAME_EDUCATION_TYPE': Rule(_one_of(EDUCATION_TYPES),
+                                'Value must be one of Secondary / secondary special, Higher education, Incomplete higher, Lower secondary, Academic degree'),
+    'ORGANIZATION_TYPE': Rule(_one_of(ORGANIZATION_TYPES), 'Value must be in given categories'),
+}
 
 
 class PredictionRequest(BaseModel):
@@ -67,77 +129,286 @@ class PredictionRequest(BaseModel):
         json_schema_extra={"example": "Business Entity Type 3"}
     )
 
-    @field_validator('EXT_SOURCE_3','EXT_SOURCE_2','EXT_SOURCE_1')
-    def check_ext_source(cls, v):
-        if v is not None:
-            if not(0<= v <=1) :
-                raise ValueError('Value must be between 0 and 1 or None')
-        return v
-    
-    @field_validator('AMT_CREDIT')
-    def check_amt_credit(cls, v):
-        if  not(v>0):
-            raise ValueError('Value must be greater than 0 and Non-missing')
-        return v
-    
-    @field_validator('AMT_GOODS_PRICE')
-    def check_goods_price(cls, v):
-        if v is not None and not(v>0):
-            raise ValueError('Value must be greater than 0 and can be missing')
-        return v
-    
-    @field_validator('Client_Age')
-    def check_age(cls, v):
-        if not(20<=v<=100) and not None:
-            raise ValueError('Value must be between 20 and 100 and can not be missing')
-        return v
-    
-    @field_validator('employment_years')
-    def check_employment_years(cls, v):
-        if v is not None and not(v>=0):
-            raise ValueError('Value must be greater than or equal to 0 and can be missing')
-        return v
-    
-    @field_validator('NAME_EDUCATION_TYPE')
-    def check_education_type(cls, v):
-        allowed_values = ['Secondary / secondary special', 
-                          'Higher education', 'Incomplete higher', 
-                          'Lower secondary', 'Academic degree']
-        if v not in allowed_values :
-            raise ValueError('Value must be one of Secondary / secondary special, Higher education, Incomplete higher, Lower secondary, Academic degree')
-        return v
-    
-    @field_validator('ORGANIZATION_TYPE')
-    def check_organization_type(cls, v):
-        allowed_values = [
-            'Self-employed', 'Agriculture', 'Business Entity Type 3', 'Construction', 
-            'Industry: type 7', 'Medicine', 'XNA', 'School', 'Industry: type 4', 
-            'Transport: type 2', 'Other', 'Kindergarten', 'Electricity', 'Government', 
-            'Hotel', 'Industry: type 9', 'Business Entity Type 2', 'Industry: type 11', 
-            'Business Entity Type 1', 'Realtor', 'Military', 'Housing', 'Industry: type 1', 
-            'Services', 'Trade: type 7', 'Transport: type 4', 'Security Ministries', 
-            'Trade: type 2', 'Trade: type 3', 'Security', 'Industry: type 3', 'Bank', 
-            'Industry: type 2', 'Industry: type 12', 'Telecom', 'Police', 'Restaurant', 
-            'Insurance', 'Postal', 'Trade: type 1', 'Emergency', 'Legal Services', 
-            'Transport: type 1', 'Transport: type 3', 'University', 'Industry: type 5', 
-            'Trade: type 6', 'Industry: type 10', 'Advertising', 'Trade: type 5', 'Mobile', 
-            'Culture', 'Industry: type 13', 'Cleaning', 'Religion', 'Industry: type 6', 
-            'Trade: type 4', 'Industry: type 8'
-        ]
-        if v not in allowed_values :
-            raise ValueError('Value must be in given categories')
+    @field_validator(*FIELD_RULES)
+    @classmethod
+    def check_rules(cls, v, info):
+        rule = FIELD_RULES[info.field_name]
+        if v is not None and not rule.check(v):
+            raise ValueError(rule.message)
         return v
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def time_validation(cls, data, handler, info):
+        # Observed for every request and every batch row, valid or not. Synthetic requests
+        # built for startup checks pass context={"metrics": False} to stay out of the histogram.
+        if info.context is not None and not info.context.get("metrics", True):
+            return handler(data)
+        with stage_timer("validation"):
+            return handler(data)
     
 
 
+class ExplainMode(str, Enum):
+    """How much of the SHAP explanation is computed and returned."""
+    none = "none"   # probability only, SHAP is not computed
+    top3 = "top3"   # probability and top 3 reason codes
+    full = "full"   # everything: raw and model features, all SHAP values, reason codes
+
+
+class ResponseFormat(str, Enum):
+    """Layout of the feature-level fields of a response."""
+    keyed = "keyed"       # dicts keyed by feature name
+    compact = "compact"   # arrays aligned to the raw_feature_names / model_feature_names header
+
+
 # Define response model
 class PredictionResponse(BaseModel):
     request_id: str
+    model_version: str
     raw_feature_values: Dict[str, Any]
     model_features: Dict[str, Any]
     prediction_prob: Optional[float]=Field(...)
+    three_digit_score: Optional[int] = None
+    risk_band: Optional[str] = None
     status: str
     failure_reason: Dict[str, str] = {}
     top_3_reason_codes: Dict[str, float] = {}
+    reason_texts: List[str] = []
     shap_values: Dict[str, float] = {}
-    timestamp: str
\ No newline at end of file
+    timestamp: str
+
+
+def example_payload() -> Dict[str, Any]:
+    """Build a valid request payload from the `example` of every `PredictionRequest` field."""
+    return {name: field.json_schema_extra["example"] for name, field in PredictionRequest.model_fields.items()}
+
+
+def synthetic_payloads(n_requests: int) -> List[Dict[str, Any]]:
+    """
+    `n_requests` valid payloads varied from `example_payload`: the categorical fields cycle
+    through their levels and every other payload leaves the optional fields missing.
+    """
+    education_types, organization_types = sorted(EDUCATION_TYPES), sorted(ORGANIZATION_TYPES)
+    optional_fields = [name for name, field in PredictionRequest.model_fields.items()
+                       if type(None) in getattr(field.annotation, "__args__", ())]
+    payloads = []
+    for position in range(n_requests):
+        payload = {**example_payload(),
+                   "NAME_EDUCATION_TYPE": education_types[position % len(education_types)],
+                   "ORGANIZATION_TYPE": organization_types[position % len(organization_types)]}
+        if position % 2:
+            payload.update(dict.fromkeys(optional_fields))
+        payloads.append(payload)
+    return payloads
+
+
+class BatchPredictionResponse(BaseModel):
+    batch_id: str
+    model_version: str
+    n_requests: int
+    n_success: int
+    n_failed: int
+    predictions: List[PredictionResponse]
+    timestamp: str
+
+
+class CompactPrediction(BaseModel):
+    """`PredictionResponse` fields with the feature dicts replaced by arrays aligned to a header."""
+    request_id: str
+    model_version: str
+    raw_feature_values: List[Any] = []
+    model_features: List[Any] = []
+    prediction_prob: Optional[float]=Field(...)
+    three_digit_score: Optional[int] = None
+    risk_band: Optional[str] = None
+    status: str
+    failure_reason: Dict[str, str] = {}
+    top_3_reason_codes: Dict[str, float] = {}
+    reason_texts: List[str] = []
+    shap_values: List[Optional[float]] = []
+
+
+class CompactPredictionResponse(CompactPrediction):
+    raw_feature_names: List[str]
+    model_feature_names: List[str]   # also the order of shap_values
+    timestamp: str
+
+
+class CompactBatchPredictionResponse(BaseModel):
+    batch_id: str
+    model_version: str
+    n_requests: int
+    n_success: int
+    n_failed: int
+    raw_feature_names: List[str]
+    model_feature_names: List[str]
+    predictions: List[CompactPrediction]
+    timestamp: str
+
+
+def _field_types() -> Dict[str, Tuple[type, bool]]:
+    """(base type, accepts None) of every `PredictionRequest` field, e.g. Optional[float] -> (float, True)."""
+    field_types = {}
+    for name, field in PredictionRequest.model_fields.items():
+        args = [arg for arg in get_args(field.annotation) if arg is not type(None)]
+        field_types[name] = (args[0] if args else field.annotation, len(args) > 0)
+    return field_types
+
+
+FIELD_TYPES = _field_types()
+
+# Messages pydantic reports for None in a required field of each type
+_NONE_MESSAGES = {float: 'Input should be a valid number', int: 'Input should be a valid integer', str: 'Input should be a valid string'}
+_FRACTION_MESSAGE = 'Input should be a valid integer, got a number with a fractional part'
+# Python types checked column-wise; anything else (bool, numeric strings, ...) goes through pydantic
+_PLAIN_TYPES = {float: (int, float), int: (int, float), str: (str,)}
+_PLAIN_KINDS = {float: {'integer', 'floating', 'mixed-integer-float', 'empty'},
+                int: {'integer', 'floating', 'mixed-integer-float', 'empty'},
+                str: {'string', 'empty'}}
+_MISSING = object()
+# Integers from here on may not survive the float64 / int64 round trip exactly
+_EXACT_INT_LIMIT = 2.0 ** 53
+
+
+class BulkValidationResult(NamedTuple):
+    valid: np.ndarray                            # bool per row
+    failure_reasons: Dict[int, Dict[str, str]]   # same shape as `validate_batch`
+    values: Dict[str, List[Any]]                 # coerced value of every field per row, in field order
+
+    def requests(self) -> Dict[int, PredictionRequest]:
+        """`PredictionRequest` of every valid row keyed by row position, built without validating again."""
+        names = list(self.values)
+        return {position: PredictionRequest.model_construct(**dict(zip(names, row)))
+                for position, (row, valid) in enumerate(zip(zip(*self.values.values()), self.valid)) if valid}
+
+
+def _object_array(values: Sequence[Any]) -> np.ndarray:
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _validate_columns(columns: Dict[str, Sequence[Any]], n_rows: int, fallback: np.ndarray,
+                      row_at: Callable[[int], Any]) -> BulkValidationResult:
+    errors = []   # (field, row mask, message) in field order
+    values = {}
+    for name, (base, nullable) in FIELD_TYPES.items():
+        column = columns.get(name)
+        if column is None:
+            errors.append((name, np.ones(n_rows, dtype=bool), 'Field required'))
+            values[name] = [None] * n_rows
+            continue
+        numbers = None
+        numeric = base is not str and isinstance(column, np.ndarray) and column.dtype.kind in "iuf"
+        if not numeric:
+            column = _object_array(column)
+        if numeric:
+            # Already numeric (e.g. a DataFrame column): NaN marks a missing value
+            numbers = column.astype(float)
+            none = np.isnan(numbers)
+            missing = np.zeros(n_rows, dtype=bool)
+            present = ~none
+        elif pd.api.types.infer_dtype(column, skipna=True) in _PLAIN_KINDS[base]:
+            # Only plain values besides None and NaN; a NaN is a value to validate, not a None
+            if base is str:
+                none = pd.isna(column)
+                fallback |= none & ~(column == None)  # noqa: E711, elementwise
+            else:
+                numbers = column.astype(float)
+                none = np.isnan(numbers)
+            none[none] = column[none] == None  # noqa: E711, elementwise
+            missing = np.zeros(n_rows, dtype=bool)
+            present = ~none
+        else:
+            # Missing keys or values of other types: classify this column row by row
+            missing = np.fromiter((v is _MISSING for v in column), dtype=bool, count=n_rows)
+            none = np.fromiter((v is None for v in column), dtype=bool, count=n_rows)
+            present = np.fromiter((isinstance(v, _PLAIN_TYPES[base]) and not isinstance(v, bool) for v in column),
+                                  dtype=bool, count=n_rows)
+            fallback |= ~(missing | none | present)
+        errors.append((name, missing, 'Field required'))
+        if not nullable:
+            errors.append((name, none, _NONE_MESSAGES[base]))
+
+        if base is str:
+            checked = column if present.all() else np.where(present, column, None)
+        else:
+            checked = numbers
+            if checked is None:
+                checked = np.full(n_rows, np.nan)
+                checked[present] = column[present].astype(float)
+            if base is int:
+                # Floats are accepted for int fields only when integral; inf, nan and values too large
+                # for an exact int64 are left to pydantic
+                out_of_range = present & ~(np.abs(checked) < _EXACT_INT_LIMIT)
+                fraction = present & ~out_of_range & (checked != np.round(checked))
+                fallback |= out_of_range
+                errors.append((name, fraction, _FRACTION_MESSAGE))
+                present &= ~(out_of_range | fraction)
+                checked = np.where(present, checked, 0).astype(np.int64)
+        rule = FIELD_RULES.get(name)
+        if rule is not None:
+            with np.errstate(invalid="ignore"):
+                failed = present & ~np.asarray(rule.check(checked), dtype=bool)
+            errors.append((name, failed, f'Value error, {rule.message}'))
+        coerced = checked.tolist()
+        for position in np.flatnonzero(~present).tolist():
+            coerced[position] = None
+        values[name] = coerced
+
+    failure_reasons = {}
+    for name, mask, message in errors:
+        for position in np.flatnonzero(mask & ~fallback).tolist():
+            failure_reasons.setdefault(position, {})[name] = message
+    # Rows with unusual input types are validated one by one so their messages match pydantic's
+    for position in np.flatnonzero(fallback).tolist():
+        try:
+            request = PredictionRequest.model_validate(row_at(position), context={"metrics": False})
+            for name in values:
+                values[name][position] = getattr(request, name)
+        except ValidationError as e:
+            failure_reasons[position] = {
+                ".".join(str(loc) for loc in error["loc"]) or "request": error["msg"]
+                for error in e.errors()
+            }
+    valid = np.ones(n_rows, dtype=bool)
+    valid[list(failure_reasons)] = False
+    return BulkValidationResult(valid, failure_reasons, values)
+
+
+def validate_columns(columns: Dict[str, Sequence[Any]], n_rows: Optional[int] = None) -> BulkValidationResult:
+    """
+    Validate a batch given column-wise: lists of Python values (None for missing values) or
+    NumPy arrays, e.g. `{name: df[name].to_numpy() for name in df.columns}`. In a numeric
+    array NaN marks a missing value. `n_rows` defaults to the length of the columns; it is
+    needed when `columns` may be empty.
+
+    Range checks, None rules and category membership run once per column with the rules of
+    `FIELD_RULES`, and failures carry the messages `PredictionRequest` would report. Values of a
+    type pydantic would have to coerce (bools, numeric strings, ...) are validated by
+    `PredictionRequest` itself, row by row.
+    """
+    with stage_timer("validation"):
+        if n_rows is None:
+            n_rows = len(next(iter(columns.values()))) if columns else 0
+        return _validate_columns(columns, n_rows, np.zeros(n_rows, dtype=bool),
+                                 lambda position: {name: column[position] for name, column in columns.items()})
+
+
+def validate_batch(rows: List[Dict[str, Any]]) -> Tuple[Dict[int, PredictionRequest], Dict[int, Dict[str, str]]]:
+    """
+    Validate every row of a batch independently so one bad row does not fail the batch.
+
+    Rows are checked column-wise with `validate_columns` rules; rows that are not dicts fail
+    the way `PredictionRequest.model_validate` would fail them.
+
+    Returns:
+    tuple: (valid requests keyed by row position, failure reasons keyed by row position)
+    """
+    with stage_timer("validation"):
+        is_dict = np.fromiter((isinstance(row, dict) for row in rows), dtype=bool, count=len(rows))
+        dict_rows = rows if is_dict.all() else [row if isinstance(row, dict) else {} for row in rows]
+        columns = {name: [row.get(name, _MISSING) for row in dict_rows] for name in FIELD_TYPES}
+        result = _validate_columns(columns, len(rows), ~is_dict, lambda position: rows[position])
+    return result.requests(), result.failure_reasons
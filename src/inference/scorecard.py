@@ -0,0 +1,62 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from src.inference.preprocessing import inference_config
+from src.utils.other_utils import three_digit_score
+
+# Probabilities are clipped away from 0 and 1, where the log-odds are infinite
+PROB_EPSILON = 1e-9
+
+
+class Scorecard:
+    """
+    Three-digit score, risk band and reason code texts of scored rows, built once from the
+    `scorecard` and `reason_codes` sections of inference_config.yaml.
+
+    score = alpha + beta * log((1 - p) / p), as `three_digit_score`; a higher score is a lower
+    risk. band_labels[i] covers band_edges[i - 1] <= score < band_edges[i], so there is one more
+    label than edges. Every method works on whole arrays, so batches are scored in one call.
+    """
+
+    def __init__(self, alpha: float, beta: float, band_edges: Sequence[float], band_labels: Sequence[str],
+                 reason_descriptions: Optional[Dict[str, str]] = None):
+        if len(band_labels) != len(band_edges) + 1:
+            raise ValueError(f"Scorecard needs one more band label than band edges, got {len(band_labels)} labels "
+                             f"and {len(band_edges)} edges")
+        if list(band_edges) != sorted(band_edges):
+            raise ValueError("Scorecard band edges must be in ascending order")
+        self.alpha = alpha
+        self.beta = beta
+        self.band_edges = np.asarray(band_edges, dtype=float)
+        self.band_labels = np.asarray(band_labels, dtype=object)
+        # Positive SHAP values push the probability of default up
+        self.reason_texts_table: Dict[Tuple[str, bool], str] = {}
+        for feature, description in (reason_descriptions or {}).items():
+            self.reason_texts_table[(feature, True)] = f"{description} increases the risk"
+            self.reason_texts_table[(feature, False)] = f"{description} lowers the risk"
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Scorecard":
+        scorecard_config = config['scorecard']
+        return cls(scorecard_config['alpha'], scorecard_config['beta'], scorecard_config['band_edges'],
+                   scorecard_config['band_labels'], config.get('reason_codes'))
+
+    def scores(self, prediction_probs) -> np.ndarray:
+        probs = np.clip(np.asarray(prediction_probs, dtype=float), PROB_EPSILON, 1 - PROB_EPSILON)
+        return three_digit_score(probs, alpha=self.alpha, beta=self.beta)
+
+    def risk_bands(self, scores) -> np.ndarray:
+        return self.band_labels[np.searchsorted(self.band_edges, scores, side="right")]
+
+    def apply(self, prediction_probs) -> Tuple[List[int], List[str]]:
+        """(three-digit scores, risk bands) of `prediction_probs` as plain lists."""
+        scores = self.scores(prediction_probs)
+        return scores.tolist(), self.risk_bands(scores).tolist()
+
+    def reason_texts(self, top_3_reason_codes: Dict[str, float]) -> List[str]:
+        """Texts of {feature: SHAP value} reason codes, in their order; features without a description keep their name."""
+        return [self.reason_texts_table.get((feature, value > 0),
+                                            f"{feature} {'increases' if value > 0 else 'lowers'} the risk")
+                for feature, value in top_3_reason_codes.items()]
+
+
+scorecard = Scorecard.from_config(inference_config)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from src.logging.custom_logging import request_logger
+from src.inference.preprocessing import preprocessing,threshold
+from src.inference.metrics import BATCH_SIZE,stage_timer
+
+
+def score_batch(model, explainer, input_data: pd.DataFrame, explain: bool = True) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Score a preprocessed frame with one model call and one explainer call.
+
+    Args:
+    model: Fitted XGBClassifier.
+    explainer: SHAP TreeExplainer built on the same model.
+    input_data (pd.DataFrame): Output of `preprocessing`, one row per applicant.
+    explain (bool): If False, SHAP values are not computed and None is returned for them.
+
+    Returns:
+    tuple: (prediction probabilities of shape (n,), SHAP values of shape (n, n_features)).
+    """
+    with stage_timer("predict_proba"):
+        prediction_probs = model.predict_proba(input_data)[:, 1]
+    shap_values = None
+    if explain:
+        with stage_timer("shap"):
+            shap_values = np.asarray(explainer.shap_values(input_data))
+    request_logger.info(f"Scored batch of {len(input_data)} rows")
+    return prediction_probs, shap_values
+
+
+def explain_rows(feature_names: List[str], shap_values: np.ndarray, prediction_probs: np.ndarray,
+                 threshold: float = threshold) -> Tuple[List[Dict[str, float]], List[Dict[str, float]]]:
+    """
+    Turn a SHAP matrix into per-row SHAP dictionaries and top 3 reason codes, most
+    influential first, as in `top_3_reason_indices`.
+
+    Returns:
+    tuple: (list of full SHAP dicts, list of top 3 reason code dicts), aligned with the rows.
+    """
+    all_shap_dicts = [
+        {name: float(value) for name, value in zip(feature_names, row)}
+        for row in shap_values.tolist()
+    ]
+    with stage_timer("top_3_shap_features"):
+        reason_names = np.asarray(feature_names, dtype=object)[top_3_reason_indices(shap_values, prediction_probs, threshold)]
+        top_shap_dicts = [
+            {name: shap_dict[name] for name in names}
+            for shap_dict, names in zip(all_shap_dicts, reason_names.tolist())
+        ]
+    return all_shap_dicts, top_shap_dicts
+
+
+def top_3_reason_indices(shap_values: np.ndarray, prediction_probs: np.ndarray, threshold: float = threshold, top_n: int = 3) -> np.ndarray:
+    """
+    Vectorized `get_top_3_shap_features` for a SHAP matrix: column indices of the reason codes
+    of every row, most influential first. Rows with prob > threshold get their highest SHAP
+    values, the others their lowest.
+
+    Returns:
+    np.ndarray: Integer array of shape (n_rows, top_n).
+    """
+    order = np.argsort(shap_values, axis=1, kind="stable")
+    lowest = order[:, :top_n]
+    highest = order[:, ::-1][:, :top_n]
+    return np.where((np.asarray(prediction_probs) > threshold)[:, None], highest, lowest)
+
+
+def score_requests(model, explainer, requests: list, explain: str = "full",
+                   threshold: float = threshold) -> List[Tuple[Dict, float, Dict[str, float], Dict[str, float]]]:
+    """
+    Preprocess and score validated `PredictionRequest` objects together.
+
+    Args:
+    explain (str): 'none' skips SHAP and returns empty SHAP and reason code dicts;
+        'top3' and 'full' compute SHAP for every row.
+    threshold (float): Decision threshold of the model, picks the direction of the reason codes.
+
+    Returns:
+    list: One (model_features, prediction_prob, shap_values dict, top 3 reason codes) tuple per request, in order.
+    """
+    with stage_timer("preprocessing"):
+        input_data = pd.DataFrame([request.model_dump() for request in requests])
+        input_data = preprocessing(input_data)
+    prediction_probs, shap_values = score_batch(model, explainer, input_data, explain=explain != "none")
+    if shap_values is None:
+        all_shap_dicts = top_shap_dicts = [{} for _ in requests]
+    else:
+        all_shap_dicts, top_shap_dicts = explain_rows(list(input_data.columns), shap_values, prediction_probs, threshold)
+    model_features = input_data.to_dict(orient="records")
+    return [(features, float(prob), shap_dict, top_shap_dict)
+            for features, prob, shap_dict, top_shap_dict in zip(model_features, prediction_probs, all_shap_dicts, top_shap_dicts)]
+
+
+def score_grouped_requests(items: List[Tuple]) -> list:
+    """
+    Score (score_fn, request, explain mode) items queued by the micro-batcher, one
+    `score_tagged_requests` call per scoring function. Requests admitted before and after a
+    model swap can share a micro-batch, and each is scored by the version it started on.
+    """
+    groups = {}
+    for position, (score_fn, request, mode) in enumerate(items):
+        groups.setdefault(score_fn, []).append((position, request, mode))
+    results = [None] * len(items)
+    for score_fn, group in groups.items():
+        scored = score_tagged_requests(score_fn, [(request, mode) for _, request, mode in group])
+        for (position, _, _), scored_row in zip(group, scored):
+            results[position] = scored_row
+    return results
+
+
+def score_tagged_requests(score_fn, items: List[Tuple]) -> list:
+    """
+    Score (request, explain mode) pairs queued by the micro-batcher with one `score_fn` call.
+
+    SHAP is computed for the whole batch unless every request asked for explain='none'.
+    """
+    BATCH_SIZE.labels(source="micro_batcher").observe(len(items))
+    requests = [request for request, _ in items]
+    explain = "none" if all(mode == "none" for _, mode in items) else "full"
+    return score_fn(requests, explain)
@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Optional
+import orjson
+from fastapi.responses import ORJSONResponse
+from src.inference.request_validation import BatchPredictionResponse, PredictionResponse, ResponseFormat
+
+# NaN model features are written as null; the standard library encoder would refuse them
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def aligned(values: Dict[str, Any], names: List[str]) -> List[Any]:
+    """Values of `values` in the order of `names`, None for absent names; [] when `values` is empty."""
+    if not values:
+        return []
+    return [values.get(name) for name in names]
+
+
+def compact_prediction(response: PredictionResponse, raw_feature_names: List[str], model_feature_names: List[str]) -> Dict[str, Any]:
+    """`CompactPrediction` content of one response; SHAP values follow `model_feature_names`."""
+    return {"request_id": response.request_id,
+            "model_version": response.model_version,
+            "raw_feature_values": aligned(response.raw_feature_values, raw_feature_names),
+            "model_features": aligned(response.model_features, model_feature_names),
+            "prediction_prob": response.prediction_prob,
+            "three_digit_score": response.three_digit_score,
+            "risk_band": response.risk_band,
+            "status": response.status,
+            "failure_reason": response.failure_reason,
+            "top_3_reason_codes": response.top_3_reason_codes,
+            "reason_texts": response.reason_texts,
+            "shap_values": aligned(response.shap_values, model_feature_names)}
+
+
+def response_content(response: Any, response_format: ResponseFormat, raw_feature_names: List[str],
+                     model_feature_names: List[str]) -> Dict[str, Any]:
+    """
+    JSON-ready content of a `PredictionResponse` or `BatchPredictionResponse`.
+
+    The compact layout names the features once, in `raw_feature_names` and `model_feature_names`,
+    and every row carries plain arrays in that order instead of repeating the keys.
+    """
+    if response_format != ResponseFormat.compact:
+        return response.model_dump()
+    header = {"raw_feature_names": raw_feature_names, "model_feature_names": model_feature_names}
+    if isinstance(response, BatchPredictionResponse):
+        return {"batch_id": response.batch_id,
+                "model_version": response.model_version,
+                "n_requests": response.n_requests,
+                "n_success": response.n_success,
+                "n_failed": response.n_failed,
+                **header,
+                "predictions": [compact_prediction(prediction, raw_feature_names, model_feature_names)
+                                for prediction in response.predictions],
+                "timestamp": response.timestamp}
+    return {**compact_prediction(response, raw_feature_names, model_feature_names), **header,
+            "timestamp": response.timestamp}
+
+
+def render_response(response: Any, response_format: ResponseFormat = ResponseFormat.keyed,
+                    raw_feature_names: Optional[List[str]] = None,
+                    model_feature_names: Optional[List[str]] = None) -> ORJSONResponse:
+    """Encode a response with orjson, in the keyed (default) or compact layout."""
+    return ORJSONResponse(content=response_content(response, response_format, raw_feature_names or [],
+                                                   model_feature_names or []))
@@ -0,0 +1,383 @@
+"""
+Shadow scoring of a challenger model version next to the champion serving requests.
+
+The challenger scores the same validated requests in its own small thread pool after the
+champion has answered, from the champion's model inputs when both versions take the same
+features, so champion latency does not depend on it: when the pool is behind,
+shadow work is dropped (counted in `prediction_shadow_rows_total`) instead of queued without
+bound. Paired champion / challenger probabilities go to a rolling log of Parquet files:
+
+    <log_dir>/shadow-<timestamp>-<pid>-<sequence>.parquet
+        timestamp, request_id, champion_version, challenger_version,
+        champion_prob, challenger_prob, champion_threshold, challenger_threshold
+
+`compare_shadow_log` summarizes the log (score distribution differences and, given labels,
+`calculate_performance_metrics` of both versions); one worker of the service, holding
+<log_dir>/.compare.lock, runs it every compare_interval_s and
+`python -m src.inference.shadow compare` runs it on demand.
+"""
+import argparse
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.logging.custom_logging import logger
+from src.inference.metrics import SHADOW_ROWS
+from src.inference.model_registry import ServingModel
+from src.inference.preprocessing import model_input_frame
+from src.inference.scoring import score_batch
+from src.utils.evaluation_metrics import calculate_performance_metrics
+
+SHADOW_LOG_SCHEMA = pa.schema([("timestamp", pa.string()),
+                               ("request_id", pa.string()),
+                               ("champion_version", pa.string()),
+                               ("challenger_version", pa.string()),
+                               ("champion_prob", pa.float64()),
+                               ("challenger_prob", pa.float64()),
+                               ("champion_threshold", pa.float64()),
+                               ("challenger_threshold", pa.float64())])
+COMPARISON_FILE = "comparison.json"
+COMPARE_LOCK_FILE = ".compare.lock"
+
+
+class ShadowLog:
+    """
+    Buffer of paired scores written to Parquet once it holds `rotate_rows` rows or its oldest
+    row is `rotate_seconds` old, whichever comes first. Only the newest `max_files` files are kept.
+    """
+
+    def __init__(self, log_dir: str, rotate_rows: int = 10000, rotate_seconds: float = 60.0, max_files: int = 100):
+        self.log_dir = log_dir
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.max_files = max_files
+        self._rows: Dict[str, list] = {name: [] for name in SHADOW_LOG_SCHEMA.names}
+        self._n_rows = 0
+        self._opened_at = time.monotonic()
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def append(self, rows: Dict[str, Sequence]) -> None:
+        """Append columns of equal length keyed like `SHADOW_LOG_SCHEMA`; flushes when a rotation limit is hit."""
+        with self._lock:
+            if self._n_rows == 0:
+                self._opened_at = time.monotonic()
+            for name in SHADOW_LOG_SCHEMA.names:
+                self._rows[name].extend(rows[name])
+            self._n_rows += len(rows["request_id"])
+            due = self._due()
+        if due:
+            self.flush()
+
+    def _due(self) -> bool:
+        return self._n_rows >= self.rotate_rows or (self._n_rows > 0 and time.monotonic() - self._opened_at >= self.rotate_seconds)
+
+    def flush_if_due(self) -> Optional[str]:
+        """Flush if a rotation limit is hit; `append` only checks on new rows, so idle logs need this called periodically."""
+        with self._lock:
+            due = self._due()
+        return self.flush() if due else None
+
+    def flush(self) -> Optional[str]:
+        """Write the buffered rows to a new file; returns its path, None if nothing was buffered."""
+        with self._lock:
+            rows, n_rows = self._rows, self._n_rows
+            self._rows = {name: [] for name in SHADOW_LOG_SCHEMA.names}
+            self._n_rows = 0
+            self._opened_at = time.monotonic()
+            self._sequence += 1
+            sequence = self._sequence
+        if n_rows == 0:
+            return None
+        os.makedirs(self.log_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(self.log_dir, f"shadow-{stamp}-{os.getpid()}-{sequence:06d}.parquet")
+        # Written under a temporary name so readers never see a partial file
+        temp_path = os.path.join(self.log_dir, f".{os.path.basename(path)}.tmp")
+        pq.write_table(pa.table(rows, schema=SHADOW_LOG_SCHEMA), temp_path)
+        os.replace(temp_path, path)
+        for old_path in shadow_log_files(self.log_dir)[:-self.max_files]:
+            os.remove(old_path)
+        return path
+
+
+def shadow_log_files(log_dir: str) -> List[str]:
+    """Log files oldest first (names start with their timestamp)."""
+    return sorted(glob.glob(os.path.join(log_dir, "shadow-*.parquet")))
+
+
+class ShadowScorer:
+    """
+    Scores requests with a challenger `ServingModel` off the request path.
+
+    Parameters:
+    - challenger: the version under evaluation
+    - log: ShadowLog receiving the paired probabilities
+    - max_workers: threads of the challenger's own pool
+    - max_pending: shadow calls queued or running before new ones are dropped
+    - sample_rate: fraction of champion calls mirrored to the challenger
+    """
+
+    def __init__(self, challenger: ServingModel, log: ShadowLog, max_workers: int = 1, max_pending: int = 16,
+                 sample_rate: float = 1.0):
+        self.challenger = challenger
+        self.log = log
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.sample_rate = sample_rate
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stop_flushing = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="shadow")
+            self._stop_flushing.clear()
+            self._flusher = threading.Thread(target=self._flush_periodically, name="shadow-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        """Write rows left in the log buffer once they are due, checking every quarter of rotate_seconds."""
+        while not self._stop_flushing.wait(self.log.rotate_seconds / 4):
+            try:
+                self.log.flush_if_due()
+            except Exception as e:
+                logger.error(f"Shadow log flush failed: {e}", exc_info=True)
+
+    def submit(self, champion: ServingModel, requests: List[Any], request_ids: List[str],
+               champion_probs: List[float], champion_features: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """
+        Queue challenger scoring of `requests` already scored by `champion`; never blocks.
+        Given the champion's model inputs of the requests and the same feature list, the
+        challenger scores those instead of preprocessing the requests again.
+
+        Returns:
+        bool: False if the call was sampled out, dropped because the pool is behind, or the
+        scorer is not started.
+        """
+        pool = self._pool
+        if pool is None or not requests or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                SHADOW_ROWS.labels(outcome="dropped").inc(len(requests))
+                return False
+            self._pending += 1
+        try:
+            pool.submit(self._score, champion, list(requests), list(request_ids), list(champion_probs), champion_features)
+        except RuntimeError:
+            # Pool already shut down
+            with self._lock:
+                self._pending -= 1
+            return False
+        return True
+
+    def _score(self, champion: ServingModel, requests: List[Any], request_ids: List[str],
+               champion_probs: List[float], champion_features: Optional[List[Dict[str, Any]]]) -> None:
+        try:
+            if champion_features is not None and self.challenger.feature_names == champion.feature_names:
+                input_data = model_input_frame(pd.DataFrame(champion_features, columns=champion.feature_names))
+                challenger_probs = score_batch(self.challenger.model, self.challenger.explainer, input_data, explain=False)[0].tolist()
+            else:
+                challenger_probs = [row[1] for row in self.challenger.batch_score_fn(requests, "none")]
+            timestamp = datetime.now().isoformat()
+            n_rows = len(requests)
+            self.log.append({"timestamp": [timestamp] * n_rows,
+                             "request_id": request_ids,
+                             "champion_version": [champion.version] * n_rows,
+                             "challenger_version": [self.challenger.version] * n_rows,
+                             "champion_prob": champion_probs,
+                             "challenger_prob": challenger_probs,
+                             "champion_threshold": [champion.threshold] * n_rows,
+                             "challenger_threshold": [self.challenger.threshold] * n_rows})
+            SHADOW_ROWS.labels(outcome="scored").inc(n_rows)
+        except Exception as e:
+            SHADOW_ROWS.labels(outcome="failed").inc(len(requests))
+            logger.error(f"Shadow scoring with model version {self.challenger.version} failed: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self) -> None:
+        """Finish the queued shadow calls and write the buffered rows."""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+        flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            self._stop_flushing.set()
+            flusher.join()
+        self.log.flush()
+
+
+def population_stability_index(expected: np.ndarray, actual: np.ndarray, n_bins: int = 10) -> float:
+    """PSI of `actual` against `expected`, binned on the deciles (by default) of `expected`."""
+    edges = np.unique(np.quantile(expected, np.linspace(0, 1, n_bins + 1)))
+    edges[0], edges[-1] = -np.inf, np.inf
+    expected_share = np.histogram(expected, bins=edges)[0] / len(expected)
+    actual_share = np.histogram(actual, bins=edges)[0] / len(actual)
+    # Empty bins would make the log infinite
+    expected_share = np.clip(expected_share, 1e-6, None)
+    actual_share = np.clip(actual_share, 1e-6, None)
+    return float(np.sum((actual_share - expected_share) * np.log(actual_share / expected_share)))
+
+
+def distribution_ks(first: np.ndarray, second: np.ndarray) -> float:
+    """Two-sample Kolmogorov-Smirnov distance between two score samples, in percent like `calculate_ks_statistic`."""
+    values = np.sort(np.concatenate([first, second]))
+    first_cdf = np.searchsorted(np.sort(first), values, side="right") / len(first)
+    second_cdf = np.searchsorted(np.sort(second), values, side="right") / len(second)
+    return float(np.round(np.max(np.abs(first_cdf - second_cdf)) * 100, 2))
+
+
+def read_shadow_log(log_dir: str, since: Optional[str] = None) -> pd.DataFrame:
+    """All logged pairs, optionally only those with timestamp >= `since` (ISO format)."""
+    paths = shadow_log_files(log_dir)
+    if not paths:
+        return SHADOW_LOG_SCHEMA.empty_table().to_pandas()
+    log = pa.concat_tables([pq.read_table(path) for path in paths]).to_pandas()
+    if since is not None:
+        log = log[log["timestamp"] >= since]
+    return log.reset_index(drop=True)
+
+
+def compare_scores(log: pd.DataFrame, labels: Optional[pd.DataFrame] = None, target_col: str = "TARGET") -> Dict[str, Any]:
+    """
+    Champion / challenger comparison of logged pairs.
+
+    Parameters:
+    - log: frame read by `read_shadow_log`
+    - labels: optional frame with request_id and `target_col`; adds KS, ROC AUC and GINI of
+      both versions on the labelled pairs (`calculate_performance_metrics`)
+
+    Returns:
+    dict: versions, number of pairs, mean / max absolute probability difference, correlation,
+    PSI and KS between the two score distributions, and the share of requests where both
+    versions make the same decision at their own thresholds.
+    """
+    report: Dict[str, Any] = {"n_pairs": len(log), "computed_at": datetime.now().isoformat(timespec="seconds")}
+    if log.empty:
+        return report
+    champion = log["champion_prob"].to_numpy(dtype=float)
+    challenger = log["challenger_prob"].to_numpy(dtype=float)
+    difference = challenger - champion
+    report.update({
+        "champion_versions": sorted(log["champion_version"].unique().tolist()),
+        "challenger_versions": sorted(log["challenger_version"].unique().tolist()),
+        "first_timestamp": log["timestamp"].min(),
+        "last_timestamp": log["timestamp"].max(),
+        "champion_mean_prob": float(champion.mean()),
+        "challenger_mean_prob": float(challenger.mean()),
+        "mean_difference": float(difference.mean()),
+        "mean_abs_difference": float(np.abs(difference).mean()),
+        "max_abs_difference": float(np.abs(difference).max()),
+        "correlation": float(np.corrcoef(champion, challenger)[0, 1]) if len(log) > 1 else None,
+        "psi": population_stability_index(champion, challenger),
+        "ks_distance": distribution_ks(champion, challenger),
+        "decision_agreement": float(np.mean((champion > log["champion_threshold"].to_numpy())
+                                            == (challenger > log["challenger_threshold"].to_numpy()))),
+    })
+
+    if labels is not None:
+        labelled = log.merge(labels[["request_id", target_col]], on="request_id", how="inner")
+        report["n_labelled"] = len(labelled)
+        # ROC AUC needs both classes
+        if labelled[target_col].nunique() == 2:
+            performance = {}
+            for name in ["champion", "challenger"]:
+                metrics = calculate_performance_metrics(labelled, score_col=f"{name}_prob", target_col=target_col)
+                performance[name] = {metric: float(value) for metric, value in metrics.iloc[0].items()}
+            report["performance"] = performance
+    return report
+
+
+def compare_shadow_log(log_dir: str, labels_path: Optional[str] = None, target_col: str = "TARGET",
+                       since: Optional[str] = None) -> Dict[str, Any]:
+    """`compare_scores` of the log in `log_dir`, with labels read from a Parquet or CSV file."""
+    labels = None
+    if labels_path is not None:
+        labels = pd.read_parquet(labels_path) if labels_path.endswith(".parquet") else pd.read_csv(labels_path)
+    return compare_scores(read_shadow_log(log_dir, since), labels, target_col)
+
+
+def write_comparison(log_dir: str, report: Dict[str, Any]) -> str:
+    path = os.path.join(log_dir, COMPARISON_FILE)
+    os.makedirs(log_dir, exist_ok=True)
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    with open(temp_path, "w") as file_obj:
+        json.dump(report, file_obj, indent=2)
+    os.replace(temp_path, path)
+    return path
+
+
+def try_compare_lock(log_dir: str) -> Optional[int]:
+    """Descriptor holding the exclusive lock on <log_dir>/.compare.lock, None if another process holds it."""
+    os.makedirs(log_dir, exist_ok=True)
+    fd = os.open(os.path.join(log_dir, COMPARE_LOCK_FILE), os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+async def compare_periodically(log_dir: str, interval_s: float, labels_path: Optional[str] = None) -> None:
+    """
+    Recompute the comparison every `interval_s` into <log_dir>/comparison.json; runs until cancelled.
+
+    Every gunicorn worker runs this, but only the one holding the compare lock compares; the
+    others keep trying, so one of them takes over when that worker exits.
+    """
+    lock_fd = None
+    try:
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                if lock_fd is None:
+                    lock_fd = await asyncio.to_thread(try_compare_lock, log_dir)
+                    if lock_fd is None:
+                        continue
+                report = await asyncio.to_thread(compare_shadow_log, log_dir, labels_path)
+                await asyncio.to_thread(write_comparison, log_dir, report)
+                logger.info(f"Shadow comparison over {report['n_pairs']} pairs: "
+                            f"mean abs difference {report.get('mean_abs_difference')}, PSI {report.get('psi')}")
+            except Exception as e:
+                logger.error(f"Shadow comparison failed: {e}", exc_info=True)
+    finally:
+        if lock_fd is not None:
+            os.close(lock_fd)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare champion and challenger scores of the shadow log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compare = commands.add_parser("compare", help="Print the comparison report as JSON")
+    compare.add_argument("--log-dir", default="logs/shadow")
+    compare.add_argument("--labels", default=None, help="Parquet or CSV file with request_id and the target column")
+    compare.add_argument("--target-col", default="TARGET")
+    compare.add_argument("--since", default=None, help="Only pairs logged at or after this ISO timestamp")
+    compare.add_argument("--write", action="store_true", help=f"Also write <log-dir>/{COMPARISON_FILE}")
+    args = parser.parse_args(argv)
+
+    report = compare_shadow_log(args.log_dir, args.labels, args.target_col, args.since)
+    if args.write:
+        write_comparison(args.log_dir, report)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import asyncio
+import io
+import json
+import queue
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+import orjson
+import pyarrow as pa
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from src.inference.request_validation import FIELD_TYPES, validate_batch, validate_columns
+from src.inference.metrics import BATCH_SIZE
+from src.inference.scorecard import scorecard
+from src.inference.serialization import aligned, dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+class BodyStream(io.RawIOBase):
+    """
+    Blocking, read-only file object over request body chunks pushed from the event loop.
+
+    At most `max_chunks` chunks are buffered: `feed` blocks when the reader falls behind,
+    which holds back reading the request body and keeps memory flat for any input size.
+    """
+
+    def __init__(self, max_chunks: int = 16):
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._current = memoryview(b"")
+        self._eof = False
+        self._aborted = False
+        self._error: Optional[BaseException] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def feed(self, chunk: Optional[bytes]) -> None:
+        """Queue a body chunk (None marks the end of the body); called from a worker thread."""
+        while not self._aborted:
+            try:
+                self._chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def abort(self) -> None:
+        """Unblock both sides, e.g. when the client disconnects."""
+        self._aborted = True
+
+    def fail(self, error: BaseException) -> None:
+        """End the body with `error`: the reader raises instead of taking a truncated body for a complete one."""
+        self._error = error
+        self._aborted = True
+
+    def readinto(self, buffer) -> int:
+        while not len(self._current) and not self._eof:
+            if self._error is not None:
+                raise IOError(f"Request body upload failed: {self._error!r}") from self._error
+            if self._aborted:
+                raise IOError("Request body stream aborted")
+            try:
+                chunk = self._chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                self._eof = True
+            else:
+                self._current = memoryview(chunk)
+        n_bytes = min(len(buffer), len(self._current))
+        buffer[:n_bytes] = self._current[:n_bytes]
+        self._current = self._current[n_bytes:]
+        return n_bytes
+
+
+async def pump_body(body_chunks: AsyncIterator[bytes], body: BodyStream) -> None:
+    """
+    Copy an ASGI request body into `body`, waiting whenever its buffer is full. The end of the
+    body is marked only once it was read completely; an upload error (e.g. ClientDisconnect)
+    fails `body` instead.
+    """
+    try:
+        async for chunk in body_chunks:
+            if chunk:
+                await asyncio.to_thread(body.feed, chunk)
+    except Exception as e:
+        body.fail(e)
+        raise
+    await asyncio.to_thread(body.feed, None)
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for handlers that are still reading the request body while responding.
+
+    Starlette's StreamingResponse listens for disconnects by calling `receive()` under
+    ASGI < 2.4 (uvicorn reports 2.3), which would steal the body messages from
+    `request.stream()`. Here only the body reader calls `receive()`, and it sees the disconnect.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+def ndjson_chunks(body: io.RawIOBase, chunk_size: int) -> Iterator[List[Any]]:
+    """
+    Read NDJSON rows in chunks of `chunk_size`. Blank lines are skipped; a line that is not
+    a JSON object is passed on as None so it is reported as a failed row.
+    """
+    rows = []
+    for line in io.BufferedReader(body):
+        if not line.strip():
+            continue
+        try:
+            row = orjson.loads(line)
+        except ValueError:
+            row = None
+        rows.append(row if isinstance(row, dict) else None)
+        if len(rows) == chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def arrow_chunks(reader: pa.ipc.RecordBatchStreamReader, chunk_size: int) -> Iterator[pa.RecordBatch]:
+    """Read an Arrow IPC stream as record batches of at most `chunk_size` rows, for `score_columns`."""
+    for record_batch in reader:
+        for offset in range(0, record_batch.num_rows, chunk_size):
+            yield record_batch.slice(offset, chunk_size)
+
+
+def score_rows(score_fn: Callable, rows: List[Optional[Dict[str, Any]]], explain: str, first_row: int) -> List[Dict[str, Any]]:
+    """
+    Validate and score one chunk of raw rows.
+
+    Args:
+    score_fn: Batch scorer with the signature of `score_requests(requests, explain)`, e.g. a partial.
+    rows: Row dicts, None for rows that could not be parsed.
+    explain (str): none, top3 or full.
+    first_row (int): Position of the chunk's first row in the whole stream.
+
+    Returns:
+    list: One result dict per row with row, status, prediction_prob, three_digit_score, risk_band,
+    top_3_reason_codes, reason_texts and failure_reason, plus shap_values for explain='full'.
+    """
+    BATCH_SIZE.labels(source="stream").observe(len(rows))
+    parsed = {position: row for position, row in enumerate(rows) if row is not None}
+    valid_requests, failure_reasons = validate_batch(list(parsed.values()))
+    positions = list(parsed.keys())
+    valid_requests = {positions[index]: request for index, request in valid_requests.items()}
+    failure_reasons = {positions[index]: reasons for index, reasons in failure_reasons.items()}
+    for position, row in enumerate(rows):
+        if row is None:
+            failure_reasons[position] = {"request": "Row is not a JSON object"}
+    return score_validated(score_fn, len(rows), valid_requests, failure_reasons, explain, first_row)
+
+
+def score_columns(score_fn: Callable, record_batch: pa.RecordBatch, explain: str, first_row: int) -> List[Dict[str, Any]]:
+    """
+    `score_rows` for one chunk of an Arrow stream: the request columns are validated as NumPy
+    arrays with `validate_columns`, without building a dict per row.
+    """
+    BATCH_SIZE.labels(source="stream").observe(record_batch.num_rows)
+    columns = {name: record_batch.column(name).to_numpy(zero_copy_only=False)
+               for name in FIELD_TYPES if name in record_batch.schema.names}
+    validation = validate_columns(columns, n_rows=record_batch.num_rows)
+    return score_validated(score_fn, record_batch.num_rows, validation.requests(), validation.failure_reasons,
+                           explain, first_row)
+
+
+def score_validated(score_fn: Callable, n_rows: int, valid_requests: Dict[int, Any],
+                    failure_reasons: Dict[int, Dict[str, str]], explain: str, first_row: int) -> List[Dict[str, Any]]:
+    """Score the valid requests of a chunk of `n_rows` rows and build the result of every row, see `score_rows`."""
+    scored = {}
+    if valid_requests:
+        scored_rows = score_fn(list(valid_requests.values()), explain)
+        scored = dict(zip(valid_requests.keys(), scored_rows))
+        scores, risk_bands = scorecard.apply([scored_row[1] for scored_row in scored_rows])
+        scorecards = dict(zip(valid_requests.keys(), zip(scores, risk_bands)))
+
+    results = []
+    for position in range(n_rows):
+        result = {"row": first_row + position, "status": "Failed", "prediction_prob": None, "three_digit_score": None,
+                  "risk_band": None, "top_3_reason_codes": {}, "reason_texts": [],
+                  "failure_reason": failure_reasons.get(position, {})}
+        if position in scored:
+            _, prediction_prob, all_shap_dict, top_shap_dict = scored[position]
+            score, risk_band = scorecards[position]
+            result.update(status="Success", prediction_prob=prediction_prob, three_digit_score=score, risk_band=risk_band,
+                          top_3_reason_codes=top_shap_dict, reason_texts=scorecard.reason_texts(top_shap_dict))
+            if explain == "full":
+                result["shap_values"] = all_shap_dict
+        elif explain == "full":
+            result["shap_values"] = {}
+        results.append(result)
+    return results
+
+
+def compact_results(results: List[Dict[str, Any]], model_feature_names: List[str]) -> List[Dict[str, Any]]:
+    """Results with shap_values as an array in `model_feature_names` order."""
+    return [{**result, "shap_values": aligned(result["shap_values"], model_feature_names)} if "shap_values" in result else result
+            for result in results]
+
+
+def ndjson_header(model_feature_names: List[str]) -> bytes:
+    """First line of a compact NDJSON result stream, naming the entries of every shap_values array."""
+    return dumps({"model_feature_names": model_feature_names}) + b"\n"
+
+
+def encode_ndjson(results: List[Dict[str, Any]]) -> bytes:
+    return b"".join(dumps(result) + b"\n" for result in results)
+
+
+def arrow_result_schema(explain: str, model_feature_names: Optional[List[str]] = None) -> pa.Schema:
+    """
+    Result schema; with `model_feature_names` (compact layout) shap_values is a list in that
+    order, and the names are stored in the schema metadata under model_feature_names.
+    """
+    fields = [pa.field("row", pa.int64()),
+              pa.field("status", pa.string()),
+              pa.field("prediction_prob", pa.float64()),
+              pa.field("three_digit_score", pa.int64()),
+              pa.field("risk_band", pa.string()),
+              pa.field("top_3_reason_codes", pa.map_(pa.string(), pa.float64())),
+              pa.field("reason_texts", pa.list_(pa.string())),
+              pa.field("failure_reason", pa.map_(pa.string(), pa.string()))]
+    if explain == "full":
+        shap_type = pa.list_(pa.float64()) if model_feature_names is not None else pa.map_(pa.string(), pa.float64())
+        fields.append(pa.field("shap_values", shap_type))
+    if model_feature_names is None:
+        return pa.schema(fields)
+    return pa.schema(fields, metadata={"model_feature_names": json.dumps(model_feature_names)})
+
+
+class ArrowResultEncoder:
+    """Encode result chunks as consecutive pieces of one Arrow IPC stream."""
+
+    def __init__(self, explain: str, model_feature_names: Optional[List[str]] = None):
+        self.schema = arrow_result_schema(explain, model_feature_names)
+        self._sink = io.BytesIO()
+        self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def encode(self, results: List[Dict[str, Any]]) -> bytes:
+        columns = {name: [result[name] for result in results] for name in self.schema.names}
+        columns = {name: [list(value.items()) if isinstance(value, dict) else value for value in values]
+                   for name, values in columns.items()}
+        self._writer.write_batch(pa.record_batch(columns, schema=self.schema))
+        return self._drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._drain()
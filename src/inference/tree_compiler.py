@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from numba import njit, prange
+from typing import Dict, List, Optional
+from src.logging.custom_logging import logger
+from src.utils.other_utils import load_object
+from src.inference.preprocessing import inference_config, preprocessing, model_input_frame
+from src.inference.model_registry import ModelRegistry
+
+
+# Node arrays written by `export_model`, one .npy file each
+NODE_ARRAYS = ["left_children", "right_children", "split_indices", "split_conditions",
+               "default_left", "is_categorical", "category_start", "category_end"]
+MODEL_ARRAYS = NODE_ARRAYS + ["categories", "tree_roots"]
+
+# Smaller inputs are scored on the calling thread. This keeps request-sized calls free of
+# threading overhead and means Numba's thread pool is never started by the startup checks,
+# which would make a preloaded gunicorn master unsafe to fork.
+PARALLEL_MIN_ROWS = 1024
+
+
+def export_model(model) -> Dict[str, np.ndarray]:
+    """
+    Flatten the trees of a fitted XGBClassifier into contiguous node arrays.
+
+    All trees are concatenated; child indices are global node positions (-1 for leaves)
+    and leaf values are stored in `split_conditions`, as in XGBoost's JSON model. Only the
+    trees used by `predict_proba` (up to the best iteration) are exported. Categorical
+    splits keep their sorted category list in `categories[category_start:category_end]`.
+
+    Returns:
+    dict: Node arrays plus `tree_roots`, `categories`, `base_margin` and the feature names.
+    """
+    booster = model.get_booster()
+    raw_model = json.loads(booster.save_raw("json"))
+    learner = raw_model["learner"]
+    objective = learner["objective"]["name"]
+    if objective != "binary:logistic":
+        raise ValueError(f"Only binary:logistic models can be compiled, got {objective}")
+
+    trees = learner["gradient_booster"]["model"]["trees"]
+    best_iteration = getattr(model, "best_iteration", None)
+    if best_iteration is not None:
+        trees = trees[:best_iteration + 1]
+
+    arrays = {name: [] for name in NODE_ARRAYS}
+    categories, tree_roots = [], []
+    offset = 0
+    for tree in trees:
+        n_nodes = len(tree["left_children"])
+        tree_roots.append(offset)
+        left = np.asarray(tree["left_children"], dtype=np.int32)
+        right = np.asarray(tree["right_children"], dtype=np.int32)
+        arrays["left_children"].append(np.where(left == -1, -1, left + offset))
+        arrays["right_children"].append(np.where(right == -1, -1, right + offset))
+        arrays["split_indices"].append(np.asarray(tree["split_indices"], dtype=np.int32))
+        arrays["split_conditions"].append(np.asarray(tree["split_conditions"], dtype=np.float32))
+        arrays["default_left"].append(np.asarray(tree["default_left"], dtype=np.uint8))
+        arrays["is_categorical"].append(np.asarray(tree["split_type"], dtype=np.uint8))
+
+        category_start = np.zeros(n_nodes, dtype=np.int64)
+        category_end = np.zeros(n_nodes, dtype=np.int64)
+        for node, segment, size in zip(tree["categories_nodes"], tree["categories_segments"], tree["categories_sizes"]):
+            category_start[node] = len(categories)
+            categories.extend(sorted(tree["categories"][segment:segment + size]))
+            category_end[node] = len(categories)
+        arrays["category_start"].append(category_start)
+        arrays["category_end"].append(category_end)
+        offset += n_nodes
+
+    exported = {name: np.ascontiguousarray(np.concatenate(parts)) for name, parts in arrays.items()}
+    exported["categories"] = np.asarray(categories, dtype=np.int64)
+    exported["tree_roots"] = np.asarray(tree_roots, dtype=np.int64)
+
+    base_score = float(learner["learner_model_param"]["base_score"])
+    exported["base_margin"] = np.float64(np.log(base_score / (1 - base_score)))
+    exported["feature_names"] = list(booster.feature_names)
+    logger.info(f"Exported {len(tree_roots)} trees with {offset} nodes")
+    return exported
+
+
+@njit(cache=True)
+def _contains(sorted_values, start, end, value):
+    # Binary search in sorted_values[start:end]
+    low, high = start, end
+    while low < high:
+        middle = (low + high) // 2
+        if sorted_values[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low < end and sorted_values[low] == value
+
+
+@njit(cache=True)
+def _leaf_sum(row, left_children, right_children, split_indices, split_conditions, default_left,
+              is_categorical, category_start, category_end, categories, tree_roots):
+    total = 0.0
+    for t in range(tree_roots.shape[0]):
+        node = tree_roots[t]
+        while left_children[node] != -1:
+            value = row[split_indices[node]]
+            if np.isnan(value):
+                go_left = default_left[node] == 1
+            elif is_categorical[node] == 1:
+                # Categories listed on the node go right, everything else (including unseen codes) goes left
+                go_left = value < 0 or not _contains(categories, category_start[node], category_end[node], np.int64(value))
+            else:
+                go_left = np.float32(value) < split_conditions[node]
+            node = left_children[node] if go_left else right_children[node]
+        total += split_conditions[node]
+    return total
+
+
+@njit(cache=True)
+def _predict_margin_serial(X, left_children, right_children, split_indices, split_conditions, default_left,
+                           is_categorical, category_start, category_end, categories, tree_roots, base_margin):
+    margins = np.empty(X.shape[0], dtype=np.float64)
+    for i in range(X.shape[0]):
+        margins[i] = base_margin + _leaf_sum(X[i], left_children, right_children, split_indices, split_conditions,
+                                             default_left, is_categorical, category_start, category_end,
+                                             categories, tree_roots)
+    return margins
+
+
+@njit(cache=True, parallel=True)
+def _predict_margin(X, left_children, right_children, split_indices, split_conditions, default_left,
+                    is_categorical, category_start, category_end, categories, tree_roots, base_margin):
+    margins = np.empty(X.shape[0], dtype=np.float64)
+    for i in prange(X.shape[0]):
+        margins[i] = base_margin + _leaf_sum(X[i], left_children, right_children, split_indices, split_conditions,
+                                             default_left, is_categorical, category_start, category_end,
+                                             categories, tree_roots)
+    return margins
+
+
+class CompiledModel:
+    """
+    Tree ensemble exported by `export_model`, scored by a Numba JIT kernel without XGBoost.
+
+    Input rows are float matrices in `feature_names` order with categories given as their
+    integer codes and missing values as NaN, i.e. the output of `FeaturePlan.encode`.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.feature_names = list(arrays["feature_names"])
+        self.base_margin = float(arrays["base_margin"])
+        self._kernel_args = tuple(arrays[name] for name in MODEL_ARRAYS)
+
+    def predict_margin(self, X: np.ndarray) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        kernel = _predict_margin if X.shape[0] >= PARALLEL_MIN_ROWS else _predict_margin_serial
+        return kernel(X, *self._kernel_args, self.base_margin)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probability of default for each row, shape (n_rows,)."""
+        return 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+
+    def save(self, directory: str) -> None:
+        """Write one .npy file per array plus a metadata JSON, so arrays can be memory-mapped."""
+        os.makedirs(directory, exist_ok=True)
+        for name in MODEL_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), self.arrays[name])
+        with open(os.path.join(directory, "metadata.json"), "w") as file_obj:
+            json.dump({"feature_names": self.feature_names, "base_margin": self.base_margin}, file_obj, indent=2)
+        logger.info(f"Saved compiled model to {directory}")
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = False) -> "CompiledModel":
+        """Load a compiled model; with `mmap` the node arrays are memory-mapped read-only."""
+        with open(os.path.join(directory, "metadata.json")) as file_obj:
+            metadata = json.load(file_obj)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                  for name in MODEL_ARRAYS}
+        arrays.update(metadata)
+        logger.info(f"Loaded compiled model from {directory}")
+        return cls(arrays)
+
+    @classmethod
+    def from_model(cls, model) -> "CompiledModel":
+        return cls(export_model(model))
+
+
+def frame_to_matrix(input_data: pd.DataFrame) -> np.ndarray:
+    """Output of `preprocessing` as a float matrix: categories as codes, missing values as NaN."""
+    columns = []
+    for name in input_data.columns:
+        if isinstance(input_data[name].dtype, pd.CategoricalDtype):
+            codes = input_data[name].cat.codes.to_numpy(dtype=np.float64)
+            codes[codes < 0] = np.nan
+            columns.append(codes)
+        else:
+            columns.append(input_data[name].to_numpy(dtype=np.float64, na_value=np.nan))
+    return np.column_stack(columns)
+
+
+def validate_compiled(compiled: CompiledModel, model, input_data: pd.DataFrame, tolerance: float = 1e-6) -> float:
+    """
+    Compare compiled probabilities with `model.predict_proba` on a preprocessed frame.
+
+    Returns:
+    float: The largest absolute difference.
+
+    Raises:
+    ValueError: If the difference exceeds `tolerance`.
+    """
+    expected = model.predict_proba(input_data)[:, 1]
+    actual = compiled.predict_proba(frame_to_matrix(input_data))
+    max_diff = float(np.max(np.abs(actual - expected)))
+    if max_diff > tolerance:
+        raise ValueError(f"Compiled model differs from predict_proba by {max_diff} (tolerance {tolerance})")
+    logger.info(f"Compiled model matches predict_proba on {len(input_data)} rows (max difference {max_diff})")
+    return max_diff
+
+
+def load_validation_frame(data_path: Optional[str] = None) -> pd.DataFrame:
+    """
+    Model input frame for validation: the given Parquet/CSV file (raw application columns
+    or already engineered features), or the synthetic parity requests when no file is given.
+    """
+    if data_path is None:
+        from src.inference.fast_path import parity_requests
+        return preprocessing(pd.DataFrame([request.model_dump() for request in parity_requests(n_random=5000)]))
+
+    df = pd.read_parquet(data_path) if data_path.endswith(".parquet") else pd.read_csv(data_path)
+    return model_input_frame(df)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compile the XGBoost model into Numba-scored node arrays")
+    parser.add_argument("--model", default=None, help="Default: the model of the registry's CURRENT version")
+    parser.add_argument("--output", required=True,
+                        help="Directory to write, then published with `model_registry publish --compiled-model`")
+    parser.add_argument("--validate-data", default=None,
+                        help="Parquet/CSV file to validate on, e.g. data/Feature_Store/app_test.parquet (default: synthetic requests)")
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    args = parser.parse_args(argv)
+
+    model_path = args.model
+    if model_path is None:
+        registry = ModelRegistry(inference_config['model_registry']['path'])
+        model_path = registry.artifact_path(registry.current_version(), "model")
+    model = load_object(model_path)
+    compiled = CompiledModel.from_model(model)
+    validate_compiled(compiled, model, load_validation_frame(args.validate_data), tolerance=args.tolerance)
+    compiled.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+from typing import Any, Dict, List, Optional
+import psutil
+
+
+def _mb(n_bytes: Optional[int]) -> Optional[float]:
+    return round(n_bytes / (1024 * 1024), 2) if n_bytes is not None else None
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Memory use of a process in MB.
+
+    RSS counts pages shared copy-on-write with the gunicorn master in every worker, so it
+    overstates the real cost of preloaded artifacts. USS (pages private to the process) and
+    PSS (private pages plus an even share of the shared ones) show the savings; they are
+    only available on Linux and are None elsewhere.
+    """
+    process = psutil.Process(pid or os.getpid())
+    try:
+        memory = process.memory_full_info()
+    except (psutil.AccessDenied, NotImplementedError):
+        memory = process.memory_info()
+    return {
+        "pid": process.pid,
+        "rss_mb": _mb(memory.rss),
+        "uss_mb": _mb(getattr(memory, "uss", None)),
+        "pss_mb": _mb(getattr(memory, "pss", None)),
+        "shared_mb": _mb(getattr(memory, "shared", None)),
+    }
+
+
+def gunicorn_memory(master_pid: int) -> Dict[str, Any]:
+    """
+    Memory of a gunicorn master and its workers, with totals.
+
+    `total_pss_mb` is the actual footprint of the whole server; compare it with
+    `total_rss_mb` to see how much the workers share.
+    """
+    master = psutil.Process(master_pid)
+    workers: List[Dict[str, Any]] = []
+    for child in master.children():
+        try:
+            workers.append(process_memory(child.pid))
+        except psutil.NoSuchProcess:
+            continue
+    processes = [process_memory(master_pid)] + workers
+
+    def total(key: str) -> Optional[float]:
+        values = [process[key] for process in processes]
+        return round(sum(values), 2) if None not in values else None
+
+    return {
+        "master": processes[0],
+        "workers": workers,
+        "n_workers": len(workers),
+        "total_rss_mb": total("rss_mb"),
+        "total_uss_mb": total("uss_mb"),
+        "total_pss_mb": total("pss_mb"),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Report the memory of a gunicorn master and its workers")
+    parser.add_argument("--pid", type=int, required=True, help="PID of the gunicorn master")
+    args = parser.parse_args(argv)
+    print(json.dumps(gunicorn_memory(args.pid), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,221 @@
+"""
+Logging setup shared by the whole project, configured from environment variables:
+
+- LOG_DIR / LOG_FILE: log file location (default logs/credit_risk.log). Only the process
+  that configured logging first writes and rotates it: forked children (gunicorn workers,
+  process pools) send their records to its writer through a multiprocessing queue, and so do
+  spawned pool workers started with the `log_to_parent` initializer.
+- LOG_LEVEL: root log level (default INFO)
+- LOG_FORMAT: text (default) or json, one JSON object per line via python-json-logger
+- LOG_ASYNC: true (default) puts records on a queue written by a background thread, so
+  file and console I/O stay off the request path; false writes synchronously
+- LOG_ROTATION: size (default, LOG_MAX_BYTES per file) or time (LOG_ROTATE_WHEN, e.g.
+  midnight), keeping LOG_BACKUP_COUNT old files
+- LOG_REQUEST_SAMPLE_RATE: fraction of per-request info logs (`request_logger`) kept (default 1.0)
+"""
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
+import multiprocessing.util
 import os
-from datetime import datetime
+import queue
+import random
 import sys
+import zlib
+from pythonjsonlogger.json import JsonFormatter
+
+TEXT_FORMAT = "[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s"
+JSON_FORMAT = "%(asctime)s %(name)s %(lineno)d %(levelname)s %(message)s"
+
+
+def settings_from_env() -> dict:
+    return {
+        "log_dir": os.getenv("LOG_DIR", os.path.join(os.getcwd(), "logs")),
+        "log_file": os.getenv("LOG_FILE", "credit_risk.log"),
+        "level": os.getenv("LOG_LEVEL", "INFO").upper(),
+        "log_format": os.getenv("LOG_FORMAT", "text"),
+        "async_mode": os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes"),
+        "rotation": os.getenv("LOG_ROTATION", "size"),
+        "max_bytes": int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        "backup_count": int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        "when": os.getenv("LOG_ROTATE_WHEN", "midnight"),
+        "request_sample_rate": float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "1.0")),
+    }
+
+
+class RequestSamplingFilter(logging.Filter):
+    """
+    Keep a fraction of the info and debug records, warnings and errors always pass.
+
+    Records logged with `extra={"request_id": ...}` are sampled on a hash of the id, so
+    either all lines of a request are kept or none; other records are sampled at random.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate >= 1.0:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return random.random() < self.rate
+        return zlib.crc32(str(request_id).encode()) / 0xFFFFFFFF < self.rate
+
+
+def _output_handlers(settings: dict) -> list:
+    """The file handler, unless `log_file` is None, and the console handler of `settings`."""
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if settings["log_file"] is not None:
+        log_dir = settings["log_dir"]
+        os.makedirs(log_dir, exist_ok=True)
+        log_file_path = os.path.join(log_dir, settings["log_file"])
+        if settings["rotation"] == "time":
+            file_handler = logging.handlers.TimedRotatingFileHandler(log_file_path, when=settings["when"],
+                                                                     backupCount=settings["backup_count"])
+        elif settings["rotation"] == "size":
+            file_handler = logging.handlers.RotatingFileHandler(log_file_path, maxBytes=settings["max_bytes"],
+                                                                backupCount=settings["backup_count"])
+        else:
+            raise ValueError("LOG_ROTATION must be one of size, time")
+        handlers.insert(0, file_handler)
+
+    if settings["log_format"] == "json":
+        formatter = JsonFormatter(JSON_FORMAT, rename_fields={"asctime": "timestamp", "levelname": "level"})
+    elif settings["log_format"] == "text":
+        formatter = logging.Formatter(TEXT_FORMAT)
+    else:
+        raise ValueError("LOG_FORMAT must be one of text, json")
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+_settings = None
+_handlers = []
+_listener = None
+# Records of the child processes, written by `_child_listener` to the same handlers
+_child_queue = None
+_child_listener = None
+# Set in a child process: the queue its records are sent to
+_to_parent = None
 
-LOG_FILE=f"{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.log"
 
-logs_path=os.path.join(os.getcwd(),"logs")
-os.makedirs(logs_path,exist_ok=True)
+def _stop_listener() -> None:
+    global _listener, _child_listener, _handlers
+    if _to_parent is not None:
+        # Child process: flushes the records still on their way to the parent
+        _remove_root_handlers()
+        _to_parent.close()
+        _to_parent.join_thread()
+        return
+    # Flushes the records still on the queues
+    for listener in (_listener, _child_listener):
+        if listener is not None:
+            listener.stop()
+    _listener = _child_listener = None
+    for handler in _handlers:
+        handler.close()
+    _handlers = []
 
-LOG_FILE_PATH = os.path.join(logs_path,LOG_FILE)
 
-logging.basicConfig(
-    format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler(LOG_FILE_PATH),# Log to a file
-        logging.StreamHandler(sys.stdout) # Log to console
-    ]
-)
+def _remove_root_handlers() -> None:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def _start_child_listener() -> None:
+    global _child_listener
+    _child_listener = logging.handlers.QueueListener(_child_queue, *_handlers, respect_handler_level=True)
+    _child_listener.start()
+
+
+def configure_logging(**overrides) -> None:
+    """(Re)configure the root logger from `settings_from_env()`, updated with `overrides`."""
+    global _settings, _handlers, _listener
+    _stop_listener()
+    _remove_root_handlers()
+
+    _settings = {**settings_from_env(), **overrides}
+    root = logging.getLogger()
+    root.setLevel(_settings["level"])
+    _handlers = _output_handlers(_settings)
+    if _settings["async_mode"]:
+        record_queue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(record_queue))
+        _listener = logging.handlers.QueueListener(record_queue, *_handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in _handlers:
+            root.addHandler(handler)
+    if _child_queue is not None:
+        _start_child_listener()
+
+    request_logger.filters.clear()
+    request_logger.addFilter(RequestSamplingFilter(_settings["request_sample_rate"]))
+
+
+def parent_log_queue():
+    """
+    The queue child processes send their records to, for `log_to_parent`. The first call
+    creates it and starts the thread writing its records.
+    """
+    global _child_queue
+    if _to_parent is not None:
+        return _to_parent
+    if _child_queue is None:
+        # A spawn context queue can be handed to spawned as well as forked children
+        _child_queue = multiprocessing.get_context("spawn").Queue()
+        _start_child_listener()
+    return _child_queue
+
+
+def _send_to_parent() -> None:
+    _remove_root_handlers()
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(_to_parent))
+
+
+def log_to_parent(record_queue) -> None:
+    """
+    Process pool initializer sending the records of a spawned worker to the parent's writer:
+    `ProcessPoolExecutor(..., initializer=log_to_parent, initargs=(parent_log_queue(),))`.
+    """
+    global _to_parent
+    _stop_listener()
+    _to_parent = record_queue
+    _send_to_parent()
+
+
+def _reconfigure_after_fork() -> None:
+    # The writer threads do not survive a fork (e.g. gunicorn workers, process pools), and a
+    # second writer would rotate the parent's file under it: the child sends its records to
+    # the parent's writer instead.
+    global _listener, _child_listener, _handlers, _to_parent
+    _listener = _child_listener = None
+    _handlers = []
+    _to_parent = _to_parent or _child_queue
+    # os.fork does not reset the queue's feeder thread the way multiprocessing does
+    _to_parent._after_fork()
+    _send_to_parent()
 
 
 logger=logging.getLogger(__name__)
-logger.info("Logging initialized")
\ No newline at end of file
+# Per-request info lines, sampled with LOG_REQUEST_SAMPLE_RATE
+request_logger=logging.getLogger(f"{__name__}.requests")
+
+# Spawned children (e.g. the build_features workers) import this module afresh and log to
+# the console until `log_to_parent` routes their records to the parent
+if multiprocessing.parent_process() is not None:
+    configure_logging(log_file=None)
+else:
+    configure_logging()
+# Runs before the exit handler of multiprocessing.util, registered when it was imported above,
+# which closes the child queue
+atexit.register(_stop_listener)
+os.register_at_fork(before=parent_log_queue, after_in_child=_reconfigure_after_fork)
+logger.info("Logging initialized")
@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+from numba import njit
 
 def compute_ratio_columnwise(df, feature1, feature2):
     """
@@ -38,4 +39,67 @@ def compute_ratio_columnwise(df, feature1, feature2):
     valid_ratio_mask = ~(is_feature1_nan | is_feature2_nan | is_feature2_zero)
     result[valid_ratio_mask] = (df.loc[valid_ratio_mask, feature1] / df.loc[valid_ratio_mask, feature2]).round(2)
 
-    return pd.Series(result, index=df.index)  # Return as Pandas Series
\ No newline at end of file
+    return pd.Series(result, index=df.index)  # Return as Pandas Series
+
+@njit(cache=True)
+def _ratio_kernel(columns, numerator_index, denominator_index, out):
+    """
+    Single pass over the rows of `columns` (n_columns, n_rows) writing every ratio of row i
+    into out[:, i], with the rules of `compute_ratio_columnwise`.
+    """
+    n_pairs = numerator_index.shape[0]
+    for i in range(columns.shape[1]):
+        for k in range(n_pairs):
+            numerator = columns[numerator_index[k], i]
+            denominator = columns[denominator_index[k], i]
+            if np.isnan(numerator):
+                out[k, i] = -3.0 if np.isnan(denominator) else -1.0
+            elif np.isnan(denominator):
+                out[k, i] = -2.0
+            elif denominator == 0.0:
+                out[k, i] = -4.0
+            else:
+                # Same rounding as numpy / pandas .round(2)
+                out[k, i] = np.rint(numerator / denominator * 100.0) / 100.0
+
+
+def compute_ratios(df, pairs, names=None, out=None):
+    """
+    Compute several column ratios in one pass, with the handling rules of `compute_ratio_columnwise`
+    (-1 numerator NaN, -2 denominator NaN, -3 both NaN, -4 zero denominator, else rounded to 2 decimals).
+
+    The columns used by the pairs are gathered once into a contiguous float64 block and a
+    compiled kernel fills all ratios row by row, instead of one full pass with several masks
+    and fancy-indexed writes per ratio.
+
+    Parameters:
+    - df: Pandas DataFrame
+    - pairs: list of (numerator column, denominator column)
+    - names: optional list of output column names, default '<numerator>_<denominator>_ratio'
+    - out: optional preallocated float64 array of shape (len(pairs), len(df)) to write into
+
+    Returns:
+    - Pandas DataFrame with one column per pair, backed by `out` when it is given
+    """
+    pairs = [tuple(pair) for pair in pairs]
+    if names is None:
+        names = [f"{numerator}_{denominator}_ratio" for numerator, denominator in pairs]
+    if len(names) != len(pairs):
+        raise ValueError(f"Got {len(names)} names for {len(pairs)} ratio pairs")
+    n_rows = df.shape[0]
+    if out is None:
+        out = np.empty((len(pairs), n_rows), dtype=np.float64)
+    elif out.shape != (len(pairs), n_rows) or out.dtype != np.float64 or not out.flags.c_contiguous:
+        raise ValueError(f"out must be a C-contiguous float64 array of shape {(len(pairs), n_rows)}")
+
+    column_names = list(dict.fromkeys(name for pair in pairs for name in pair))
+    position = {name: index for index, name in enumerate(column_names)}
+    columns = np.empty((len(column_names), n_rows), dtype=np.float64)
+    for index, name in enumerate(column_names):
+        columns[index] = df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+    numerator_index = np.array([position[numerator] for numerator, _ in pairs], dtype=np.int64)
+    denominator_index = np.array([position[denominator] for _, denominator in pairs], dtype=np.int64)
+
+    _ratio_kernel(columns, numerator_index, denominator_index, out)
+    # out.T is the column block pandas stores, so the frame wraps `out` without a copy
+    return pd.DataFrame(out.T, index=df.index, columns=names, copy=False)
@@ -1,3 +1,4 @@
+import hashlib
 import yaml
 import numpy as np
 from src.logging.custom_logging import logger
@@ -75,3 +76,12 @@ def load_object(file_path: str, ) -> object:
     except Exception as e:
         raise CustomException(e)
     
+
+
+def file_checksum(file_path: str) -> str:
+    """SHA-256 of a file, read in 1 MB blocks."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
@@ -3,7 +3,13 @@ import requests
 import json
 
 # FastAPI endpoint
-API_URL = "http://localhost:8000/predict"  # Change to your deployed API URL if hosted remotely
+API_URL = "http://localhost:8000/predict?explain=top3"  # Only the probability and reason codes are shown. Change to your deployed API URL if hosted remotely
+MODEL_INFO_URL = "http://localhost:8000/admin/model"  # Threshold of the model version being served
+
+
+@st.cache_data(ttl=60)
+def decision_threshold():
+    return requests.get(MODEL_INFO_URL, timeout=10).json()["active"]["threshold"]
 
 st.title("Credit Risk Prediction")
 
@@ -74,7 +80,8 @@ if st.sidebar.button("Predict"):
             result = response.json()
             
             st.success(f"Prediction Probability: {result['prediction_prob']:.4f}")
-            if result['prediction_prob'] > 0.49781528:
+            st.write(f"Score: {result['three_digit_score']} (risk band: {result['risk_band'].replace('_', ' ')})")
+            if result['prediction_prob'] > decision_threshold():
                 st.markdown(
                     '<p style="color:red; font-size:18px; font-weight:bold;">🚨 Customer is Risky. Loan Not Approved.</p>',
                     unsafe_allow_html=True
@@ -86,6 +93,8 @@ if st.sidebar.button("Predict"):
                 )
 
             st.write("Top 3 Reasons/Variables Influencing Prediction:")
+            for reason_text in result["reason_texts"]:
+                st.write(f"- {reason_text}")
             st.json(result["top_3_reason_codes"])
 
 
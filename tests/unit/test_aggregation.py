@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import pytest
+from src.features.aggregation import AggregationSpec, aggregate, dependency_order
+from src.features.aux_tables_pipeline import build_aux_features, config
+from src.features.feature_engine import FeatureNode, FeaturePipelineError
+
+
+@pytest.fixture(params=[(1e5, 3e4), (1e8, 1.0)], ids=["amounts", "large_offset"])
+def loans(tmp_path, request):
+    """Loan rows of 3000 clients with missing amounts, a status and rows without a client."""
+    rng = np.random.default_rng(0)
+    n_rows = 30000
+    mean, std = request.param
+    df = pd.DataFrame({"SK_ID_CURR": pd.array(rng.integers(100000, 103000, n_rows), dtype="Int64"),
+                       "AMT": rng.normal(mean, std, n_rows),
+                       "DAYS": -rng.integers(0, 3000, n_rows),
+                       "STATUS": rng.choice(["Active", "Closed", "Bad debt"], n_rows)})
+    df.loc[rng.uniform(size=n_rows) < 0.1, "AMT"] = np.nan
+    df.loc[::997, "SK_ID_CURR"] = pd.NA
+    path = str(tmp_path / "loans.csv")
+    df.to_csv(path, index=False)
+    return df, path
+
+
+def expected_aggregates(df):
+    df = df.dropna(subset=["SK_ID_CURR"]).assign(SK_ID_CURR=lambda frame: frame["SK_ID_CURR"].astype("int64"),
+                                                 STATUS_Bad_debt=lambda frame: (frame["STATUS"] == "Bad debt") * 1.0,
+                                                 AMT_PER_DAY=lambda frame: frame["AMT"] / frame["DAYS"])
+    df["AMT_PER_DAY"] = df["AMT_PER_DAY"].replace([np.inf, -np.inf], np.nan)
+    grouped = df.groupby("SK_ID_CURR")
+    expected = pd.DataFrame({"L_SIZE": grouped.size()})
+    for stat in ["count", "sum", "mean", "min", "max", "var", "std"]:
+        expected[f"L_AMT_{stat.upper()}"] = grouped["AMT"].agg(stat)
+    expected["L_AMT_PER_DAY_MEAN"] = grouped["AMT_PER_DAY"].mean()
+    expected["L_STATUS_Bad_debt_MEAN"] = grouped["STATUS_Bad_debt"].mean()
+    return expected.reset_index()
+
+
+def loan_spec():
+    return AggregationSpec("loans", "loans.csv", group_by="SK_ID_CURR", prefix="L",
+                           aggregations={"AMT": ["count", "sum", "mean", "min", "max", "var", "std"],
+                                         "AMT_PER_DAY": ["mean"]},
+                           categories={"STATUS": ["Bad debt"]},
+                           derived=[FeatureNode("AMT_PER_DAY", ["AMT", "DAYS"],
+                                                lambda table: pc.divide(table["AMT"], table["DAYS"]))])
+
+
+@pytest.mark.parametrize("memory_budget_bytes", [1 << 30, 1 << 19])
+def test_matches_pandas_groupby(loans, tmp_path, memory_budget_bytes):
+    df, input_path = loans
+    result = aggregate(loan_spec(), input_path, str(tmp_path / "loans.parquet"), memory_budget_bytes)
+    # The small budget streams the table in many batches and spills the partial aggregates
+    assert result["spilled"] is (memory_budget_bytes < 1 << 20)
+    assert result["batches"] > 1 or memory_budget_bytes > 1 << 20
+    assert result["input_rows"] == len(df) and result["rows"] == df["SK_ID_CURR"].nunique()
+    output = pd.read_parquet(result["output_path"]).sort_values("SK_ID_CURR").reset_index(drop=True)
+    # atol: float64 resolves values around 1e8 to ~1e-8, which bounds the variance near 1 (pandas included)
+    pd.testing.assert_frame_equal(output, expected_aggregates(df), check_dtype=False, rtol=1e-9, atol=1e-6)
+    assert aggregate(loan_spec(), input_path, result["output_path"], memory_budget_bytes)["cached"] is True
+
+
+def test_invalid_specs():
+    with pytest.raises(FeaturePipelineError, match="median"):
+        AggregationSpec("loans", "loans.csv", group_by="SK_ID_CURR", prefix="L", aggregations={"AMT": ["median"]})
+    first = AggregationSpec("a", "a.csv", group_by="K", prefix="A", aggregations={}, joins={"b": "K"})
+    second = AggregationSpec("b", "b.csv", group_by="K", prefix="B", aggregations={}, joins={"a": "K"})
+    with pytest.raises(FeaturePipelineError, match="cycle"):
+        dependency_order([first, second])
+
+
+def test_bureau_features_join_bureau_balance(tmp_path):
+    rng = np.random.default_rng(1)
+    bureau = pd.DataFrame({"SK_ID_CURR": rng.integers(0, 300, 1000), "SK_ID_BUREAU": np.arange(1000) + 5000000,
+                           "CREDIT_ACTIVE": rng.choice(["Active", "Closed"], 1000),
+                           "CREDIT_TYPE": rng.choice(["Consumer credit", "Car loan"], 1000)})
+    for name in ["DAYS_CREDIT", "DAYS_CREDIT_ENDDATE", "DAYS_CREDIT_UPDATE", "CREDIT_DAY_OVERDUE", "AMT_CREDIT_MAX_OVERDUE",
+                 "CNT_CREDIT_PROLONG", "AMT_CREDIT_SUM", "AMT_CREDIT_SUM_DEBT", "AMT_CREDIT_SUM_OVERDUE",
+                 "AMT_CREDIT_SUM_LIMIT", "AMT_ANNUITY"]:
+        bureau[name] = rng.integers(0, 1000, 1000)
+    # Bureau loans without monthly balances and balances of unknown loans
+    bureau_balance = pd.DataFrame({"SK_ID_BUREAU": rng.integers(5000000, 5001100, 20000),
+                                   "MONTHS_BALANCE": -rng.integers(0, 96, 20000),
+                                   "STATUS": rng.choice(["0", "1", "C", "X"], 20000)})
+    raw_path = tmp_path / "raw"
+    raw_path.mkdir()
+    bureau.to_csv(raw_path / config['BUREAU_FILE_NAME'], index=False)
+    bureau_balance.to_csv(raw_path / config['BUREAU_BALANCE_FILE_NAME'], index=False)
+    test_config = {**config, "RAW_DATA_PATH": str(raw_path), "FEATURE_STORE_PATH": str(tmp_path / "store")}
+
+    results = build_aux_features(["bureau_features"], test_config, memory_budget_mb=1)
+    assert list(results) == ["bureau_balance_by_bureau", "bureau_features"]
+    features = pd.read_parquet(results["bureau_features"]["output_path"]).set_index("SK_ID_CURR")
+    months = bureau.merge(bureau_balance, on="SK_ID_BUREAU").groupby("SK_ID_CURR").size()
+    assert features["BURO_BB_SIZE_SUM"].loc[months.index].tolist() == months.tolist()
+    assert features["BURO_SIZE"].sum() == len(bureau)
+    share_active = (bureau["CREDIT_ACTIVE"] == "Active").groupby(bureau["SK_ID_CURR"]).mean()
+    np.testing.assert_allclose(features["BURO_CREDIT_ACTIVE_Active_MEAN"].loc[share_active.index], share_active)
+
+    rerun = build_aux_features(["bureau_features"], test_config, memory_budget_mb=1)
+    assert all(result["cached"] for result in rerun.values())
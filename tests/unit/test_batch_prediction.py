@@ -0,0 +1,83 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+
+client = TestClient(app)
+
+@pytest.fixture
+def valid_prediction_data():
+    return {
+        "EXT_SOURCE_3": 0.617,
+        "EXT_SOURCE_2": 0.789,
+        "EXT_SOURCE_1": 0.123,
+        "AMT_CREDIT": 100000,
+        "AMT_ANNUITY": 10000,
+        "AMT_GOODS_PRICE": 100000,
+        "Client_Age": 25,
+        "employment_years": 3,
+        "NAME_EDUCATION_TYPE": "Secondary / secondary special",
+        "ORGANIZATION_TYPE": "Business Entity Type 3"
+    }
+
+def test_batch_matches_single_predictions(valid_prediction_data):
+    """Each batch row must score exactly like the same row sent to /predict."""
+    second_row = valid_prediction_data.copy()
+    second_row["ORGANIZATION_TYPE"] = "Self-employed"
+    second_row["EXT_SOURCE_3"] = None
+
+    batch_response = client.post("/predict/batch", json=[valid_prediction_data, second_row])
+    assert batch_response.status_code == 200
+    predictions = batch_response.json()["predictions"]
+
+    for row, prediction in zip([valid_prediction_data, second_row], predictions):
+        single = client.post("/predict", json=row).json()
+        assert prediction["status"] == "Success"
+        assert prediction["prediction_prob"] == pytest.approx(single["prediction_prob"])
+        assert prediction["top_3_reason_codes"].keys() == single["top_3_reason_codes"].keys()
+
+def test_batch_reports_invalid_rows(valid_prediction_data):
+    """Invalid rows get a failure reason and do not fail the rest of the batch."""
+    invalid_row = valid_prediction_data.copy()
+    invalid_row["Client_Age"] = 120
+
+    response = client.post("/predict/batch", json=[valid_prediction_data, invalid_row])
+    assert response.status_code == 200
+    result = response.json()
+    assert result["n_success"] == 1
+    assert result["n_failed"] == 1
+    assert result["predictions"][0]["status"] == "Success"
+    assert result["predictions"][1]["status"] == "Failed"
+    assert result["predictions"][1]["prediction_prob"] is None
+    assert "Client_Age" in result["predictions"][1]["failure_reason"]
+
+def test_category_codes_do_not_depend_on_batch(valid_prediction_data):
+    """Scoring a row alone or next to other categories must give the same probability."""
+    other_row = valid_prediction_data.copy()
+    other_row["ORGANIZATION_TYPE"] = "Bank"
+    other_row["NAME_EDUCATION_TYPE"] = "Academic degree"
+
+    alone = client.post("/predict/batch", json=[valid_prediction_data]).json()["predictions"][0]
+    mixed = client.post("/predict/batch", json=[other_row, valid_prediction_data]).json()["predictions"][1]
+    assert alone["prediction_prob"] == pytest.approx(mixed["prediction_prob"])
+
+@pytest.mark.parametrize("endpoint", ["/predict", "/predict/batch"])
+def test_explain_modes(valid_prediction_data, endpoint):
+    """explain=none returns only the probability, top3 adds reason codes, full keeps everything."""
+    results = {}
+    for mode in ["none", "top3", "full"]:
+        payload = valid_prediction_data if endpoint == "/predict" else [valid_prediction_data]
+        response = client.post(f"{endpoint}?explain={mode}", json=payload)
+        assert response.status_code == 200
+        body = response.json()
+        results[mode] = body if endpoint == "/predict" else body["predictions"][0]
+
+    assert results["none"]["prediction_prob"] == pytest.approx(results["full"]["prediction_prob"])
+    assert results["none"]["top_3_reason_codes"] == {}
+    assert results["none"]["shap_values"] == {}
+    assert results["top3"]["top_3_reason_codes"] == results["full"]["top_3_reason_codes"]
+    assert results["top3"]["shap_values"] == {}
+    assert results["top3"]["model_features"] == {}
+    assert len(results["full"]["shap_values"]) == 8
+
+def test_invalid_explain_mode(valid_prediction_data):
+    assert client.post("/predict?explain=partial", json=valid_prediction_data).status_code == 422
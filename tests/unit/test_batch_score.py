@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from src.utils.other_utils import load_object
+from src.inference.fast_path import parity_requests
+from src.inference.preprocessing import get_top_3_shap_features, model_input_frame, preprocessing
+from src.inference.scorecard import scorecard
+from src.inference.batch_score import feature_store_files, list_chunks, run, score_frame
+
+
+@pytest.fixture(scope="module")
+def feature_store(tmp_path_factory):
+    """Engineered features with SK_ID_CURR, like data/Feature_Store/app_test.parquet, in two row groups."""
+    requests = parity_requests(n_random=300)
+    features = preprocessing(pd.DataFrame([request.model_dump() for request in requests]))
+    features["ORGANIZATION_TYPE"] = features["ORGANIZATION_TYPE"].astype("object")
+    features["NAME_EDUCATION_TYPE"] = features["NAME_EDUCATION_TYPE"].astype("object")
+    features.insert(0, "SK_ID_CURR", np.arange(100000, 100000 + len(features)))
+    path = tmp_path_factory.mktemp("feature_store") / "app_test.parquet"
+    pq.write_table(pa.Table.from_pandas(features, preserve_index=False), path, row_group_size=250)
+    return str(path), features
+
+def test_feature_store_files_are_the_application_features(tmp_path):
+    for name in ["app_test.parquet", "bureau_features.parquet", "client_test.parquet"]:
+        (tmp_path / name).touch()
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(f"FEATURE_STORE_PATH: '{tmp_path}'\nAPP_TRAIN_FEATURES_FILE_NAME: 'app_train.parquet'\n"
+                           "APP_TEST_FEATURES_FILE_NAME: 'app_test.parquet'\n")
+    assert feature_store_files(str(config_path)) == [str(tmp_path / "app_test.parquet")]
+
+def test_list_chunks(feature_store):
+    path, features = feature_store
+    chunks = list_chunks([path], rows_per_chunk=100)
+    assert chunks[:4] == [(path, 0, 0, 100), (path, 0, 100, 200), (path, 0, 200, 250), (path, 1, 0, 100)]
+    assert sum(end - start for _, _, start, end in chunks) == len(features)
+
+def test_batch_scoring_is_resumable(feature_store, tmp_path):
+    path, features = feature_store
+    output = tmp_path / "scores"
+    arguments = dict(input_paths=[path], output_dir=str(output), model_path="models/registry/v1/xgboost_model.pkl",
+                     explainer_path="models/registry/v1/explainer.pkl", explainer_backend="native", workers=2, rows_per_chunk=100)
+    first = run(**arguments)
+    assert first["rows_scored"] == len(features) and first["chunks_skipped"] == 0
+
+    # Losing one chunk only rescoring that chunk
+    parts = sorted((output / "source=app_test").glob("*.parquet"))
+    parts[1].unlink()
+    second = run(**arguments)
+    assert second["chunks_scored"] == 1 and second["rows_scored"] == 100
+
+    scores = pd.read_parquet(output).sort_values("SK_ID_CURR")
+    model = load_object("models/registry/v1/xgboost_model.pkl")
+    expected = model.predict_proba(model_input_frame(features))[:, 1]
+    np.testing.assert_allclose(scores["prediction_prob"], expected, atol=1e-6)
+    assert scores["three_digit_score"].dtype.kind == "i"
+    # Same scores and bands as the API
+    assert (scores["three_digit_score"].tolist(), scores["risk_band"].tolist()) == scorecard.apply(scores["prediction_prob"])
+
+def test_reasons_match_api(feature_store):
+    """Batch reason codes are the API's top 3 SHAP features, most influential first."""
+    _, features = feature_store
+    model, explainer = load_object("models/registry/v1/xgboost_model.pkl"), load_object("models/registry/v1/explainer.pkl")
+    rows = features.head(50)
+    scores = score_frame(model, explainer, rows)
+    input_data = model_input_frame(rows)
+    shap_values = explainer.shap_values(input_data)
+    for i, score in scores.iterrows():
+        top_3 = get_top_3_shap_features(dict(zip(input_data.columns, shap_values[i])), prob=score["prediction_prob"])
+        reasons = [score["reason_1"], score["reason_2"], score["reason_3"]]
+        assert reasons == list(top_3)
+        assert score["reason_1_shap"] == pytest.approx(top_3[reasons[0]])
+        assert abs(score["reason_1_shap"]) >= abs(score["reason_2_shap"]) >= abs(score["reason_3_shap"])
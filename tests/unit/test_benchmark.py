@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from pydantic import ValidationError
+from src.inference.benchmark import benchmark, build_payloads, build_report, check_gates, parse_mix
+from src.inference.request_validation import PredictionRequest
+
+
+def is_valid(payload):
+    try:
+        PredictionRequest.model_validate(payload)
+        return True
+    except ValidationError:
+        return False
+
+
+def test_payload_mix():
+    mix = parse_mix("valid=2,invalid=1,missing=1")
+    assert mix == {"valid": 0.5, "invalid": 0.25, "missing": 0.25}
+    payloads = build_payloads(mix, 200)
+    kinds = [kind for kind, _ in payloads]
+    assert set(kinds) == {"valid", "invalid", "missing"}
+    for kind, payload in payloads:
+        assert is_valid(payload) == (kind != "invalid")
+    assert all(payload["EXT_SOURCE_1"] is None for kind, payload in payloads if kind == "missing")
+    with pytest.raises(ValueError):
+        parse_mix("broken=1")
+
+
+def test_report_and_gates():
+    results = [("valid", 200, 0.010, False)] * 98 + [("invalid", 500, 0.200, True), ("valid", None, 1.0, True)]
+    report = build_report(results, duration_s=2.0)
+    assert report["throughput_rps"] == 50
+    assert report["error_rate"] == 0.02
+    assert report["status_counts"] == {"200": 98, "500": 1, "transport_error": 1}
+    assert report["latency_ms"]["p50"] == 10
+    assert report["by_kind"]["invalid"]["error_rate"] == 1
+    assert check_gates(report, max_p95_ms=50, max_error_rate=0.05) == []
+    assert len(check_gates(report, max_p99_ms=50, max_error_rate=0.01, min_throughput=100)) == 3
+
+
+def test_in_process_benchmark():
+    """Invalid payloads are expected 422s from /predict and rows reported by /predict/batch, not errors."""
+    payloads = build_payloads(parse_mix("valid=0.6,invalid=0.2,missing=0.2"), 60)
+    report = asyncio.run(benchmark(None, payloads, endpoint="predict", concurrency=4, explain="none"))
+    assert report["requests"] == 60
+    assert report["error_rate"] == 0
+    assert report["status_counts"]["422"] == report["by_kind"]["invalid"]["requests"]
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
+
+    report = asyncio.run(benchmark(None, payloads, endpoint="batch", batch_size=25, concurrency=2, rate=100))
+    assert report["requests"] == 3 and report["status_counts"] == {"200": 3}
@@ -0,0 +1,105 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from src.features.app_features_pipeline import APP_FEATURES, config
+from src.features.aux_tables_pipeline import aux_table_specs
+from src.features.build_features import BuildNode, chain_lengths, feature_build_nodes, run_build, select_nodes
+from src.features.feature_engine import FeaturePipelineError
+
+
+# Node functions run in spawned workers, so they are module level
+def write_numbers(output_path, n_rows, sleep_s=0.0):
+    time.sleep(sleep_s)
+    pd.DataFrame({"value": np.arange(n_rows)}).to_parquet(output_path)
+    return {"output_path": output_path, "rows": n_rows}
+
+
+def add_one(input_path, output_path):
+    pd.read_parquet(input_path).add(1).to_parquet(output_path)
+    return {"output_path": output_path}
+
+
+def fail():
+    raise ValueError("broken feature")
+
+
+def test_runs_nodes_after_their_dependencies(tmp_path):
+    nodes = [BuildNode("plus_one", add_one, {"input_path": str(tmp_path / "a.parquet"), "output_path": str(tmp_path / "b.parquet")},
+                       depends_on=["numbers"]),
+             BuildNode("numbers", write_numbers, {"output_path": str(tmp_path / "a.parquet"), "n_rows": 3, "sleep_s": 0.5}),
+             BuildNode("other", write_numbers, {"output_path": str(tmp_path / "c.parquet"), "n_rows": 2, "sleep_s": 0.5}),
+             BuildNode("broken", fail),
+             BuildNode("after_broken", add_one, {"input_path": "missing", "output_path": "missing"}, depends_on=["broken"])]
+    reports = run_build(nodes, max_workers=2)
+
+    assert pd.read_parquet(tmp_path / "b.parquet")["value"].tolist() == [1, 2, 3]
+    assert {name: report["status"] for name, report in reports.items()} == {
+        "numbers": "done", "plus_one": "done", "other": "done", "broken": "failed", "after_broken": "skipped"}
+    assert "broken feature" in reports["broken"]["error"]
+    assert reports["numbers"]["result"] == {"output_path": str(tmp_path / "a.parquet"), "rows": 3}
+    assert reports["numbers"]["wall_s"] >= 0.5 and reports["numbers"]["peak_rss_mb"] > 0
+    assert reports["plus_one"]["start_s"] >= reports["numbers"]["end_s"]
+    # Independent nodes run at the same time
+    assert reports["numbers"]["start_s"] < reports["other"]["end_s"] and reports["other"]["start_s"] < reports["numbers"]["end_s"]
+
+
+def test_invalid_graphs():
+    with pytest.raises(FeaturePipelineError, match="unknown"):
+        chain_lengths([BuildNode("a", fail, depends_on=["b"])])
+    with pytest.raises(FeaturePipelineError, match="cycle"):
+        chain_lengths([BuildNode("a", fail, depends_on=["b"]), BuildNode("b", fail, depends_on=["a"])])
+
+
+def test_feature_build_graph():
+    nodes = {node.name: node for node in feature_build_nodes()}
+    assert nodes["bureau_features"].depends_on == ["bureau_balance_by_bureau"]
+    assert nodes["previous_application_features"].depends_on == ["installments_by_prev"]
+    assert nodes["client_train"].depends_on == ["app_train", "bureau_features", "previous_application_features",
+                                                "credit_card_features"]
+    assert chain_lengths(list(nodes.values()))["bureau_balance_by_bureau"] == 3
+    selected = [node.name for node in select_nodes(list(nodes.values()), ["bureau_features"])]
+    assert selected == ["bureau_balance_by_bureau", "bureau_features"]
+
+
+def test_builds_the_feature_store(tmp_path):
+    rng = np.random.default_rng(0)
+    raw_path, store_path = tmp_path / "raw", tmp_path / "store"
+    raw_path.mkdir()
+    clients = np.arange(100000, 100400)
+    for split, split_clients in [("TRAIN", clients[:300]), ("TEST", clients[300:])]:
+        app = pd.DataFrame({name: rng.integers(0, 3, len(split_clients)) for name in config['APP_NUMERICAL_FEATURES']
+                            if name not in APP_FEATURES.nodes})
+        for name in config['APP_CATEGORICAL_FEATURES'] + ["CODE_GENDER"]:
+            app[name] = rng.choice(["M", "F"], len(split_clients))
+        for name in ["DAYS_BIRTH", "DAYS_EMPLOYED", "AMT_INCOME_TOTAL", "AMT_CREDIT", "AMT_ANNUITY", "AMT_GOODS_PRICE"]:
+            app[name] = -rng.integers(1, 20000, len(split_clients))
+        app["SK_ID_CURR"], app["TARGET"] = split_clients, rng.integers(0, 2, len(split_clients))
+        app.to_csv(raw_path / config[f'APP_{split}_FILE_NAME'], index=False)
+    specs = {spec.name: spec for spec in aux_table_specs(config)}
+    loan_ids = {"SK_ID_BUREAU": np.arange(1000) + 5000000, "SK_ID_PREV": np.arange(1000) + 2000000}
+    for spec in specs.values():
+        joined = [name for name in spec.aggregations for joined in spec.joins if name.startswith(f"{specs[joined].prefix}_")]
+        table = pd.DataFrame({"SK_ID_CURR": rng.choice(clients, 1000)})
+        for name in spec.input_columns(joined):
+            if name in loan_ids:
+                table[name] = loan_ids[name] if name != spec.group_by else rng.choice(loan_ids[name], 1000)
+            elif name in spec.categories:
+                table[name] = rng.choice(spec.categories[name], 1000)
+            elif name != "SK_ID_CURR":
+                table[name] = rng.normal(size=1000)
+        table.to_csv(raw_path / spec.input_file, index=False)
+
+    test_config = {**config, "RAW_DATA_PATH": str(raw_path), "FEATURE_STORE_PATH": str(store_path)}
+    reports = run_build(feature_build_nodes(test_config), max_workers=2)
+    assert all(report["status"] == "done" for report in reports.values()), reports
+    client_train = pd.read_parquet(store_path / config['CLIENT_TRAIN_FEATURES_FILE_NAME'])
+    app_train = pd.read_parquet(store_path / config['APP_TRAIN_FEATURES_FILE_NAME'])
+    pd.testing.assert_frame_equal(client_train[app_train.columns], app_train)
+    bureau = pd.read_csv(raw_path / config['BUREAU_FILE_NAME'])
+    expected = bureau.groupby("SK_ID_CURR").size().reindex(client_train["SK_ID_CURR"]).fillna(0)
+    assert client_train["BURO_SIZE"].fillna(0).tolist() == expected.tolist()
+    assert {"PREV_INSTAL_SIZE_SUM", "CC_LIMIT_USE_MAX"} <= set(client_train.columns)
+
+    # Nothing changed: the nodes reuse their outputs
+    assert all(node.fn(**node.kwargs)["cached"] for node in select_nodes(feature_build_nodes(test_config), ["client_train"]))
@@ -0,0 +1,84 @@
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from pydantic import ValidationError
+from src.inference.request_validation import PredictionRequest, example_payload, validate_batch, validate_columns
+
+
+def pydantic_failure_reasons(row):
+    try:
+        PredictionRequest.model_validate(row)
+        return None
+    except ValidationError as e:
+        return {".".join(str(loc) for loc in error["loc"]) or "request": error["msg"] for error in e.errors()}
+
+
+@pytest.fixture
+def mixed_rows():
+    """Valid rows and rows breaking every rule, plus values of types pydantic has to coerce."""
+    overrides = [
+        {}, {"EXT_SOURCE_3": None}, {"EXT_SOURCE_3": 1.5}, {"EXT_SOURCE_2": -0.1}, {"EXT_SOURCE_1": float("nan")},
+        {"AMT_CREDIT": 0}, {"AMT_CREDIT": None}, {"AMT_ANNUITY": None}, {"AMT_GOODS_PRICE": None},
+        {"AMT_GOODS_PRICE": -1.0}, {"Client_Age": 19}, {"Client_Age": 101}, {"Client_Age": 25.0},
+        {"Client_Age": 25.5}, {"Client_Age": None}, {"employment_years": None}, {"employment_years": -1},
+        {"NAME_EDUCATION_TYPE": "Unknown"}, {"ORGANIZATION_TYPE": "Unknown"}, {"ORGANIZATION_TYPE": None},
+        {"Client_Age": 19, "AMT_CREDIT": -5, "ORGANIZATION_TYPE": "Unknown"},
+        # Types only pydantic knows how to coerce or reject
+        {"EXT_SOURCE_3": "0.5"}, {"AMT_CREDIT": "abc"}, {"Client_Age": True}, {"Client_Age": "30"},
+        {"employment_years": float("inf")}, {"NAME_EDUCATION_TYPE": 5}, {"ORGANIZATION_TYPE": float("nan")},
+        # Integral values out of the int64 range
+        {"employment_years": 10 ** 20}, {"employment_years": 2 ** 53 + 1}, {"Client_Age": 1e308},
+        {"Client_Age": -1e19},
+    ]
+    rows = [{**example_payload(), **override} for override in overrides]
+    for name in ["AMT_CREDIT", "EXT_SOURCE_1"]:
+        row = example_payload()
+        del row[name]
+        rows.append(row)
+    return rows
+
+
+def test_validate_batch_matches_pydantic(mixed_rows):
+    """Every row gets exactly the errors, in the same order, that PredictionRequest reports."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        valid_requests, failure_reasons = validate_batch(mixed_rows + ["not a row"])
+    for position, row in enumerate(mixed_rows + ["not a row"]):
+        expected = pydantic_failure_reasons(row)
+        if expected is None:
+            assert position not in failure_reasons
+            assert valid_requests[position].model_dump() == PredictionRequest.model_validate(row).model_dump()
+        else:
+            assert position not in valid_requests
+            assert list(failure_reasons[position].items()) == list(expected.items())
+
+
+def test_validate_batch_coerces_like_pydantic():
+    """Ints become floats and integral floats become ints, as in PredictionRequest."""
+    valid_requests, _ = validate_batch([{**example_payload(), "AMT_CREDIT": 5, "Client_Age": 30.0}])
+    assert isinstance(valid_requests[0].AMT_CREDIT, float)
+    assert isinstance(valid_requests[0].Client_Age, int)
+
+
+def test_validate_columns_numpy_nan_is_missing():
+    """In numeric arrays NaN stands for a missing value, so optional fields accept it."""
+    df = pd.DataFrame([example_payload()] * 3)
+    df.loc[0, "EXT_SOURCE_1"] = np.nan
+    df.loc[1, "AMT_CREDIT"] = np.nan
+    result = validate_columns({name: df[name].to_numpy() for name in df.columns})
+    assert result.valid.tolist() == [True, False, True]
+    assert result.failure_reasons == {1: {"AMT_CREDIT": "Input should be a valid number"}}
+    assert result.requests()[0].EXT_SOURCE_1 is None
+
+
+def test_validate_columns_missing_column():
+    columns = {name: [value] for name, value in example_payload().items() if name != "Client_Age"}
+    assert validate_columns(columns).failure_reasons == {0: {"Client_Age": "Field required"}}
+
+
+def test_validate_columns_large_batch():
+    df = pd.DataFrame([example_payload()] * 100000)
+    df.loc[::7, "Client_Age"] = 10
+    result = validate_columns({name: df[name].to_numpy() for name in df.columns})
+    assert (~result.valid).sum() == len(df.index[::7])
@@ -0,0 +1,78 @@
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from src.logging import custom_logging
+from src.logging.custom_logging import RequestSamplingFilter, configure_logging, request_logger
+
+
+def make_record(level=logging.INFO, request_id=None):
+    record = logging.LogRecord("test", level, __file__, 1, "message", None, None)
+    if request_id is not None:
+        record.request_id = request_id
+    return record
+
+def log_in_spawned_child():
+    custom_logging.logger.info("logged in spawned child")
+
+@pytest.fixture
+def log_dir(tmp_path):
+    yield tmp_path
+    configure_logging()
+
+def test_sampling_filter():
+    """Info records are sampled per request id, warnings always pass."""
+    assert not RequestSamplingFilter(0.0).filter(make_record(request_id="a"))
+    assert RequestSamplingFilter(0.0).filter(make_record(logging.WARNING, request_id="a"))
+    assert RequestSamplingFilter(1.0).filter(make_record(request_id="a"))
+
+    half = RequestSamplingFilter(0.5)
+    kept = [half.filter(make_record(request_id=str(i))) for i in range(2000)]
+    assert kept == [half.filter(make_record(request_id=str(i))) for i in range(2000)]
+    assert 800 < sum(kept) < 1200
+
+def test_async_json_logging(log_dir):
+    configure_logging(log_dir=str(log_dir), log_file="app.log", log_format="json", async_mode=True)
+    request_logger.info("Received prediction request", extra={"request_id": "abc"})
+    custom_logging._stop_listener()
+
+    records = [json.loads(line) for line in (log_dir / "app.log").read_text().splitlines()]
+    assert records[-1]["message"] == "Received prediction request"
+    assert records[-1]["request_id"] == "abc"
+    assert records[-1]["level"] == "INFO"
+
+def test_request_logs_dropped_at_zero_rate(log_dir):
+    configure_logging(log_dir=str(log_dir), log_file="app.log", request_sample_rate=0.0)
+    request_logger.info("sampled out", extra={"request_id": "abc"})
+    request_logger.warning("always kept", extra={"request_id": "abc"})
+    custom_logging._stop_listener()
+
+    content = (log_dir / "app.log").read_text()
+    assert "sampled out" not in content
+    assert "always kept" in content
+
+def test_forked_child_logs_through_the_parent(log_dir):
+    """A forked child sends its records to the parent's writer and opens no file of its own."""
+    configure_logging(log_dir=str(log_dir), log_file="app.log", async_mode=True)
+    pid = os.fork()
+    if pid == 0:
+        logging.getLogger("child").info("logged in child")
+        custom_logging._stop_listener()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    custom_logging._stop_listener()
+    assert "logged in child" in (log_dir / "app.log").read_text()
+    assert [path.name for path in log_dir.iterdir()] == ["app.log"]
+
+def test_spawned_child_logs_through_the_parent(log_dir):
+    """Spawned pool workers started with `log_to_parent` write to the parent's file too."""
+    configure_logging(log_dir=str(log_dir), log_file="app.log", async_mode=False)
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=custom_logging.log_to_parent,
+                             initargs=(custom_logging.parent_log_queue(),)) as pool:
+        pool.submit(log_in_spawned_child).result()
+    custom_logging._stop_listener()
+    assert "logged in spawned child" in (log_dir / "app.log").read_text()
+    assert [path.name for path in log_dir.iterdir()] == ["app.log"]
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.utils.other_utils import load_object
+from src.inference.preprocessing import inference_config, preprocessing
+from src.inference.fast_path import FeaturePlan, parity_requests
+from src.inference.explainers import NativeTreeExplainer, load_explainer
+
+
+@pytest.fixture(scope="module")
+def artifacts():
+    return load_object("models/registry/v1/xgboost_model.pkl"), load_object("models/registry/v1/explainer.pkl")
+
+def test_native_matches_pickled_explainer(artifacts):
+    """pred_contribs must give the same attributions as shap.TreeExplainer on numpy and pandas input."""
+    model, shap_explainer = artifacts
+    native = NativeTreeExplainer(model)
+    requests = parity_requests(n_random=50)
+
+    rows = FeaturePlan.from_config(inference_config).encode(requests)
+    assert native.check_parity(shap_explainer, rows) <= 1e-5
+
+    input_data = preprocessing(pd.DataFrame([request.model_dump() for request in requests]))
+    np.testing.assert_allclose(native.shap_values(input_data), shap_explainer.shap_values(input_data), atol=1e-5)
+
+def test_load_explainer_backends(artifacts):
+    model, _ = artifacts
+    assert isinstance(load_explainer("native", model, "models/registry/v1/explainer.pkl"), NativeTreeExplainer)
+    assert not isinstance(load_explainer("shap", model, "models/registry/v1/explainer.pkl"), NativeTreeExplainer)
+    with pytest.raises(ValueError):
+        load_explainer("lime", model, "models/registry/v1/explainer.pkl")
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.utils.other_utils import load_object
+from src.utils.feature_engineering import compute_ratio_columnwise
+from src.features.app_features_pipeline import APP_FEATURES
+from src.inference.preprocessing import inference_config
+from src.inference.request_validation import PredictionRequest, example_payload
+from src.inference.fast_path import FeaturePlan, FastPathScorer, parity_requests, ratio_value
+
+
+@pytest.fixture(scope="module")
+def scorer():
+    model = load_object("models/registry/v1/xgboost_model.pkl")
+    explainer = load_object("models/registry/v1/explainer.pkl")
+    return model, FastPathScorer(FeaturePlan.from_config(inference_config), model, explainer)
+
+def test_ratio_value_matches_columnwise():
+    """The scalar ratio must follow the same sentinel rules as compute_ratio_columnwise."""
+    numerators = [np.nan, np.nan, 5.0, 5.0, 5.0, np.nan, 1.0]
+    denominators = [np.nan, 2.0, np.nan, 0.0, 3.0, 0.0, 3.0]
+    df = pd.DataFrame({"a": numerators, "b": denominators})
+    expected = compute_ratio_columnwise(df, "a", "b").tolist()
+    assert [ratio_value(a, b) for a, b in zip(numerators, denominators)] == expected
+    assert ratio_value(None, 2.0) == -1
+
+def test_parity_with_pandas_path(scorer):
+    model, fast_path_scorer = scorer
+    assert fast_path_scorer.check_parity(model, parity_requests(n_random=50)) <= 1e-6
+
+def test_single_row_matches_batch_encoding(scorer):
+    _, fast_path_scorer = scorer
+    requests = parity_requests(n_random=5)
+    batch_rows = fast_path_scorer.plan.encode(requests).copy()
+    for i, request in enumerate(requests):
+        np.testing.assert_array_equal(fast_path_scorer.plan.encode([request])[0], batch_rows[i])
+
+def test_plan_follows_the_given_config():
+    """Ratios are those of the selected features of the config passed in, even ones the service does not select."""
+    name = "AMT_CREDIT_AMT_ANNUITY_ratio"
+    assert name not in inference_config['selected_features']
+    numerator, denominator = APP_FEATURES.ratio_specs([name])[name]
+    plan = FeaturePlan.from_config({**inference_config, 'selected_features': [name, "EXT_SOURCE_3"]})
+    request = PredictionRequest(**example_payload())
+    expected = [ratio_value(getattr(request, numerator), getattr(request, denominator)), request.EXT_SOURCE_3]
+    assert plan.encode([request]).tolist() == [expected]
+
+def test_categories_use_training_codes(scorer):
+    _, fast_path_scorer = scorer
+    plan = fast_path_scorer.plan
+    payload = example_payload()
+    payload["ORGANIZATION_TYPE"] = "XNA"
+    row = plan.encode([PredictionRequest(**payload)])[0]
+    position = plan.feature_names.index("ORGANIZATION_TYPE")
+    assert row[position] == inference_config["category_levels"]["ORGANIZATION_TYPE"].index("XNA")
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.utils.feature_engineering import compute_ratio_columnwise, compute_ratios
+
+
+@pytest.fixture
+def ratio_frame():
+    """Every sentinel case: NaN numerator, NaN denominator, both, zero denominator, plus None in an object column."""
+    return pd.DataFrame({"a": [1.0, np.nan, 3.0, np.nan, 5.0, 2.0, 1.005, np.nan],
+                         "b": [2.0, 1.0, np.nan, np.nan, 0.0, 3.0, 1.0, 0.0],
+                         "c": [None, 4, 0, 8, 1, 2, 3, 5]})
+
+
+def test_compute_ratios_matches_columnwise(ratio_frame):
+    """All pairs in one pass give exactly the per-pair results."""
+    pairs = [("a", "b"), ("b", "a"), ("a", "c"), ("c", "b")]
+    ratios = compute_ratios(ratio_frame, pairs)
+    assert list(ratios.columns) == ["a_b_ratio", "b_a_ratio", "a_c_ratio", "c_b_ratio"]
+    assert ratios.index.equals(ratio_frame.index)
+    for (numerator, denominator), name in zip(pairs, ratios.columns):
+        expected = compute_ratio_columnwise(ratio_frame, numerator, denominator)
+        np.testing.assert_array_equal(ratios[name].to_numpy(), expected.to_numpy())
+
+
+def test_compute_ratios_into_preallocated_block(ratio_frame):
+    out = np.zeros((2, len(ratio_frame)))
+    ratios = compute_ratios(ratio_frame, [("a", "b"), ("c", "a")], names=["x", "y"], out=out)
+    assert list(ratios.columns) == ["x", "y"]
+    np.testing.assert_array_equal(out, ratios.to_numpy().T)
+    with pytest.raises(ValueError):
+        compute_ratios(ratio_frame, [("a", "b")], out=np.zeros((2, len(ratio_frame))))
+    with pytest.raises(ValueError):
+        compute_ratios(ratio_frame, [("a", "b")], names=["x", "y"])
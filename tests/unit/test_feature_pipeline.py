@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.features.app_features_pipeline import APP_FEATURES, app_feature_columns, config
+from src.features.feature_engine import (FeatureNode, FeaturePipeline, FeaturePipelineError, RatioFeature, materialize,
+                                         stored_key)
+from src.utils.feature_engineering import compute_ratio_columnwise
+
+
+def notebook_app_data_processing(df):
+    """app_data_processing of notebooks/3.application_feature_model.ipynb, without the column selection."""
+    df = df.loc[df['CODE_GENDER'] != 'XNA'].copy()
+    df['AMT_ANNUITY_AMT_INCOME_TOTAL_ratio'] = compute_ratio_columnwise(df, 'AMT_ANNUITY', 'AMT_INCOME_TOTAL')
+    df['AMT_CREDIT_AMT_INCOME_TOTAL_ratio'] = compute_ratio_columnwise(df, 'AMT_CREDIT', 'AMT_INCOME_TOTAL')
+    df['AMT_CREDIT_AMT_GOODS_PRICE_ratio'] = compute_ratio_columnwise(df, 'AMT_CREDIT', 'AMT_GOODS_PRICE')
+    df["Client_Age"] = (df["DAYS_BIRTH"] / (-365)).round(2)
+    df['employment_years'] = np.where(df['DAYS_EMPLOYED'] < 0, (df["DAYS_EMPLOYED"] / -365).round(2), np.nan)
+    df["employment_age"] = np.where(df["employment_years"].isna(), -1,
+                                    np.where(df["Client_Age"] > df["employment_years"],
+                                             df["Client_Age"] - df["employment_years"], -2))
+    df['AMT_CREDIT_AMT_ANNUITY_ratio'] = compute_ratio_columnwise(df, 'AMT_CREDIT', 'AMT_ANNUITY')
+    return df
+
+
+@pytest.fixture
+def raw_applications():
+    """Raw application rows with every feature column, XNA genders, unemployed and missing amounts."""
+    rng = np.random.default_rng(0)
+    n_rows = 500
+    df = pd.DataFrame({name: rng.integers(0, 3, n_rows) for name in config['APP_NUMERICAL_FEATURES']
+                       if name not in APP_FEATURES.nodes})
+    for name in config['APP_CATEGORICAL_FEATURES']:
+        df[name] = rng.choice(["a", "b", "c"], n_rows)
+    df["SK_ID_CURR"] = np.arange(n_rows) + 100000
+    df["TARGET"] = rng.integers(0, 2, n_rows)
+    df["CODE_GENDER"] = rng.choice(["M", "F", "XNA"], n_rows, p=[0.45, 0.45, 0.1])
+    df["DAYS_BIRTH"] = -rng.integers(20 * 365, 70 * 365, n_rows)
+    df["DAYS_EMPLOYED"] = np.where(rng.uniform(size=n_rows) < 0.2, 365243, -rng.integers(0, 40 * 365, n_rows))
+    for name in ["AMT_INCOME_TOTAL", "AMT_CREDIT", "AMT_ANNUITY", "AMT_GOODS_PRICE"]:
+        values = rng.uniform(1e4, 1e6, n_rows)
+        values[rng.uniform(size=n_rows) < 0.05] = np.nan
+        df[name] = values
+    df.loc[::37, "AMT_GOODS_PRICE"] = 0
+    # Unused columns the pipeline must not need
+    for position in range(20):
+        df[f"UNUSED_{position}"] = rng.normal(size=n_rows)
+    return df
+
+
+def test_matches_notebook(raw_applications):
+    outputs = app_feature_columns() + ["AMT_CREDIT_AMT_ANNUITY_ratio"]
+    features = APP_FEATURES.compute(raw_applications, outputs, apply_filters=True)
+    expected = notebook_app_data_processing(raw_applications)[outputs]
+    pd.testing.assert_frame_equal(features, expected, check_dtype=False)
+    assert "XNA" not in APP_FEATURES.compute(raw_applications, ["CODE_GENDER"], apply_filters=True)["CODE_GENDER"].values
+
+
+def test_only_needed_nodes_run(raw_applications):
+    assert [node.name for node in APP_FEATURES.plan(["employment_age"])] == ["Client_Age", "employment_years", "employment_age"]
+    assert APP_FEATURES.source_columns(["employment_age", "AMT_CREDIT_AMT_GOODS_PRICE_ratio"]) == \
+        ["DAYS_BIRTH", "DAYS_EMPLOYED", "AMT_CREDIT", "AMT_GOODS_PRICE"]
+    # Columns the input already has are used as they are, as for inference requests
+    request = pd.DataFrame({"Client_Age": [30], "employment_years": [4], "AMT_CREDIT": [1.0], "AMT_GOODS_PRICE": [2.0]})
+    assert [node.name for node in APP_FEATURES.plan(["employment_age"], request.columns)] == ["employment_age"]
+    features = APP_FEATURES.compute(request, ["employment_age", "AMT_CREDIT_AMT_GOODS_PRICE_ratio"])
+    assert features.iloc[0].tolist() == [26, 0.5]
+    with pytest.raises(FeaturePipelineError, match="DAYS_BIRTH"):
+        APP_FEATURES.compute(request.drop(columns="Client_Age"), ["employment_age"])
+
+
+def test_cycles_and_duplicates_are_rejected():
+    with pytest.raises(FeaturePipelineError, match="cycle"):
+        FeaturePipeline([FeatureNode("a", ["b"], lambda df: df["b"]), FeatureNode("b", ["a"], lambda df: df["a"])])
+    with pytest.raises(FeaturePipelineError, match="twice"):
+        FeaturePipeline([RatioFeature("r", "x", "y"), RatioFeature("r", "y", "x")])
+
+
+def test_materialize_is_cached(raw_applications, tmp_path):
+    input_path = str(tmp_path / "app_train.csv")
+    output_path = str(tmp_path / "store" / "app_train.parquet")
+    raw_applications.to_csv(input_path, index=False)
+    outputs = app_feature_columns()
+
+    first = materialize(APP_FEATURES, input_path, output_path, outputs, categorical=config['APP_CATEGORICAL_FEATURES'])
+    assert not first["cached"] and first["rows"] == (raw_applications["CODE_GENDER"] != "XNA").sum()
+    stored = pd.read_parquet(output_path)
+    assert list(stored.columns) == outputs
+    assert isinstance(stored["ORGANIZATION_TYPE"].dtype, pd.CategoricalDtype)
+    assert materialize(APP_FEATURES, input_path, output_path, outputs)["cached"] is False  # categorical differs
+    assert materialize(APP_FEATURES, input_path, output_path, outputs)["cached"] is True
+
+    # A changed feature definition or input file invalidates the output
+    changed = FeaturePipeline([node if node.name != "Client_Age" else FeatureNode("Client_Age", ["DAYS_BIRTH"], node.fn, version="2")
+                               for node in APP_FEATURES.nodes.values()], APP_FEATURES.filters)
+    key = stored_key(output_path)
+    assert materialize(changed, input_path, output_path, outputs)["cached"] is False
+    assert stored_key(output_path) != key
+    raw_applications.head(100).to_csv(input_path, index=False)
+    assert materialize(changed, input_path, output_path, outputs)["cached"] is False
+
+
+def test_materialize_recomputes_changed_columns_only(raw_applications, tmp_path):
+    input_path = str(tmp_path / "app_train.csv")
+    output_path = str(tmp_path / "app_train.parquet")
+    raw_applications.to_csv(input_path, index=False)
+    outputs = app_feature_columns()
+    categorical = config['APP_CATEGORICAL_FEATURES']
+    full = materialize(APP_FEATURES, input_path, output_path, outputs, categorical=categorical)
+    assert full["recomputed"] == outputs and full["carried_over"] == []
+    expected = pd.read_parquet(output_path)
+
+    # A new version of one node recomputes it and the nodes reading it
+    changed = FeaturePipeline([node if node.name != "employment_years" else FeatureNode("employment_years", node.inputs, node.fn, version="2")
+                               for node in APP_FEATURES.nodes.values()], APP_FEATURES.filters)
+    result = materialize(changed, input_path, output_path, outputs, categorical=categorical)
+    assert result["recomputed"] == ["employment_years", "employment_age"]
+    pd.testing.assert_frame_equal(pd.read_parquet(output_path), expected)
+
+    # An edited source column recomputes the columns derived from it, wherever they are in the file
+    raw_applications["AMT_ANNUITY"] *= 2
+    raw_applications.to_csv(input_path, index=False)
+    result = materialize(changed, input_path, output_path, outputs, categorical=categorical)
+    assert sorted(result["recomputed"]) == ["AMT_ANNUITY_AMT_INCOME_TOTAL_ratio"]
+    assert materialize(changed, input_path, output_path, outputs, categorical=categorical)["cached"] is True
+    rebuilt = materialize(changed, input_path, str(tmp_path / "rebuilt.parquet"), outputs, categorical=categorical)
+    assert rebuilt["carried_over"] == []
+    pd.testing.assert_frame_equal(pd.read_parquet(output_path), pd.read_parquet(rebuilt["output_path"]))
+
+    # A changed filter input changes the rows of every column
+    raw_applications.loc[raw_applications["CODE_GENDER"] == "XNA", "CODE_GENDER"] = "F"
+    raw_applications.to_csv(input_path, index=False)
+    result = materialize(changed, input_path, output_path, outputs, categorical=categorical)
+    assert result["recomputed"] == outputs and result["rows"] == len(raw_applications)
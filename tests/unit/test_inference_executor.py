@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import pytest
+from src.inference.executor import InferenceExecutor, InferenceSaturatedError
+
+
+def test_runs_off_the_event_loop():
+    """The scoring function must not run on the event loop thread."""
+    async def run():
+        executor = InferenceExecutor(kind="thread", max_workers=2, max_queue=0)
+        executor.start()
+        loop_thread = threading.get_ident()
+        worker_thread = await executor.run(threading.get_ident)
+        executor.shutdown()
+        return loop_thread, worker_thread
+
+    loop_thread, worker_thread = asyncio.run(run())
+    assert loop_thread != worker_thread
+
+def test_reject_policy_when_saturated():
+    release = threading.Event()
+
+    async def run():
+        executor = InferenceExecutor(kind="thread", max_workers=1, max_queue=0, saturation_policy="reject")
+        executor.start()
+        busy = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(InferenceSaturatedError):
+            await executor.run(sum, [1, 2])
+        release.set()
+        await busy
+        # A slot is free again once the long call finished
+        assert await executor.run(sum, [1, 2]) == 3
+        executor.shutdown()
+
+    asyncio.run(run())
+
+def test_wait_policy_times_out():
+    release = threading.Event()
+
+    async def run():
+        executor = InferenceExecutor(kind="thread", max_workers=1, max_queue=0,
+                                     saturation_policy="wait", queue_timeout_s=0.05)
+        executor.start()
+        busy = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(InferenceSaturatedError):
+            await executor.run(sum, [1, 2])
+        release.set()
+        await busy
+        executor.shutdown()
+
+    asyncio.run(run())
+
+def test_process_pool():
+    async def run():
+        executor = InferenceExecutor(kind="process", max_workers=1, max_queue=4)
+        result = await executor.run(pow, 2, 10)
+        executor.shutdown()
+        return result
+
+    assert asyncio.run(run()) == 1024
+
+@pytest.mark.parametrize("kwargs", [{"kind": "fiber"}, {"saturation_policy": "drop"}, {"max_workers": 0}])
+def test_invalid_configuration(kwargs):
+    with pytest.raises(ValueError):
+        InferenceExecutor(**kwargs)
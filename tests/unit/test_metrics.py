@@ -0,0 +1,47 @@
+import random
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app import app
+from src.inference.metrics import STAGES
+from src.inference.request_validation import example_payload
+
+client = TestClient(app)
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+@pytest.fixture
+def uncached_payload():
+    # A fresh EXT_SOURCE_3 so the prediction cache cannot answer the request
+    return {**example_payload(), "EXT_SOURCE_3": random.random()}
+
+def test_predict_observes_every_stage(uncached_payload):
+    before = {stage: sample("prediction_stage_seconds_count", stage=stage) for stage in STAGES}
+    requests_before = sample("prediction_http_requests_total", endpoint="/predict", status="200")
+
+    assert client.post("/predict", json=uncached_payload).status_code == 200
+
+    for stage in STAGES:
+        assert sample("prediction_stage_seconds_count", stage=stage) > before[stage], stage
+    assert sample("prediction_http_requests_total", endpoint="/predict", status="200") == requests_before + 1
+
+def test_errors_and_batch_sizes(uncached_payload):
+    errors_before = sample("prediction_http_errors_total", endpoint="/predict", status="422")
+    failed_before = sample("prediction_batch_failed_rows_total")
+    batches_before = sample("prediction_batch_size_sum", source="batch_endpoint")
+
+    assert client.post("/predict", json={}).status_code == 422
+    assert client.post("/predict/batch", json=[uncached_payload, {}]).status_code == 200
+
+    assert sample("prediction_http_errors_total", endpoint="/predict", status="422") == errors_before + 1
+    assert sample("prediction_batch_failed_rows_total") == failed_before + 1
+    assert sample("prediction_batch_size_sum", source="batch_endpoint") == batches_before + 2
+
+def test_metrics_endpoint():
+    client.get("/cache/stats")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'prediction_http_requests_total{endpoint="/cache/stats",status="200"}' in response.text
+    assert "prediction_stage_seconds_bucket" in response.text
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+import pytest
+from src.inference.executor import InferenceSaturatedError
+from src.inference.micro_batcher import MicroBatcher
+
+
+def test_concurrent_requests_are_coalesced():
+    """Requests arriving inside the window are scored in one call and fanned back out in order."""
+    batch_sizes = []
+
+    def score_fn(items):
+        batch_sizes.append(len(items))
+        return [item * 10 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(score_fn, max_batch_size=64, max_wait_ms=50)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(20)))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert results == [i * 10 for i in range(20)]
+    assert sum(batch_sizes) == 20
+    assert len(batch_sizes) < 20
+
+def test_max_batch_size_is_respected():
+    batch_sizes = []
+
+    def score_fn(items):
+        batch_sizes.append(len(items))
+        return items
+
+    async def run():
+        batcher = MicroBatcher(score_fn, max_batch_size=4, max_wait_ms=50)
+        await batcher.start()
+        await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        await batcher.stop()
+
+    asyncio.run(run())
+    assert max(batch_sizes) <= 4
+    assert sum(batch_sizes) == 10
+
+def test_errors_are_propagated_to_every_caller():
+    def score_fn(items):
+        raise ValueError("model failure")
+
+    async def run():
+        batcher = MicroBatcher(score_fn, max_batch_size=8, max_wait_ms=10)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_batches_run_concurrently():
+    """Up to max_concurrency batches are scored at the same time."""
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def score_fn(items):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return items
+
+    async def run():
+        batcher = MicroBatcher(score_fn, max_batch_size=1, max_wait_ms=0, max_concurrency=3)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(9)))
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(run()) == list(range(9))
+    assert peak[0] == 3
+
+def test_full_queue_is_rejected():
+    release = threading.Event()
+
+    def score_fn(items):
+        release.wait()
+        return items
+
+    async def run():
+        batcher = MicroBatcher(score_fn, max_batch_size=1, max_wait_ms=0, max_queue=2)
+        await batcher.start()
+        first = asyncio.create_task(batcher.submit(0))
+        # The first row is being scored, the next two fill the queue
+        await asyncio.sleep(0.05)
+        waiting = [asyncio.create_task(batcher.submit(i)) for i in (1, 2)]
+        await asyncio.sleep(0)
+        with pytest.raises(InferenceSaturatedError):
+            await batcher.submit(3)
+        release.set()
+        results = await asyncio.gather(first, *waiting)
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(run()) == [0, 1, 2]
+
+@pytest.mark.parametrize("max_batch_size,max_wait_ms", [(0, 2), (8, -1)])
+def test_invalid_configuration(max_batch_size, max_wait_ms):
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda items: items, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import shutil
+import pytest
+from fastapi.testclient import TestClient
+import app as app_module
+from app import active_model, app
+from src.inference.model_registry import (ActiveModel, ModelRegistry, ModelVersionCorrupt, ModelVersionExists,
+                                         ModelVersionNotFound, ServingModel, warm_up)
+from src.inference.request_validation import example_payload
+
+client = TestClient(app)
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    registry.publish("v1", "models/registry/v1/xgboost_model.pkl", "models/registry/v1/explainer.pkl", threshold=0.5, activate=True)
+    registry.publish("v2", "models/registry/v1/xgboost_model.pkl", "models/registry/v1/explainer.pkl", threshold=0.4,
+                     compiled_model_path="models/registry/v1/xgboost_model_compiled")
+    return registry
+
+def fake_loader(registry, calls):
+    def load(version):
+        calls.append(version)
+        manifest = registry.manifest(version)
+        score = lambda requests, explain="full": [({}, 0.1, {}, {}) for _ in requests]
+        return ServingModel(version, manifest, None, None, "shap", score, score)
+    return load
+
+def test_publish_and_verify(registry):
+    assert registry.versions() == ["v1", "v2"]
+    assert registry.current_version() == "v1"
+    manifest = registry.verify("v2")
+    assert manifest["threshold"] == 0.4
+    assert manifest["features"][0] == "EXT_SOURCE_3"
+    assert "xgboost_model_compiled/metadata.json" in manifest["checksums"]
+    assert registry.artifact_path("v1", "compiled_model") is None
+    with pytest.raises(ModelVersionExists):
+        registry.publish("v1", "models/registry/v1/xgboost_model.pkl", "models/registry/v1/explainer.pkl", threshold=0.5)
+
+def test_verify_detects_tampering(registry):
+    with open(registry.artifact_path("v2", "explainer"), "ab") as file_obj:
+        file_obj.write(b"\0")
+    with pytest.raises(ModelVersionCorrupt, match="checksum"):
+        registry.verify("v2")
+    with pytest.raises(ModelVersionNotFound, match="not found"):
+        registry.verify("v3")
+
+def test_swap_keeps_in_flight_version(registry):
+    """A request holding the old version keeps it; new requests see the new one."""
+    calls = []
+    runs = []
+    async def run_fn(fn, *args):
+        runs.append(fn)
+        return fn(*args)
+
+    async def scenario():
+        active = ActiveModel(registry, fake_loader(registry, calls), run_fn=run_fn)
+        active.load()
+        in_flight = active.current
+        await active.reload("v2")
+        assert in_flight.version == "v1"
+        assert active.current.version == "v2"
+        # Warmed up through both scoring functions before the swap
+        assert len(runs) == 2
+        # Reloading the serving version is a no-op
+        await active.reload("v2")
+        assert calls == ["v1", "v2"]
+
+    asyncio.run(scenario())
+
+def test_failed_load_keeps_current(registry):
+    def loader(version):
+        raise ValueError("broken artifacts")
+
+    async def scenario():
+        active = ActiveModel(registry, fake_loader(registry, []))
+        active.load()
+        active.loader = loader
+        with pytest.raises(ValueError):
+            await active.reload("v2")
+        assert active.current.version == "v1"
+        assert "broken artifacts" in active.status()["last_error"]
+
+    asyncio.run(scenario())
+
+def test_watch_follows_current(registry):
+    async def scenario():
+        active = ActiveModel(registry, fake_loader(registry, []))
+        active.load()
+        watcher = asyncio.create_task(active.watch(0.01))
+        registry.set_current("v2")
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if active.current.version == "v2":
+                break
+        watcher.cancel()
+        assert active.current.version == "v2"
+
+    asyncio.run(scenario())
+
+def test_responses_carry_model_version():
+    version = client.get("/admin/model").json()["active"]["version"]
+    assert client.post("/predict", json=example_payload()).json()["model_version"] == version
+    batch = client.post("/predict/batch?explain=none", json=[example_payload()]).json()
+    assert batch["model_version"] == version
+    assert batch["predictions"][0]["model_version"] == version
+
+ADMIN_HEADERS = {"Authorization": "Bearer secret"}
+
+def test_admin_reload(monkeypatch):
+    assert client.post("/admin/model/reload").status_code == 403
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+    assert client.post("/admin/model/reload", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.post("/admin/model/reload", headers=ADMIN_HEADERS).status_code == 200
+    assert client.post("/admin/model/reload?version=missing", headers=ADMIN_HEADERS).status_code == 404
+
+def test_admin_reload_rejects_a_bad_version(tmp_path, monkeypatch):
+    """A version that does not load in the worker is never made CURRENT."""
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    serving_version = active_model.current.version
+    shutil.copytree(f"models/registry/{serving_version}", tmp_path / "registry" / serving_version)
+    shutil.copytree(f"models/registry/{serving_version}", tmp_path / "registry" / "broken")
+    manifest_path = tmp_path / "registry" / "broken" / "manifest.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest["features"] = manifest["features"][::-1]
+    manifest_path.write_text(json.dumps(manifest))
+    registry.set_current(serving_version)
+    monkeypatch.setattr(app_module, "model_registry", registry)
+    monkeypatch.setattr(active_model, "registry", registry)
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+
+    response = client.post("/admin/model/reload?version=broken", headers=ADMIN_HEADERS)
+    assert response.status_code == 409
+    assert registry.current_version() == serving_version
+    assert active_model.current.version == serving_version
+
+def test_startup_falls_back_to_last_good(registry):
+    calls = []
+    loader = fake_loader(registry, calls)
+    def load(version):
+        if version == "v2":
+            raise ValueError("broken artifacts")
+        return loader(version)
+
+    active = ActiveModel(registry, load)
+    active.load()
+    assert registry.last_good_version() == "v1"
+    registry.set_current("v2")
+    assert ActiveModel(registry, load).load().version == "v1"
+    assert calls == ["v1", "v1"]
+    # A pinned version has no fallback
+    with pytest.raises(ValueError):
+        ActiveModel(registry, load).load("v2")
+
+def test_warm_up_covers_explain_modes():
+    calls = []
+    async def run_fn(fn, requests, explain):
+        calls.append((fn, len(requests), explain))
+        return fn(requests, explain)
+
+    serving = active_model.current
+    asyncio.run(warm_up(serving, run_fn, n_requests=3, iterations=2, explain_modes=["none", "full"]))
+    # Per iteration and mode: 3 single requests, then one batch of 3
+    assert len(calls) == 2 * 2 * 4
+    assert [call[1] for call in calls[:4]] == [1, 1, 1, 3]
+    assert {call[2] for call in calls} == {"none", "full"}
+
+def test_readiness_follows_warm_up():
+    assert client.get("/healthz").json() == {"status": "alive"}
+    with TestClient(app) as started_client:
+        response = started_client.get("/readyz")
+        assert response.status_code == 200
+        assert response.json()["warm_up_seconds"] > 0
+        assert 'prediction_warm_up_seconds_count{trigger="startup"}' in started_client.get("/metrics").text
+    # Not ready once the lifespan has shut down
+    assert client.get("/readyz").status_code == 503
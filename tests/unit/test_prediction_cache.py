@@ -0,0 +1,55 @@
+import threading
+import time
+import pytest
+from src.inference.cache import PredictionCache
+
+
+@pytest.fixture
+def features():
+    return {"EXT_SOURCE_3": 0.617, "AMT_CREDIT": 100000.0, "ORGANIZATION_TYPE": "Bank"}
+
+def test_hit_and_miss_counters(features):
+    cache = PredictionCache()
+    key = cache.key(features, "v1")
+    assert cache.get(key) is None
+    cache.set(key, ("scored",))
+    assert cache.get(key) == ("scored",)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_key_is_canonical(features):
+    """Field order does not matter, explain mode and model version do."""
+    cache = PredictionCache()
+    reordered = dict(reversed(list(features.items())))
+    assert cache.key(features, "v1") == cache.key(reordered, "v1")
+    assert cache.key(features, "v1", "full") != cache.key(features, "v1", "none")
+    assert cache.key(features, "v1") != cache.key(features, "v2")
+
+def test_lru_eviction_and_ttl():
+    cache = PredictionCache(max_entries=2, ttl_s=0.05)
+    for i in range(3):
+        cache.set(str(i), i)
+    assert cache.get("0") is None
+    assert cache.get("2") == 2
+    time.sleep(0.06)
+    assert cache.get("2") is None
+
+def test_disk_cache_is_shared(features, tmp_path):
+    disk_path = str(tmp_path / "cache")
+    writer = PredictionCache(disk_path=disk_path)
+    reader = PredictionCache(disk_path=disk_path)
+    writer.set(writer.key(features, "v1"), ("scored",))
+    assert reader.get(reader.key(features, "v1")) == ("scored",)
+
+def test_disk_counters_from_threads(tmp_path):
+    """Hits and misses served from disk are all counted when threads look up together."""
+    disk_path = str(tmp_path / "cache")
+    PredictionCache(disk_path=disk_path).set("hit", ("scored",))
+
+    cache = PredictionCache(max_entries=0, disk_path=disk_path)
+    threads = [threading.Thread(target=lambda: [cache.get(key) for key in ("hit", "miss") * 50]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (400, 400)
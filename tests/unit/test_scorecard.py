@@ -0,0 +1,60 @@
+import json
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from src.inference.request_validation import example_payload
+from src.inference.scorecard import Scorecard, scorecard
+from src.inference.streaming import NDJSON_MEDIA_TYPE
+from src.utils.other_utils import three_digit_score
+
+client = TestClient(app)
+
+def test_scores_and_bands():
+    card = Scorecard(alpha=600, beta=50, band_edges=[550, 650], band_labels=["high", "medium", "low"])
+    probs = np.array([0.9, 0.5, 0.1])
+    scores, bands = card.apply(probs)
+    assert scores == three_digit_score(probs, 600, 50).tolist() == [490, 600, 710]
+    assert bands == ["high", "medium", "low"]
+    # Edges belong to the band above them
+    assert card.risk_bands(np.array([549, 550, 650])).tolist() == ["high", "medium", "low"]
+    # Probabilities of exactly 0 or 1 still get a finite score
+    assert np.isfinite(card.scores([0.0, 1.0])).all()
+
+def test_invalid_bands():
+    with pytest.raises(ValueError):
+        Scorecard(600, 50, band_edges=[550, 650], band_labels=["high", "low"])
+    with pytest.raises(ValueError):
+        Scorecard(600, 50, band_edges=[650, 550], band_labels=["high", "medium", "low"])
+
+def test_reason_texts():
+    texts = scorecard.reason_texts({"EXT_SOURCE_3": 0.4, "Client_Age": -0.2, "unknown_feature": 0.1})
+    assert texts == ["External credit score 3 increases the risk", "Age lowers the risk",
+                     "unknown_feature increases the risk"]
+
+def test_reasons_are_most_influential_first():
+    """Reason codes and texts come by decreasing absolute SHAP value, for declined and approved applicants."""
+    for payload in (example_payload(), {**example_payload(), "EXT_SOURCE_3": 0.01, "EXT_SOURCE_2": 0.01}):
+        response = client.post("/predict?explain=top3", json=payload).json()
+        reasons = response["top_3_reason_codes"]
+        assert [abs(value) for value in reasons.values()] == sorted((abs(value) for value in reasons.values()), reverse=True)
+        assert response["reason_texts"] == scorecard.reason_texts(reasons)
+
+def test_endpoints_return_score_and_band():
+    single = client.post("/predict?explain=top3", json=example_payload()).json()
+    expected_scores, expected_bands = scorecard.apply([single["prediction_prob"]])
+    assert single["three_digit_score"] == expected_scores[0]
+    assert single["risk_band"] == expected_bands[0]
+    assert len(single["reason_texts"]) == 3
+
+    rows = [example_payload(), {**example_payload(), "EXT_SOURCE_3": 0.05}, {"Client_Age": 10}]
+    batch = client.post("/predict/batch?explain=none&format=compact", json=rows).json()["predictions"]
+    assert [row["three_digit_score"] for row in batch[:2]] == scorecard.apply([row["prediction_prob"] for row in batch[:2]])[0]
+    assert batch[2]["three_digit_score"] is None and batch[2]["risk_band"] is None
+    assert batch[0]["reason_texts"] == []
+
+    body = "".join(json.dumps(row) + "\n" for row in rows).encode()
+    streamed = [json.loads(line) for line in client.post("/predict/stream", content=body,
+                                                         headers={"content-type": NDJSON_MEDIA_TYPE}).text.splitlines()]
+    assert [row["three_digit_score"] for row in streamed] == [row["three_digit_score"] for row in batch]
+    assert [row["risk_band"] for row in streamed] == [row["risk_band"] for row in batch]
@@ -0,0 +1,64 @@
+import io
+import json
+import pyarrow as pa
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from src.inference.request_validation import example_payload
+from src.inference.streaming import ARROW_STREAM_MEDIA_TYPE, NDJSON_MEDIA_TYPE
+
+client = TestClient(app)
+
+@pytest.fixture
+def rows():
+    payload = example_payload()
+    return [payload, {**payload, "EXT_SOURCE_3": None}, {**payload, "Client_Age": 120, "extra": 1}]
+
+def test_compact_batch_matches_keyed(rows):
+    """Compact rows hold the keyed values in header order; missing model features are null."""
+    keyed = client.post("/predict/batch?explain=full", json=rows).json()
+    compact = client.post("/predict/batch?explain=full&format=compact", json=rows).json()
+    raw_names, model_names = compact["raw_feature_names"], compact["model_feature_names"]
+    assert raw_names == list(example_payload())
+    for keyed_row, compact_row in zip(keyed["predictions"], compact["predictions"]):
+        assert compact_row["prediction_prob"] == keyed_row["prediction_prob"]
+        assert compact_row["top_3_reason_codes"] == keyed_row["top_3_reason_codes"]
+        assert compact_row["failure_reason"] == keyed_row["failure_reason"]
+        assert compact_row["shap_values"] == [keyed_row["shap_values"][name] for name in model_names if keyed_row["shap_values"]]
+        assert compact_row["model_features"] == [keyed_row["model_features"][name] for name in model_names if keyed_row["model_features"]]
+    assert compact["predictions"][1]["model_features"][model_names.index("EXT_SOURCE_3")] is None
+    # Failed rows keep their raw values, aligned to the header
+    assert compact["predictions"][2]["raw_feature_values"] == [rows[2][name] for name in raw_names]
+
+def test_compact_single_prediction(rows):
+    response = client.post("/predict?explain=top3&format=compact", json=rows[0])
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "Success"
+    assert body["shap_values"] == [] and len(body["top_3_reason_codes"]) == 3
+    assert body["model_feature_names"] and body["raw_feature_names"]
+
+def test_invalid_format(rows):
+    assert client.post("/predict?format=xml", json=rows[0]).status_code == 422
+
+def test_compact_ndjson_stream(rows):
+    body = "".join(json.dumps(row) + "\n" for row in rows).encode()
+    response = client.post("/predict/stream?explain=full&format=compact", content=body,
+                           headers={"content-type": NDJSON_MEDIA_TYPE})
+    header, *results = [json.loads(line) for line in response.text.splitlines()]
+    model_names = header["model_feature_names"]
+    assert len(results) == 3
+    assert len(results[0]["shap_values"]) == len(model_names)
+    assert results[2]["shap_values"] == []
+
+def test_compact_arrow_stream(rows):
+    sink = io.BytesIO()
+    table = pa.Table.from_pylist(rows[:2])
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    response = client.post("/predict/stream?explain=full&format=compact", content=sink.getvalue(),
+                           headers={"content-type": ARROW_STREAM_MEDIA_TYPE})
+    result = pa.ipc.open_stream(response.content).read_all()
+    model_names = json.loads(result.schema.metadata[b"model_feature_names"])
+    assert result.schema.field("shap_values").type == pa.list_(pa.float64())
+    assert [len(values) for values in result.column("shap_values").to_pylist()] == [len(model_names)] * 2
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+import app as app_module
+from app import app, active_model
+from src.inference.model_registry import ServingModel
+from src.inference.request_validation import PredictionRequest, example_payload, synthetic_payloads
+from src.inference.shadow import (COMPARISON_FILE, ShadowLog, ShadowScorer, compare_periodically, compare_scores,
+                                  read_shadow_log, shadow_log_files, try_compare_lock)
+
+client = TestClient(app)
+
+def fake_serving(version, score_fn, threshold=0.5):
+    manifest = {"features": [], "threshold": threshold, "artifacts": {"model": "model.pkl"}, "checksums": {"model.pkl": version}}
+    return ServingModel(version, manifest, None, None, "shap", score_fn, score_fn)
+
+def constant_score(prob):
+    return lambda requests, explain="full": [({}, prob, {}, {}) for _ in requests]
+
+def test_log_rotation(tmp_path):
+    log = ShadowLog(str(tmp_path), rotate_rows=3, rotate_seconds=3600, max_files=2)
+    row = {"timestamp": ["t"], "request_id": ["r"], "champion_version": ["v1"], "challenger_version": ["v2"],
+           "champion_prob": [0.1], "challenger_prob": [0.2], "champion_threshold": [0.5], "challenger_threshold": [0.5]}
+    for _ in range(10):
+        log.append(row)
+    # 3 files rotated at 3 rows each, the oldest one removed; one row still buffered
+    assert len(shadow_log_files(str(tmp_path))) == 2
+    log.flush()
+    assert len(read_shadow_log(str(tmp_path))) == 4
+
+def test_idle_log_is_flushed_on_time(tmp_path):
+    """Rows are written once rotate_seconds old even if nothing else is appended."""
+    champion = fake_serving("v1", constant_score(0.2))
+    scorer = ShadowScorer(fake_serving("v2", constant_score(0.3)), ShadowLog(str(tmp_path), rotate_seconds=0.2))
+    scorer.start()
+    try:
+        assert scorer.submit(champion, ["request"], ["r0"], [0.2])
+        deadline = time.monotonic() + 5
+        while not shadow_log_files(str(tmp_path)) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert len(read_shadow_log(str(tmp_path))) == 1
+    finally:
+        scorer.shutdown()
+
+def test_one_process_compares(tmp_path):
+    """Only the holder of the compare lock writes the comparison; another one takes over after it."""
+    log_dir = str(tmp_path)
+    holder = try_compare_lock(log_dir)
+    assert holder is not None and try_compare_lock(log_dir) is None
+
+    async def run_comparer(seconds):
+        task = asyncio.create_task(compare_periodically(log_dir, interval_s=0.05))
+        await asyncio.sleep(seconds)
+        task.cancel()
+
+    asyncio.run(run_comparer(0.3))
+    assert not os.path.exists(os.path.join(log_dir, COMPARISON_FILE))
+    os.close(holder)
+    asyncio.run(run_comparer(0.3))
+    assert os.path.exists(os.path.join(log_dir, COMPARISON_FILE))
+    # The comparer released the lock when cancelled
+    fd = try_compare_lock(log_dir)
+    assert fd is not None
+    os.close(fd)
+
+def test_scorer_logs_pairs(tmp_path):
+    champion = fake_serving("v1", constant_score(0.2))
+    scorer = ShadowScorer(fake_serving("v2", constant_score(0.3)), ShadowLog(str(tmp_path)))
+    assert not scorer.submit(champion, ["request"], ["r0"], [0.2])
+    scorer.start()
+    assert scorer.submit(champion, ["a", "b"], ["r1", "r2"], [0.2, 0.2])
+    scorer.shutdown()
+    log = read_shadow_log(str(tmp_path))
+    assert log["request_id"].tolist() == ["r1", "r2"]
+    assert log["challenger_prob"].tolist() == [0.3, 0.3]
+    assert set(log["champion_version"]) == {"v1"} and set(log["challenger_version"]) == {"v2"}
+
+def test_scorer_drops_when_behind(tmp_path):
+    """A slow challenger never queues more than max_pending calls."""
+    release = threading.Event()
+    def slow_score(requests, explain="full"):
+        release.wait(5)
+        return constant_score(0.3)(requests)
+
+    champion = fake_serving("v1", constant_score(0.2))
+    scorer = ShadowScorer(fake_serving("v2", slow_score), ShadowLog(str(tmp_path)), max_pending=2)
+    scorer.start()
+    accepted = [scorer.submit(champion, ["a"], [f"r{i}"], [0.2]) for i in range(5)]
+    release.set()
+    scorer.shutdown()
+    assert accepted == [True, True, False, False, False]
+    assert len(read_shadow_log(str(tmp_path))) == 2
+
+def test_challenger_reuses_champion_features(tmp_path):
+    """With the champion's feature list the challenger scores its model inputs and preprocesses only otherwise."""
+    champion = active_model.current
+    def preprocess_again(requests, explain="full"):
+        raise AssertionError("the challenger preprocessed the requests again")
+
+    requests = [PredictionRequest(**payload) for payload in synthetic_payloads(5)]
+    scored = champion.batch_score_fn(requests, "none")
+    same_features = ServingModel("v2", champion.manifest, champion.model, champion.explainer, "shap",
+                                 preprocess_again, preprocess_again)
+    other_features = fake_serving("v3", constant_score(0.3))
+    for challenger in (same_features, other_features):
+        scorer = ShadowScorer(challenger, ShadowLog(str(tmp_path / challenger.version)))
+        scorer.start()
+        assert scorer.submit(champion, requests, [f"r{i}" for i in range(5)], [row[1] for row in scored],
+                             [row[0] for row in scored])
+        scorer.shutdown()
+
+    np.testing.assert_allclose(read_shadow_log(str(tmp_path / "v2"))["challenger_prob"], [row[1] for row in scored])
+    assert read_shadow_log(str(tmp_path / "v3"))["challenger_prob"].tolist() == [0.3] * 5
+
+def test_compare_scores():
+    rng = np.random.default_rng(0)
+    champion = rng.uniform(0.01, 0.99, 2000)
+    log = pd.DataFrame({"timestamp": "t", "request_id": [str(i) for i in range(2000)],
+                        "champion_version": "v1", "challenger_version": "v2",
+                        "champion_prob": champion, "challenger_prob": champion,
+                        "champion_threshold": 0.5, "challenger_threshold": 0.5})
+    report = compare_scores(log)
+    assert report["n_pairs"] == 2000
+    assert report["mean_abs_difference"] == 0 and report["psi"] == pytest.approx(0)
+    assert report["ks_distance"] == 0 and report["decision_agreement"] == 1
+
+    shifted = log.assign(challenger_prob=np.clip(champion + 0.2, 0, 1))
+    labels = pd.DataFrame({"request_id": log["request_id"], "TARGET": (rng.uniform(size=2000) < champion).astype(int)})
+    report = compare_scores(shifted, labels)
+    assert report["psi"] > 0.1 and report["ks_distance"] > 10 and report["decision_agreement"] < 1
+    assert report["n_labelled"] == 2000
+    assert set(report["performance"]["champion"]) == {"KS", "ROC_AUC", "GINI"}
+    assert report["performance"]["challenger"]["ROC_AUC"] > 50
+
+def test_endpoints_mirror_to_challenger(tmp_path, monkeypatch):
+    """The challenger sees the requests of /predict and /predict/batch; responses are the champion's."""
+    champion = active_model.current
+    scorer = ShadowScorer(fake_serving("challenger", champion.batch_score_fn, threshold=champion.threshold),
+                          ShadowLog(str(tmp_path)))
+    monkeypatch.setattr(app_module, "shadow_scorer", scorer)
+    scorer.start()
+    single = client.post("/predict?explain=none", json=example_payload()).json()
+    batch = client.post("/predict/batch?explain=none", json=[example_payload(), {"Client_Age": 10}]).json()
+    scorer.shutdown()
+
+    assert single["model_version"] == champion.version
+    log = read_shadow_log(str(tmp_path)).set_index("request_id")
+    assert sorted(log.index) == sorted([single["request_id"], batch["predictions"][0]["request_id"]])
+    assert log.loc[single["request_id"], "champion_prob"] == single["prediction_prob"]
+    # Same model behind both names
+    np.testing.assert_allclose(log["challenger_prob"], log["champion_prob"])
@@ -0,0 +1,101 @@
+import asyncio
+import io
+import json
+import pyarrow as pa
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
+from app import active_model, app
+from src.inference.request_validation import example_payload
+from src.inference.streaming import (ARROW_STREAM_MEDIA_TYPE, NDJSON_MEDIA_TYPE, BodyStream, ndjson_chunks, pump_body,
+                                     score_columns, score_rows)
+
+client = TestClient(app)
+
+@pytest.fixture
+def rows():
+    payload = example_payload()
+    return [payload, {**payload, "ORGANIZATION_TYPE": "Bank", "EXT_SOURCE_3": None}, {**payload, "Client_Age": 120}]
+
+def ndjson_body(rows, extra_lines=()):
+    # Sent as a generator so the client uses a chunked body
+    def chunks():
+        for row in rows:
+            yield (json.dumps(row) + "\n").encode()
+        for line in extra_lines:
+            yield line
+    return chunks()
+
+def test_ndjson_stream_matches_batch(rows):
+    response = client.post("/predict/stream", content=ndjson_body(rows, [b"\n", b"not json\n"]),
+                           headers={"content-type": NDJSON_MEDIA_TYPE})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(NDJSON_MEDIA_TYPE)
+    results = [json.loads(line) for line in response.text.splitlines()]
+
+    batch = client.post("/predict/batch?explain=top3", json=rows).json()["predictions"]
+    assert [result["row"] for result in results] == [0, 1, 2, 3]
+    for result, expected in zip(results[:2], batch[:2]):
+        assert result["status"] == "Success"
+        assert result["prediction_prob"] == pytest.approx(expected["prediction_prob"])
+        assert result["top_3_reason_codes"] == pytest.approx(expected["top_3_reason_codes"])
+    assert results[2]["status"] == "Failed" and "Client_Age" in results[2]["failure_reason"]
+    assert results[3]["failure_reason"] == {"request": "Row is not a JSON object"}
+
+def test_arrow_stream(rows):
+    sink = io.BytesIO()
+    table = pa.Table.from_pylist(rows)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=1):
+            writer.write_batch(batch)
+
+    response = client.post("/predict/stream?explain=none", content=sink.getvalue(),
+                           headers={"content-type": ARROW_STREAM_MEDIA_TYPE})
+    assert response.status_code == 200
+    results = pa.ipc.open_stream(response.content).read_all().to_pylist()
+    assert [result["status"] for result in results] == ["Success", "Success", "Failed"]
+    assert results[0]["top_3_reason_codes"] == []
+    assert results[2]["prediction_prob"] is None
+
+def test_arrow_columns_validated_like_rows(rows):
+    """Record batches validated column-wise give the results of the same rows as dicts."""
+    rows = rows + [{**example_payload(), "AMT_CREDIT": None, "employment_years": 2.5},
+                   {**example_payload(), "NAME_EDUCATION_TYPE": "Unknown", "EXT_SOURCE_1": 1.5}]
+    score_fn = active_model.current.batch_score_fn
+    expected = score_rows(score_fn, rows, "top3", 10)
+    assert score_columns(score_fn, pa.RecordBatch.from_pylist(rows), "top3", 10) == expected
+    assert [result["status"] for result in expected] == ["Success", "Success", "Failed", "Failed", "Failed"]
+
+    without_column = [{name: value for name, value in row.items() if name != "Client_Age"} for row in rows]
+    results = score_columns(score_fn, pa.RecordBatch.from_pylist(without_column), "none", 0)
+    assert [result["failure_reason"]["Client_Age"] for result in results] == ["Field required"] * len(rows)
+
+def test_stream_rejects_other_content_types(rows):
+    assert client.post("/predict/stream", json=rows).status_code == 415
+    assert client.post("/predict/stream", content=b"garbage",
+                       headers={"content-type": ARROW_STREAM_MEDIA_TYPE}).status_code == 400
+
+def test_stream_without_model(rows, monkeypatch):
+    monkeypatch.setattr(active_model, "current", None)
+    response = client.post("/predict/stream", content=ndjson_body(rows), headers={"content-type": NDJSON_MEDIA_TYPE})
+    assert response.status_code == 500
+
+def test_upload_error_fails_the_body():
+    """A body cut off by a disconnect is an error for the reader, not the end of the input."""
+    async def upload():
+        yield b'{"a": 1}\n'
+        raise ClientDisconnect()
+
+    body = BodyStream()
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(pump_body(upload(), body))
+    with pytest.raises(OSError, match="upload failed"):
+        list(ndjson_chunks(body, chunk_size=4))
+
+def test_ndjson_chunks_are_bounded():
+    body = BodyStream(max_chunks=8)
+    for index in range(3):
+        body.feed(b'{"a": %d}\n{"a"' % index)
+        body.feed(b': 0}\n')
+    body.feed(None)
+    assert [len(chunk) for chunk in ndjson_chunks(body, chunk_size=4)] == [4, 2]
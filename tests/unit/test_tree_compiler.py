@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from src.utils.other_utils import load_object
+from src.inference.preprocessing import inference_config
+from src.inference.fast_path import FeaturePlan, FastPathScorer, parity_requests
+from src.inference.tree_compiler import PARALLEL_MIN_ROWS, CompiledModel, frame_to_matrix, load_validation_frame, validate_compiled
+
+
+@pytest.fixture(scope="module")
+def model():
+    return load_object("models/registry/v1/xgboost_model.pkl")
+
+@pytest.fixture(scope="module")
+def compiled(model):
+    return CompiledModel.from_model(model)
+
+def test_compiled_matches_predict_proba(model, compiled):
+    """The compiled trees must reproduce predict_proba, including categories and missing values."""
+    input_data = load_validation_frame()
+    assert validate_compiled(compiled, model, input_data, tolerance=1e-6) <= 1e-6
+
+def test_save_and_mmap_load(model, compiled, tmp_path):
+    input_data = load_validation_frame()
+    compiled.save(str(tmp_path))
+    loaded = CompiledModel.load(str(tmp_path), mmap=True)
+    assert isinstance(loaded.arrays["left_children"], np.memmap)
+    assert loaded.feature_names == compiled.feature_names
+    rows = frame_to_matrix(input_data)
+    np.testing.assert_array_equal(loaded.predict_proba(rows), compiled.predict_proba(rows))
+
+def test_fast_path_with_compiled_model(model, compiled):
+    """FeaturePlan rows scored by the compiled model pass the fast path parity check."""
+    explainer = load_object("models/registry/v1/explainer.pkl")
+    scorer = FastPathScorer(FeaturePlan.from_config(inference_config), model, explainer, compiled)
+    assert scorer.check_parity(model, parity_requests(n_random=50)) <= 1e-6
+
+def test_parallel_kernel_matches_serial(compiled):
+    """Inputs of at least PARALLEL_MIN_ROWS rows go through the parallel kernel with identical results."""
+    rows = frame_to_matrix(load_validation_frame())
+    assert len(rows) >= PARALLEL_MIN_ROWS
+    np.testing.assert_allclose(compiled.predict_proba(rows),
+                               np.concatenate([compiled.predict_proba(rows[i:i + 100]) for i in range(0, len(rows), 100)]),
+                               rtol=0, atol=1e-12)
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+from fastapi.testclient import TestClient
+from app import app
+from src.inference.worker_memory import gunicorn_memory, process_memory
+
+client = TestClient(app)
+
+def test_process_memory():
+    memory = process_memory()
+    assert memory["pid"] == os.getpid()
+    assert memory["rss_mb"] > 0
+
+def test_gunicorn_memory_counts_children():
+    """Child processes of the given master are reported as workers and summed in the totals."""
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        memory = gunicorn_memory(os.getpid())
+        assert child.pid in [worker["pid"] for worker in memory["workers"]]
+        assert memory["total_rss_mb"] >= memory["master"]["rss_mb"]
+    finally:
+        child.kill()
+        child.wait()
+
+def test_worker_memory_endpoint():
+    response = client.get("/worker/memory")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["preloaded"] is False
+    assert body["pid"] == os.getpid()